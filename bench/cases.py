@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Benchmark cases and benchmarks for UFL.
+
+A ``BenchmarkCase`` is a named collection of forms, either loaded from
+a demo ``.ufl`` file or built by a synthetic form generator. The
+functions in ``benchmarks`` take a case and return a callable to be
+timed, or ``None`` if the benchmark does not apply to the case.
+"""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from glob import glob
+from collections import OrderedDict
+
+from ufl import (FiniteElement, VectorElement, MixedElement, Coefficient,
+                 TestFunction, TrialFunction, TestFunctions, TrialFunctions,
+                 triangle, tetrahedron, dx, ds, grad, inner, sin, exp,
+                 derivative, CellVolume, FacetArea)
+from ufl.form import Form
+from ufl.algorithms import (load_ufl_file, compute_form_data,
+                            expand_derivatives, expand_indices)
+from ufl.algorithms.apply_algebra_lowering import apply_algebra_lowering
+from ufl.algorithms.apply_derivatives import apply_derivatives
+from ufl.algorithms.estimate_degrees import estimate_total_polynomial_degree
+
+
+demodir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "demo"))
+
+
+# Options of compute_form_data as passed by the form compilers, with
+# the persistent cache disabled to always time the computation
+FFC_OPTIONS = dict(disk_cache=False)
+TSFC_OPTIONS = dict(do_apply_function_pullbacks=True,
+                    do_apply_integral_scaling=True,
+                    do_apply_geometry_lowering=True,
+                    preserve_geometry_types=(CellVolume, FacetArea),
+                    do_apply_restrictions=True,
+                    do_estimate_degrees=True,
+                    disk_cache=False)
+
+
+class BenchmarkCase(object):
+    """A named collection of forms to run benchmarks on.
+
+    Either *filename* of a ``.ufl`` file to load the forms from, or a
+    function *build* returning a list of forms must be given.
+    """
+
+    def __init__(self, name, filename=None, build=None):
+        self.name = name
+        self.filename = filename
+        self._build = build
+        self._forms = None
+
+    def forms(self):
+        "Return the list of forms of this case, created on first call."
+        if self._forms is None:
+            if self.filename is not None:
+                self._forms = load_ufl_file(self.filename).forms
+            else:
+                self._forms = self._build()
+        return self._forms
+
+
+# --- Synthetic forms
+
+
+def long_sum_forms(n):
+    "Mass matrix weighted by a sum of *n* coefficients, as a chain of binary sums."
+    V = FiniteElement("CG", triangle, 1)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    fs = [Coefficient(V) for i in range(n)]
+    return [sum(f*u*v for f in fs)*dx]
+
+
+def form_sum_forms(n):
+    "Sum of *n* single integral forms, as built in loops over materials."
+    V = FiniteElement("CG", triangle, 1)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    fs = [Coefficient(V) for i in range(n)]
+    return [sum(f*u*v*dx for f in fs)]
+
+
+def deep_nesting_forms(depth):
+    "Nonlinear residual with an integrand nested *depth* operators deep."
+    V = FiniteElement("CG", triangle, 2)
+    u = Coefficient(V)
+    f = Coefficient(V)
+    v = TestFunction(V)
+    e = u
+    for i in range(depth):
+        e = sin(e)*f + exp(-u)
+    F = e*v*dx + inner(grad(e), grad(v))*dx
+    return [F, derivative(F, u)]
+
+
+def wide_mixed_forms(n):
+    "Laplacian on a mixed element with *n* alternating vector and scalar subelements."
+    P2 = VectorElement("CG", tetrahedron, 2)
+    P1 = FiniteElement("CG", tetrahedron, 1)
+    W = MixedElement([P2 if i % 2 == 0 else P1 for i in range(n)])
+    us = TrialFunctions(W)
+    vs = TestFunctions(W)
+    a = sum(inner(grad(u), grad(v)) for u, v in zip(us, vs))*dx
+    a += sum(inner(u, v) for u, v in zip(us, vs))*ds
+    return [a]
+
+
+SYNTHETIC_CASES = [
+    ("long_sum", long_sum_forms, (10, 100), (1000,)),
+    ("form_sum", form_sum_forms, (10, 100), (2000,)),
+    ("deep_nesting", deep_nesting_forms, (5, 20), (80,)),
+    ("wide_mixed", wide_mixed_forms, (4, 12), (32,)),
+]
+
+
+def demo_filenames():
+    "Return the sorted filenames of the demo forms."
+    return sorted(set(glob(os.path.join(demodir, "*.ufl"))) -
+                  set(glob(os.path.join(demodir, "_*.ufl"))))
+
+
+def build_cases(large=False):
+    """Return list of all benchmark cases: each demo file and the
+    synthetic forms for a range of sizes, including the expensive
+    sizes if *large* is true."""
+    cases = []
+    for filename in demo_filenames():
+        name = os.path.splitext(os.path.basename(filename))[0]
+        cases.append(BenchmarkCase("demo/" + name, filename=filename))
+    for name, build, sizes, large_sizes in SYNTHETIC_CASES:
+        if large:
+            sizes = sizes + large_sizes
+        for size in sizes:
+            cases.append(BenchmarkCase("%s/%d" % (name, size),
+                                       build=lambda build=build, size=size: build(size)))
+    return cases
+
+
+# --- Benchmarks
+
+
+def bench_load_ufl_file(case):
+    if case.filename is None:
+        return None
+    return lambda: load_ufl_file(case.filename)
+
+
+def bench_compute_form_data_ffc(case):
+    forms = case.forms()
+    return lambda: [compute_form_data(form, **FFC_OPTIONS) for form in forms]
+
+
+def bench_compute_form_data_tsfc(case):
+    forms = case.forms()
+    return lambda: [compute_form_data(form, **TSFC_OPTIONS) for form in forms]
+
+
+def bench_signature(case):
+    forms = case.forms()
+    # Form caches its signature, so time a fresh Form object
+    return lambda: [Form(form.integrals()).signature() for form in forms]
+
+
+def bench_derivative(case):
+    forms = [form for form in case.forms() if form.coefficients()]
+    if not forms:
+        return None
+    return lambda: [expand_derivatives(derivative(form, form.coefficients()[0]))
+                    for form in forms]
+
+
+def bench_expand_indices(case):
+    integrands = [itg.integrand()
+                  for form in case.forms()
+                  for itg_data in compute_form_data(form, **FFC_OPTIONS).integral_data
+                  for itg in itg_data.integrals]
+    return lambda: [expand_indices(e) for e in integrands]
+
+
+def bench_estimate_degrees(case):
+    # Degrees are estimated after lowering and differentiation, as in
+    # compute_form_data
+    integrands = [itg.integrand() for form in case.forms()
+                  for itg in apply_derivatives(apply_algebra_lowering(form)).integrals()]
+    return lambda: [estimate_total_polynomial_degree(e) for e in integrands]
+
+
+benchmarks = OrderedDict([
+    ("load_ufl_file", bench_load_ufl_file),
+    ("compute_form_data_ffc", bench_compute_form_data_ffc),
+    ("compute_form_data_tsfc", bench_compute_form_data_tsfc),
+    ("signature", bench_signature),
+    ("derivative", bench_derivative),
+    ("expand_indices", bench_expand_indices),
+    ("estimate_degrees", bench_estimate_degrees),
+])
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Run the UFL benchmarks, write the timings as JSON and compare them
+with the timings of a previous run.
+
+Examples:
+
+  python bench/runner.py -o before.json
+  python bench/runner.py -o after.json --compare before.json
+  python bench/runner.py -k demo/HyperElasticity -k compute_form_data
+"""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+from timeit import default_timer
+
+import ufl
+
+from cases import build_cases, benchmarks
+
+
+def time_function(function, repeat, min_time=0.0):
+    """Call *function* at least *repeat* times and until *min_time*
+    seconds have passed, and return dict of timing statistics.
+
+    The function is called once before timing to exclude one time
+    costs like imports, and the garbage collector is disabled while
+    timing, as in ``timeit``.
+    """
+    function()
+    times = []
+    total = 0.0
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(times) < repeat or total < min_time:
+            t0 = default_timer()
+            function()
+            t = default_timer() - t0
+            times.append(t)
+            total += t
+    finally:
+        if gc_enabled:
+            gc.enable()
+    times.sort()
+    n = len(times)
+    median = times[n // 2] if n % 2 else 0.5*(times[n // 2 - 1] + times[n // 2])
+    return {"min": times[0], "median": median, "max": times[-1],
+            "mean": total / n, "repeat": n}
+
+
+def run_benchmarks(cases, names, repeat=5, min_time=0.0, keywords=(), log=None):
+    """Run the benchmarks *names* on *cases* and return dict mapping
+    ``"case:benchmark"`` keys to timing statistics.
+
+    Only benchmarks with keys containing all *keywords* are run. A
+    benchmark raising an exception is recorded with an ``"error"``
+    entry instead of timings.
+    """
+    results = {}
+    for case in cases:
+        for name in names:
+            key = "%s:%s" % (case.name, name)
+            if not all(k in key for k in keywords):
+                continue
+            try:
+                function = benchmarks[name](case)
+                if function is None:
+                    continue
+                result = time_function(function, repeat, min_time)
+            except Exception as e:
+                result = {"error": "%s: %s" % (type(e).__name__, e)}
+            results[key] = result
+            if log is not None:
+                log(format_result(key, result))
+    return results
+
+
+def format_result(key, result):
+    if "error" in result:
+        return "%-60s  error (%s)" % (key, result["error"].splitlines()[0][:60])
+    return "%-60s  %10.3f ms  (median %.3f ms, %d runs)" % (
+        key, 1e3*result["min"], 1e3*result["median"], result["repeat"])
+
+
+def metadata():
+    "Return dict describing the environment the benchmarks are run in."
+    return {"ufl_version": ufl.__version__,
+            "python_version": platform.python_version(),
+            "python_implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def compare_results(old, new, threshold=0.1):
+    """Compare the minimal times of the benchmarks present in both
+    *old* and *new* result dicts.
+
+    Returns a list of ``(key, old_time, new_time, ratio, status)``
+    tuples sorted by key, where *status* is ``"slower"`` or
+    ``"faster"`` if the times differ by more than the relative
+    *threshold*, and ``""`` otherwise.
+    """
+    rows = []
+    for key in sorted(set(old) & set(new)):
+        if "error" in old[key] or "error" in new[key]:
+            continue
+        t0 = old[key]["min"]
+        t1 = new[key]["min"]
+        ratio = t1 / t0 if t0 > 0 else float("inf")
+        if ratio > 1.0 + threshold:
+            status = "slower"
+        elif ratio < 1.0 / (1.0 + threshold):
+            status = "faster"
+        else:
+            status = ""
+        rows.append((key, t0, t1, ratio, status))
+    return rows
+
+
+def format_comparison(rows):
+    lines = ["%-60s  %10s  %10s  %7s" % ("benchmark", "old [ms]", "new [ms]", "ratio")]
+    for key, t0, t1, ratio, status in rows:
+        lines.append("%-60s  %10.3f  %10.3f  %7.2f  %s" % (key, 1e3*t0, 1e3*t1, ratio, status))
+    return "\n".join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output",
+                        help="Write results as JSON to this file.")
+    parser.add_argument("-c", "--compare",
+                        help="Compare with results in this JSON file; "
+                        "exit with status 1 if any benchmark is slower.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="Relative change in time reported as "
+                        "slower or faster (default: %(default)s).")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Minimal number of runs of each benchmark "
+                        "(default: %(default)s).")
+    parser.add_argument("--min-time", type=float, default=0.0,
+                        help="Minimal total time in seconds spent "
+                        "running each benchmark (default: %(default)s).")
+    parser.add_argument("-k", "--keyword", action="append", default=[],
+                        help="Only run benchmarks with names containing this "
+                        "string, can be repeated.")
+    parser.add_argument("-b", "--benchmark", action="append",
+                        choices=list(benchmarks),
+                        help="Benchmark to run, can be repeated (default: all).")
+    parser.add_argument("--large", action="store_true",
+                        help="Include large sizes of the synthetic forms.")
+    parser.add_argument("-l", "--list", action="store_true",
+                        help="List the cases and benchmarks and exit.")
+    options = parser.parse_args(args)
+
+    cases = build_cases(large=options.large)
+    names = options.benchmark or list(benchmarks)
+
+    if options.list:
+        print("Cases:\n  " + "\n  ".join(case.name for case in cases))
+        print("Benchmarks:\n  " + "\n  ".join(names))
+        return 0
+
+    results = run_benchmarks(cases, names, options.repeat, options.min_time,
+                             options.keyword, log=print)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"metadata": metadata(), "results": results},
+                      f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            old = json.load(f)
+        rows = compare_results(old["results"], results, options.threshold)
+        print()
+        print(format_comparison(rows))
+        slower = [row for row in rows if row[4] == "slower"]
+        if slower:
+            print("\n%d of %d benchmarks are slower than in %s." % (
+                len(slower), len(rows), options.compare))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,8 @@ from pprint import *
 from ufl import *
 from ufl.algorithms import *
 from ufl.classes import Sum, Product
+from ufl.algorithms.transformer import ReuseTransformer, ufl2ufl, ufl2uflcopy
+from ufl.algorithms.formtransformations import compute_form_arities
 
 from ufl.corealg.traversal import *
 
@@ -138,3 +140,39 @@ def test_adjoint():
     d = adjoint(b)
     d_arg_degrees = [arg.ufl_element().degree() for arg in extract_arguments(d)]
     assert d_arg_degrees == [2, 1]
+
+
+def test_transformer_visits_shared_subexpressions_once(element):
+    f = Coefficient(element)
+    v = TestFunction(element)
+
+    class CountingTransformer(ReuseTransformer):
+        def __init__(self):
+            ReuseTransformer.__init__(self)
+            self.calls = 0
+
+        def product(self, o, *ops):
+            self.calls += 1
+            return self.reuse_if_untouched(o, *ops)
+
+    # A DAG with 2**30 paths from the root to f
+    e = f
+    for i in range(30):
+        e = e*e
+    t = CountingTransformer()
+    assert t.visit(e) is e
+    assert t.calls == 30
+
+    # Also through handlers visiting their operands themselves
+    a = variable(e)*v*dx
+    assert strip_variables(a) == e*v*dx
+    assert compute_form_arities(a) == set([1])
+
+
+def test_transformer_handles_deep_expressions(element):
+    f = Coefficient(element)
+    e = f
+    for i in range(5000):
+        e = sin(e)
+    assert ufl2ufl(e) is e
+    assert ufl2uflcopy(e) == e
@@ -4,7 +4,7 @@
 import pytest
 
 from ufl import *
-from ufl.classes import Division, FloatValue, IntValue
+from ufl.classes import Division, FloatValue, IntValue, Sum, Product
 
 
 def test_scalar_casting(self):
@@ -92,3 +92,59 @@ def test_elem_op(self):
     self.assertEqual(elem_op(sin, A), as_matrix(((sin(x), sin(y), sin(z)),
                                                  (sin(3), sin(4), sin(5)))))
     self.assertEqual(elem_op(sin, A).dx(0).ufl_shape, (2, 3))
+
+
+def _depth(e):
+    return 1 + max([_depth(o) for o in e.ufl_operands] or [0])
+
+
+def test_balanced_sum():
+    V = FiniteElement("CG", triangle, 1)
+    fs = [Coefficient(V) for i in range(100)]
+    s = balanced_sum(fs)
+    assert isinstance(s, Sum)
+    assert _depth(s) == 1 + 7
+    # Canonical regardless of the ordering of the operands
+    assert balanced_sum(reversed(fs)) == s
+    assert balanced_sum(fs[:1]) is fs[0]
+    # Evaluates like the plain sum
+    values = dict((f, float(i)) for i, f in enumerate(fs))
+    assert s((0.0, 0.0), values) == sum(range(100))
+
+
+def test_balanced_sum_folds_constants_and_zeros():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    assert balanced_sum([1, f, 0, g, 2.5]) == 3.5 + (f + g)
+    assert balanced_sum([0, f]) is f
+    assert balanced_sum([1, 2]) == 3
+    assert balanced_sum([]) == 0
+    with pytest.raises(UFLException):
+        balanced_sum([f, grad(f)])
+
+
+def test_balanced_sum_of_forms():
+    V = FiniteElement("CG", triangle, 1)
+    v = TestFunction(V)
+    fs = [Coefficient(V) for i in range(10)]
+    forms = [f*v*dx for f in fs]
+    assert balanced_sum(forms) == sum(forms)
+
+
+def test_balanced_product():
+    V = FiniteElement("CG", triangle, 1)
+    fs = [Coefficient(V) for i in range(16)]
+    p = balanced_product(fs)
+    assert isinstance(p, Product)
+    assert _depth(p) == 1 + 4
+    assert balanced_product(reversed(fs)) == p
+    values = dict((f, 2.0) for f in fs)
+    assert p((0.0, 0.0), values) == 2.0**16
+
+    f, g = fs[:2]
+    assert balanced_product([2, f, 3, g]) == 6*(f*g)
+    assert balanced_product([1, f]) is f
+    assert balanced_product([f, 0, g]) == 0
+    with pytest.raises(UFLException):
+        balanced_product([f, grad(f)])
@@ -0,0 +1,66 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Smoke test of the benchmark harness in bench/.
+"""
+
+import os
+import sys
+
+import pytest
+
+benchdir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bench"))
+sys.path.insert(0, benchdir)
+try:
+    from cases import BenchmarkCase, build_cases, benchmarks, long_sum_forms
+    from runner import run_benchmarks, compare_results, main
+finally:
+    sys.path.remove(benchdir)
+
+
+def test_benchmark_cases_cover_demos_and_synthetic_forms():
+    names = [case.name for case in build_cases()]
+    assert "demo/HyperElasticity" in names
+    assert "demo/NavierStokes" in names
+    assert any(name.startswith("long_sum/") for name in names)
+    assert any(name.startswith("deep_nesting/") for name in names)
+    assert any(name.startswith("wide_mixed/") for name in names)
+    assert len(build_cases(large=True)) > len(names)
+
+
+def test_run_benchmarks():
+    case = BenchmarkCase("long_sum/3", build=lambda: long_sum_forms(3))
+    results = run_benchmarks([case], list(benchmarks), repeat=2)
+    # load_ufl_file only applies to demo files
+    assert sorted(results) == sorted("long_sum/3:" + name for name in benchmarks
+                                     if name != "load_ufl_file")
+    for result in results.values():
+        assert "error" not in result
+        assert result["repeat"] == 2
+        assert 0.0 <= result["min"] <= result["median"] <= result["max"]
+
+
+def test_run_benchmarks_records_errors():
+    def fail():
+        raise RuntimeError("broken")
+    case = BenchmarkCase("broken", build=fail)
+    results = run_benchmarks([case], ["signature"], repeat=1)
+    assert results["broken:signature"]["error"] == "RuntimeError: broken"
+
+
+def test_compare_results():
+    old = {"a": {"min": 1.0}, "b": {"min": 1.0}, "c": {"min": 1.0},
+           "d": {"error": "x"}, "e": {"min": 1.0}}
+    new = {"a": {"min": 1.05}, "b": {"min": 2.0}, "c": {"min": 0.5},
+           "d": {"min": 1.0}}
+    rows = compare_results(old, new, threshold=0.1)
+    assert [(r[0], r[4]) for r in rows] == [("a", ""), ("b", "slower"), ("c", "faster")]
+
+
+def test_runner_writes_and_compares_json(tmpdir):
+    before = str(tmpdir.join("before.json"))
+    after = str(tmpdir.join("after.json"))
+    args = ["-r", "1", "-k", "long_sum/10:", "-b", "signature"]
+    assert main(args + ["-o", before]) == 0
+    # A huge threshold makes the comparison independent of timing noise
+    assert main(args + ["-o", after, "-c", before, "-t", "1000"]) == 0
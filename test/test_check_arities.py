@@ -1,8 +1,12 @@
 #!/usr/bin/env py.test
 # -*- coding: utf-8 -*-
+import sys
 import pytest
 from ufl import *
 from ufl.algorithms.compute_form_data import compute_form_data
+from ufl.algorithms.check_arities import (ArityMismatch, ArityCache,
+                                          check_integrand_arity)
+from ufl.log import UFLException
 
 
 def test_check_arities():
@@ -30,3 +34,74 @@ def test_check_arities():
     fd = compute_form_data(a)
 
     assert True
+
+
+def test_check_arities_modes():
+    cell = triangle
+    V = FiniteElement("N1curl", cell, 1)
+    v = TestFunction(V)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+    a = (inner(curl(u), curl(v)) + inner(f, f) * inner(u, v)) * dx
+
+    options = dict(do_apply_function_pullbacks=True,
+                   do_apply_integral_scaling=True,
+                   do_apply_geometry_lowering=True)
+    fd_trust = compute_form_data(a, check_arities="trust", **options)
+    fd_verify = compute_form_data(a, check_arities="verify", **options)
+    assert fd_trust.preprocessed_form.signature() == fd_verify.preprocessed_form.signature()
+
+    with pytest.raises(UFLException):
+        compute_form_data(a, check_arities="ignore")
+
+    b = (inner(u, v) + inner(f, v)) * dx
+    for mode in ("trust", "verify"):
+        with pytest.raises(ArityMismatch):
+            compute_form_data(b, check_arities=mode, **options)
+
+
+def test_check_integrand_arity_with_cache():
+    V = FiniteElement("CG", triangle, 1)
+    v = TestFunction(V)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+    e = (f * u + u) * v
+    cache = ArityCache()
+
+    check_integrand_arity(e, (v, u), cache)
+    assert cache.hits == 0
+    assert cache.get(e) == (v, u)
+
+    # Only the new nodes are checked
+    misses = cache.misses
+    check_integrand_arity(e + u * v, (u, v), cache)
+    assert cache.misses == misses + 2
+    check_integrand_arity(e, (v, u), cache)
+    assert cache.misses == misses + 2
+
+
+def test_check_arities_trusts_carried_integrands(monkeypatch):
+    results = []
+
+    class RecordingArityCache(ArityCache):
+        def get(self, expr, default=None):
+            r = ArityCache.get(self, expr, default)
+            results.append((expr, r))
+            return r
+    cfd = sys.modules["ufl.algorithms.compute_form_data"]
+    monkeypatch.setattr(cfd, "ArityCache", RecordingArityCache)
+
+    V = FiniteElement("N1curl", triangle, 1)
+    v = TestFunction(V)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+    a = (inner(curl(u), curl(v)) + inner(f, f) * inner(u, v)) * dx
+    fd = compute_form_data(a, do_apply_function_pullbacks=True,
+                           do_apply_integral_scaling=True,
+                           do_apply_geometry_lowering=True)
+
+    # The final check hits the root of the carried integrand
+    integrand = fd.preprocessed_form.integrals()[0].integrand()
+    expr, r = results[-1]
+    assert expr is integrand
+    assert r == (v, u)
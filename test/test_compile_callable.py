@@ -0,0 +1,80 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the compilation of expressions into NumPy functions.
+"""
+
+import pytest
+import math
+import numpy
+
+from ufl import *
+from ufl.algorithms import compile_callable
+from ufl.log import UFLException
+
+
+def f_values(p, derivatives=()):
+    if derivatives == ():
+        return p[:, 0]**2*p[:, 1]
+    elif derivatives == (0,):
+        return 2*p[:, 0]*p[:, 1]
+    elif derivatives == (1,):
+        return p[:, 0]**2
+    return numpy.zeros(len(p))
+
+
+def test_compiled_callable_matches_batch_evaluation():
+    V = FiniteElement("CG", triangle, 2)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    A = as_matrix([[x[0], 2.0], [sin(x[1]), x[0]*x[1] + 1.0]])
+    exprs = [
+        exp(f)*2.0**x[0] - 2.0/(1.0 + x[1])**(-x[0]) + ln(1.5 + x[1]) - erf(x[0]),
+        conditional(And(lt(x[0], x[1]), Not(eq(f, 0.0))), abs(x[0] - 2*x[1]), max_value(f, 0.25)),
+        as_vector([atan_2(x[0], 1.0 + x[1]), f/(1.0 + x[0]*x[1])]),
+        dot(A, x) + A[i, j]*x[j]*x[i]*x,
+        inv(A) + outer(grad(f), x),
+        ]
+    points = numpy.array([(0.1, 0.2), (0.7, 0.3), (0.4, 0.9), (0.4, 0.0)])
+    gradient = numpy.array([f_values(points, (d,)) for d in range(2)]).T
+    for e in exprs:
+        function = compile_callable(e, (x, f, grad(f)))
+        values = function(points, f_values(points), gradient)
+        assert values.shape == (len(points),) + e.ufl_shape
+        assert numpy.allclose(values, evaluate_batch(e, points, {f: f_values}))
+
+    # Constants do not depend on the batch
+    assert compile_callable(as_ufl(3.0))() == 3.0
+
+    # Single points are evaluated without a batch axis
+    function = compile_callable(sin(x[0])*x, (x,))
+    assert numpy.allclose(function(numpy.array((0.5, 2.0))),
+                          [math.sin(0.5)*0.5, math.sin(0.5)*2.0])
+
+
+def test_compiled_callables_are_cached_by_signature():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    function = compile_callable(f*sin(x[0]), (x, f))
+    assert compile_callable(f*sin(x[0]), (x, f)) is function
+    assert compile_callable(g*sin(x[0]), (x, g)) is function
+    # Other expressions or argument orderings give other functions
+    assert compile_callable(f*cos(x[0]), (x, f)) is not function
+    assert compile_callable(f*sin(x[0]), (f, x)) is not function
+    assert compile_callable(f*g*sin(x[0]), (x, f, g)) is not \
+        compile_callable(f*g*sin(x[0]), (x, g, f))
+    assert "numpy.sin" in function.source
+
+
+def test_compile_callable_requires_all_terminals():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    with pytest.raises(UFLException):
+        compile_callable(f*x[0], (x,))
+    with pytest.raises(UFLException):
+        compile_callable(grad(f)[0], (f,))
+    with pytest.raises(UFLException):
+        compile_callable(x[i], (x,))
@@ -0,0 +1,224 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test options of compute_form_data.
+"""
+
+import threading
+
+import pytest
+
+from ufl import *
+from ufl.algorithms import compute_form_data
+from ufl.form import Form
+from ufl.algorithms.passmanager import PassManager, count_nodes
+
+futures = pytest.importorskip("concurrent.futures")
+
+
+def multiphysics_form():
+    cell = triangle
+    V = VectorElement("CG", cell, 2)
+    Q = FiniteElement("CG", cell, 1)
+    u = Coefficient(V)
+    p = Coefficient(Q)
+    v = TestFunction(V)
+    n = FacetNormal(cell)
+    F = Identity(2) + grad(u)
+    psi = tr(F.T*F) - ln(det(F)) + p*det(F)
+    L = derivative(psi*dx(1) + exp(p)*psi*dx(2), u, v)
+    L += inner(grad(u)*n, v)*ds(1) + p*dot(v, n)*ds(2)
+    L += inner(jump(u), avg(v))*dS
+    return L
+
+
+options = dict(do_apply_function_pullbacks=True,
+               do_apply_integral_scaling=True,
+               do_apply_geometry_lowering=True,
+               preserve_geometry_types=(Jacobian,))
+
+
+def assert_same_form_data(fd, fd2):
+    assert len(fd.integral_data) == len(fd2.integral_data)
+    for d, d2 in zip(fd.integral_data, fd2.integral_data):
+        assert d.integral_type == d2.integral_type
+        assert d.subdomain_id == d2.subdomain_id
+        assert d.enabled_coefficients == d2.enabled_coefficients
+        assert [itg.metadata() for itg in d.integrals] == \
+            [itg.metadata() for itg in d2.integrals]
+        # Integrals processed in different worker processes may use
+        # indices with the same count, so compare them one by one
+        assert [Form([itg]).signature() for itg in d.integrals] == \
+            [Form([itg]).signature() for itg in d2.integrals]
+    assert fd.reduced_coefficients == fd2.reduced_coefficients
+
+
+def assert_refers_to_form_objects(fd, form):
+    assert all(any(c is f for f in form.coefficients())
+               for c in fd.reduced_coefficients)
+    assert all(any(c is f for f in form.coefficients())
+               for c in fd.function_replace_map)
+    assert all(any(d.domain is domain for domain in form.ufl_domains())
+               for d in fd.integral_data)
+
+
+@pytest.mark.parametrize("pool", [futures.ThreadPoolExecutor,
+                                  futures.ProcessPoolExecutor])
+def test_compute_form_data_with_executor(pool):
+    L = multiphysics_form()
+    fd = compute_form_data(L, **options)
+    with pool(max_workers=2) as executor:
+        fd2 = compute_form_data(L, executor=executor, **options)
+    assert_same_form_data(fd, fd2)
+    assert_refers_to_form_objects(fd2, L)
+
+
+def test_compute_form_data_with_spawned_processes():
+    multiprocessing = pytest.importorskip("multiprocessing")
+    L = multiphysics_form()
+    fd = compute_form_data(L, **options)
+    # Fresh worker processes start counting indices from zero
+    context = multiprocessing.get_context("spawn")
+    with futures.ProcessPoolExecutor(max_workers=2,
+                                     mp_context=context) as executor:
+        fd2 = compute_form_data(L, executor=executor, **options)
+    assert_same_form_data(fd, fd2)
+    assert_refers_to_form_objects(fd2, L)
+
+
+def test_compute_form_data_with_reused_process_pool():
+    # The workers keep the index counts from when they were started,
+    # while the second form is created later with new indices
+    with futures.ProcessPoolExecutor(max_workers=2) as executor:
+        for i in range(2):
+            L = multiphysics_form()
+            fd = compute_form_data(L, **options)
+            fd2 = compute_form_data(L, executor=executor, **options)
+            assert_same_form_data(fd, fd2)
+            assert_refers_to_form_objects(fd2, L)
+
+
+class MeshData(object):
+    "Unpicklable data carried by a mesh, like a DOLFIN mesh."
+    def __init__(self, ufl_id):
+        self._ufl_id = ufl_id
+        self.lock = threading.Lock()
+
+    def ufl_id(self):
+        return self._ufl_id
+
+
+class DataCoefficient(Coefficient):
+    "Coefficient holding unpicklable data, like a DOLFIN Function."
+    def __init__(self, function_space):
+        Coefficient.__init__(self, function_space)
+        self.lock = threading.Lock()
+
+
+def test_compute_form_data_with_unpicklable_form_objects():
+    mesh = Mesh(VectorElement("CG", triangle, 1), ufl_id=100,
+                cargo=MeshData(100))
+    V = FunctionSpace(mesh, FiniteElement("CG", triangle, 2))
+    u = DataCoefficient(V)
+    f = Coefficient(V)
+    v = TestFunction(V)
+    L = derivative(exp(u)*f*dx + u**2*ds, u, v)
+    fd = compute_form_data(L, **options)
+    with futures.ProcessPoolExecutor(max_workers=2) as executor:
+        fd2 = compute_form_data(L, executor=executor, **options)
+    assert_same_form_data(fd, fd2)
+    assert_refers_to_form_objects(fd2, L)
+    assert any(c is u for c in fd2.reduced_coefficients)
+    assert all(d.domain is mesh for d in fd2.integral_data)
+
+
+def test_compute_form_data_pass_statistics():
+    L = multiphysics_form()
+    recorded = []
+    fd = compute_form_data(L, pass_callback=recorded.append,
+                           count_pass_nodes=True, **options)
+    stats = fd.pass_statistics
+    assert recorded == stats
+
+    names = [s.name for s in stats]
+    assert names[:3] == ["apply_algebra_lowering", "apply_derivatives",
+                         "group_form_integrals"]
+    assert "apply_function_pullbacks" in names
+    assert "apply_geometry_lowering" in names
+    for s in stats:
+        if not s.skipped:
+            assert s.time >= 0.0
+            assert s.unique_nodes_in <= s.nodes_in
+            assert s.unique_nodes_out <= s.nodes_out
+    # The pipeline runs on the form first, then on each integral
+    assert stats[0].target == "form"
+    assert stats[0].nodes_in == count_nodes(L)[0]
+    assert set(s.target for s in stats[3:]) == \
+        set("%s integral %s" % (d.integral_type, d.subdomain_id)
+            for d in fd.integral_data)
+
+
+def test_compute_form_data_pass_statistics_without_node_counts():
+    L = multiphysics_form()
+    fd = compute_form_data(L, **options)
+    assert fd.pass_statistics
+    assert all(s.nodes_in is None for s in fd.pass_statistics)
+
+
+def test_pass_manager_skips_unchanged_repeat_passes():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    calls = []
+
+    def double(e):
+        calls.append(e)
+        return 2*e
+
+    def identity(e):
+        return e
+
+    pm = PassManager()
+    a = pm.run(double, f)
+    b = pm.run(identity, a)
+    c = pm.run(double, b, repeat=True)
+    assert c is a
+    assert calls == [f]
+    assert [s.skipped for s in pm.statistics] == [False, False, True]
+
+    # Not skipped if the input was changed since the last run
+    d = pm.run(double, 3*c, repeat=True)
+    assert d == 2*(3*(2*f))
+    assert len(calls) == 2
+
+    assert [s.name for s in pm.statistics] == ["double", "identity",
+                                               "double", "double"]
+    assert pm.statistics[0].nodes_in == 1
+    assert pm.statistics[0].nodes_out == 3
+
+
+def test_count_nodes():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    a = sin(f)*sin(f)
+    assert count_nodes(a) == (5, 3)
+    assert count_nodes(a*dx) == (5, 3)
+    assert count_nodes(a*dx + a*ds) == (10, 3)
+
+
+def test_compute_form_data_with_simplification():
+    L = multiphysics_form()
+    fd = compute_form_data(L, **options)
+    fd2 = compute_form_data(L, do_apply_simplification=True, **options)
+    assert len(fd.integral_data) == len(fd2.integral_data)
+
+    # The node counts of the simplification pass are always recorded
+    stats = [s for s in fd2.pass_statistics if s.name == "apply_simplification"]
+    assert len(stats) == sum(len(d.integrals) for d in fd2.integral_data)
+    assert all(s.unique_nodes_out <= s.unique_nodes_in for s in stats)
+    assert sum(s.unique_nodes_in - s.unique_nodes_out for s in stats) > 0
+    assert all(s.name != "apply_simplification" for s in fd.pass_statistics)
+    assert all(s.nodes_in is None for s in fd2.pass_statistics
+               if s.name != "apply_simplification")
+    for d, d2 in zip(fd.integral_data, fd2.integral_data):
+        for itg, itg2 in zip(d.integrals, d2.integrals):
+            assert count_nodes(itg2)[1] <= count_nodes(itg)[1]
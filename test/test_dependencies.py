@@ -0,0 +1,83 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the cached form argument dependencies of expressions, and their
+use to skip independent subexpressions in differentiation.
+"""
+
+import gc
+import math
+import weakref
+
+from ufl import *
+from ufl.corealg.dependencies import (form_argument_dependencies, depends_on,
+                                      is_spatially_independent)
+from ufl.algorithms import expand_derivatives
+from ufl.algorithms.analysis import extract_type, has_exact_type
+from ufl.algorithms.apply_derivatives import GateauxDerivativeRuleset
+from ufl.classes import ExprList, ExprMapping, Zero, Grad
+
+
+def test_form_argument_dependencies():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    v = TestFunction(V)
+    a = sin(f)*exp(f)
+    b = a*g + v
+
+    assert form_argument_dependencies(a) == frozenset([f])
+    assert form_argument_dependencies(b) == frozenset([f, g, v])
+    assert form_argument_dependencies(as_ufl(2.0)) == frozenset()
+    # The sets of operands are shared where possible
+    assert form_argument_dependencies(a) is form_argument_dependencies(a.ufl_operands[0])
+
+    assert depends_on(b, set([g]))
+    assert not depends_on(a, set([g, v]))
+
+    # The cached sets do not keep the expressions alive
+    r = weakref.ref(b)
+    del b
+    gc.collect()
+    assert r() is None
+
+
+def test_is_spatially_independent():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    assert is_spatially_independent(sin(as_ufl(2.0))*Identity(2)[0, 1])
+    assert not is_spatially_independent(sin(x[0]))
+    assert not is_spatially_independent(f + 1)
+
+
+def test_gateaux_derivative_skips_independent_subexpressions():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    v = TestFunction(V)
+    independent = exp(sin(g)*cos(g))
+
+    rules = GateauxDerivativeRuleset(ExprList(f), ExprList(v), ExprMapping())
+    assert rules.shortcut(f) is None
+    assert rules.shortcut(f*g) is None
+    assert isinstance(rules.shortcut(independent), Zero)
+    assert rules.shortcut(independent).ufl_shape == ()
+
+    F = (f**2*independent + grad(g)[0])*dx
+    dF = expand_derivatives(derivative(F, f, v))
+    integrand = dF.integrals()[0].integrand()
+    assert not has_exact_type(integrand, Grad)
+    values = {f: 2.0, g: 0.5, v: 3.0}
+    expected = 2*2.0*3.0*math.exp(math.sin(0.5)*math.cos(0.5))
+    assert abs(integrand((), values) - expected) < 1e-12
+
+
+def test_grad_of_spatially_constant_subexpressions():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    c = Constant(triangle)
+    e = expand_derivatives(grad(f*exp(c*2.0)))
+    # Only f is differentiated
+    assert extract_type(e, Grad) == set([grad(f)])
+    assert expand_derivatives(grad(sin(c)*cos(c))) == Zero((2,))
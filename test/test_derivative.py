@@ -12,7 +12,7 @@ from itertools import chain
 
 from ufl import *
 from ufl.constantvalue import as_ufl
-from ufl.algorithms import expand_indices, strip_variables, post_traversal, compute_form_data
+from ufl.algorithms import expand_indices, strip_variables, post_traversal, compute_form_data, expand_derivatives
 
 
 def assertEqualBySampling(actual, expected):
@@ -657,6 +657,115 @@ def test_derivative_replace_works_together(self):
     assertEqualBySampling(J, J2)
     assertEqualBySampling(JR, JR2)
 
+# --- Reverse mode derivatives
+
+
+def _sample_polynomial(shape, seed):
+    "Return a callable evaluating a quadratic with its first derivatives."
+    n = shape[0] if shape else 1
+    coefs = [(0.3 + 0.1*(seed + k), 0.2*(k + 1), 0.1*seed + 0.5) for k in range(n)]
+
+    def f(x, derivatives=()):
+        values = []
+        for c0, c1, c2 in coefs:
+            if derivatives == ():
+                values.append(c0 + c1*x[0]**2 + c2*x[0]*x[1])
+            elif derivatives == (0,):
+                values.append(2*c1*x[0] + c2*x[1])
+            elif derivatives == (1,):
+                values.append(c2*x[0])
+            else:
+                values.append(0.0)
+        return tuple(values) if shape else values[0]
+    return f
+
+
+def assertEqualDerivativeBySampling(actual, expected, mapping=None):
+    mapping = dict(mapping or {})
+    for k, f in enumerate(chain(expected.coefficients(), expected.arguments())):
+        mapping[f] = _sample_polynomial(f.ufl_shape, k)
+    x = (0.3, 0.6)
+
+    def sample(form):
+        values = {}
+        for itg in form.integrals():
+            t = itg.integral_type()
+            values[t] = values.get(t, 0.0) + itg.integrand()(x, mapping)
+        return values
+
+    av = sample(actual)
+    bv = sample(expected)
+    assert sorted(av) == sorted(bv)
+    for t in bv:
+        assert abs(av[t] - bv[t]) < 1e-10*(1 + abs(bv[t]))
+
+
+def test_reverse_mode_derivatives_match_forward_mode():
+    V = FiniteElement("CG", triangle, 2)
+    W = VectorElement("CG", triangle, 2)
+    u = Coefficient(V)
+    p = Coefficient(V)
+    w = Coefficient(W)
+    c = Constant(triangle)
+    i, j = indices(2)
+    J = (sin(u)*exp(p)*u**3 + dot(w, w)*u/(1 + p**2)
+         + inner(grad(u), grad(p))*c + conditional(lt(u, p), u*p, w[0])
+         + max_value(u, p)**2 + abs(u*w[1]) + as_vector([u, p])[i]*w[i]
+         + sqrt(1 + u**2)*atan_2(u, p) + tr(outer(w, w)*u)
+         + ln(2 + p)*Identity(2)[i, j]*grad(w)[i, j]
+         + as_tensor(w[i]*u, (i,))[j]*grad(p)[j])*dx + u*p*ds
+
+    coefficients = (u, p, w)
+    forms = derivatives(J, coefficients)
+    assert len(forms) == 3
+    for f, F in zip(coefficients, forms):
+        v, = F.arguments()
+        assert v.number() == 0
+        assert v.ufl_function_space() == f.ufl_function_space()
+        expected = expand_derivatives(derivative(J, f, v))
+        assertEqualDerivativeBySampling(F, expected)
+
+
+def test_reverse_mode_derivatives_of_matrix_list_tensors():
+    V = FiniteElement("CG", triangle, 2)
+    u = Coefficient(V)
+    p = Coefficient(V)
+    A = as_matrix([[u**2, u*p], [sin(p), 2*u]])
+    i, j = indices(2)
+    for J in (inner(A, A)*dx, tr(A)*dx, A[i, i]*dx, A[i, j]*A[i, j]*dx):
+        F, G = derivatives(J, (u, p))
+        assertEqualDerivativeBySampling(F, expand_derivatives(derivative(J, u, F.arguments()[0])))
+        assertEqualDerivativeBySampling(G, expand_derivatives(derivative(J, p, G.arguments()[0])))
+
+
+def test_reverse_mode_derivatives_of_facet_terms():
+    V = FiniteElement("DG", triangle, 1)
+    u = Coefficient(V)
+    p = Coefficient(V)
+    n = FacetNormal(triangle)
+    J = (u('+')*p('-')**2 + avg(u)*exp(p('+')) + inner(grad(u)('-'), n('+'))*p('+'))*dS
+    F, G = derivatives(J, (u, p))
+    mapping = {n: (0.6, 0.8)}
+    assertEqualDerivativeBySampling(F, expand_derivatives(derivative(J, u, F.arguments()[0])), mapping)
+    assertEqualDerivativeBySampling(G, expand_derivatives(derivative(J, p, G.arguments()[0])), mapping)
+
+
+def test_reverse_mode_derivatives_with_mixed_argument():
+    V = FiniteElement("CG", triangle, 1)
+    u = Coefficient(V)
+    p = Coefficient(V)
+    q = Coefficient(V)
+    v = TestFunction(V*V)
+    J = (u*p**2 + sin(u)*cos(p))*dx + q*dx
+    forms = derivatives(J, (u, p), split(v))
+    assert all(F.arguments() == (v,) for F in forms)
+    assertEqualDerivativeBySampling(sum(forms), expand_derivatives(derivative(J, (u, p), v)))
+
+    # Independent coefficients give empty forms
+    F, = derivatives(u*p*dx, (q,))
+    assert F.empty()
+
+
 # --- Scratch space
 
 
@@ -6,9 +6,12 @@ __date__ = "2009-02-13 -- 2009-02-13"
 
 import pytest
 import math
+import itertools
+import numpy
 
 from ufl import *
 from ufl.constantvalue import as_ufl
+from ufl.log import UFLException
 
 
 def testScalars():
@@ -364,3 +367,141 @@ def test_cofac():
 
 def test_inv():
     pass  # TODO
+
+
+def test_evaluate_batch_matches_pointwise_evaluation():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    A = as_matrix([[x[0], 2.0], [sin(x[1]), x[0]*x[1] + 1.0]])
+    exprs = [
+        exp(f)*x[0]**2 + ln(1.5 + x[1]) - erf(x[0]),
+        conditional(lt(x[0], x[1]), abs(x[0] - 2*x[1]), max_value(f, 0.25)),
+        as_vector([atan_2(x[0], 1.0 + x[1]), f/(1.0 + x[0]*x[1])]),
+        dot(A, x) + A[i, j]*x[j]*x[i]*x,
+        inv(A),
+        tr(A)*outer(x, x) + det(A)*Identity(2),
+        ]
+    mapping = {f: lambda p: 3.0*p[..., 0] - p[..., 1]}
+    points = [(0.1, 0.2), (0.7, 0.3), (0.4, 0.9)]
+    for e in exprs:
+        values = evaluate_batch(e, points, mapping)
+        assert values.shape == (len(points),) + e.ufl_shape
+        for p, v in zip(points, values):
+            pointwise_mapping = {f: lambda y: 3.0*y[0] - y[1]}
+            if e.ufl_shape == ():
+                expected = e(p, pointwise_mapping)
+            else:
+                expected = [e[c](p, pointwise_mapping)
+                            for c in itertools.product(*[range(n) for n in e.ufl_shape])]
+            assert numpy.allclose(numpy.ravel(v), expected)
+
+
+def test_evaluate_batch_derivatives():
+    V = FiniteElement("CG", triangle, 2)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+
+    def f_values(p, derivatives=()):
+        if derivatives == ():
+            return p[:, 0]**2*p[:, 1]
+        elif derivatives == (0,):
+            return 2*p[:, 0]*p[:, 1]
+        elif derivatives == (1,):
+            return p[:, 0]**2
+        return numpy.zeros(len(p))
+
+    points = numpy.array([(0.1, 0.2), (0.7, 0.3), (0.4, 0.9), (1.0, 2.0)])
+    values = evaluate_batch(grad(f) + grad(x[0]*x[1]), points, {f: f_values})
+    expected = numpy.array([2*points[:, 0]*points[:, 1] + points[:, 1],
+                            points[:, 0]**2 + points[:, 0]]).T
+    assert numpy.allclose(values, expected)
+
+    # Derivatives of coefficients with values are zero
+    values = evaluate_batch(grad(f)[0] + f, points, {f: numpy.ones(len(points))})
+    assert numpy.allclose(values, 1.0)
+
+
+def test_evaluate_batch_of_constants_and_mapped_subexpressions():
+    V = VectorElement("CG", interval, 1, dim=2)
+    u = Coefficient(V)
+    x = SpatialCoordinate(interval)
+    points = numpy.linspace(0.0, 1.0, 5)
+
+    # Constant arrays are broadcast to all points
+    values = evaluate_batch(inner(u, u)*x[0], points, {u: numpy.array([1.0, 2.0])})
+    assert numpy.allclose(values, 5.0*points)
+    values = evaluate_batch(as_ufl(2.0), points)
+    assert values.shape == (5,) and numpy.allclose(values, 2.0)
+
+    # Subexpressions in the mapping are not evaluated further
+    s = sin(x[0])
+    values = evaluate_batch(s + 1, points, {s: points**2})
+    assert numpy.allclose(values, points**2 + 1)
+
+    with pytest.raises(UFLException):
+        evaluate_batch(u[0], points)
+    with pytest.raises(UFLException):
+        evaluate_batch(u[0], points, {u: numpy.ones((3, 2))})
+    with pytest.raises(UFLException):
+        evaluate_batch(u[i], points, {u: numpy.ones(2)})
+
+
+def test_evaluate_shared_subexpressions_once():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    x = SpatialCoordinate(triangle)
+    calls = []
+
+    def f_value(y):
+        calls.append(y)
+        return 0.01
+
+    # Evaluating each path of this DAG would visit 2**30 nodes
+    e = x[0]*x[1] + f
+    v = 0.1*0.2 + 0.01
+    for k in range(30):
+        e = e*e + sin(e)
+        v = v*v + math.sin(v)
+    assert abs(e((0.1, 0.2), {f: f_value}) - v) < 1e-12
+    assert len(calls) == 1
+
+    # Shared subexpressions with free indices are distinguished by
+    # the bound index values
+    A = as_matrix([[x[0], x[1]], [f, 2.0]])
+    s = A[i, j]*x[j]
+    e = s*(s + x[i])
+    v = 0.0
+    for a, a_x in zip([(0.1, 0.2), (0.3, 2.0)], (0.1, 0.2)):
+        sc = a[0]*0.1 + a[1]*0.2
+        v += sc*(sc + a_x)
+    assert abs(e((0.1, 0.2), {f: 0.3}) - v) < 1e-14
+
+
+def test_evaluate_caches_expanded_derivatives(monkeypatch):
+    import ufl.algorithms
+    from ufl.algorithms.ad import expand_derivatives
+    expansions = []
+
+    def counting_expand_derivatives(e):
+        expansions.append(e)
+        return expand_derivatives(e)
+    monkeypatch.setattr(ufl.algorithms, "expand_derivatives", counting_expand_derivatives)
+
+    x = SpatialCoordinate(triangle)
+    e = grad(x[0]**2*x[1])[0]
+    assert e((3.0, 2.0)) == 12.0
+    assert e((1.0, 5.0)) == 10.0
+    assert len(expansions) == 1
+    f = x[0] + x[1]
+    assert f((1.0, 2.0)) == 3.0
+    assert f((1.0, 3.0)) == 4.0
+    assert len(expansions) == 2
+
+    # The cached expansion does not keep the expression alive
+    import gc
+    import weakref
+    r = weakref.ref(e)
+    del e, expansions[:]
+    gc.collect()
+    assert r() is None
@@ -0,0 +1,72 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the process independent structural digest of expressions.
+"""
+
+import gc
+import os
+import subprocess
+import sys
+import weakref
+
+from ufl import *
+from ufl.core.compute_expr_hash import _digests
+
+
+def test_digest_of_equal_expressions_are_equal():
+    V = VectorElement("CG", triangle, 1)
+    f = Coefficient(V, count=0)
+    i = Index()
+    a = exp(f[i]*f[i]) + grad(f)[0, 1]
+    b = exp(f[i]*f[i]) + grad(f)[0, 1]
+    assert a is not b
+    assert a.ufl_digest() == b.ufl_digest()
+    assert len(a.ufl_digest()) == 32
+
+
+def test_digest_of_different_expressions_differ():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V, count=0)
+    g = Coefficient(V, count=1)
+    exprs = [f, g, f + g, f*g, f/g, g/f, sin(f), cos(f), sin(g),
+             f**2, f**3, as_ufl(1), as_ufl(1.0), grad(f)[0], grad(f)[1]]
+    digests = set(e.ufl_digest() for e in exprs)
+    assert len(digests) == len(exprs)
+
+
+def test_digest_is_cached():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    a = sin(f) + f
+    assert a not in _digests
+    d = a.ufl_digest()
+    assert a in _digests
+    assert a.ufl_operands[0] in _digests
+    assert a.ufl_digest() == d
+
+    # The cached digests do not keep the expressions alive
+    r = weakref.ref(a)
+    del a
+    gc.collect()
+    assert r() is None
+
+
+_digest_script = """
+from ufl import *
+V = VectorElement("CG", tetrahedron, 2)
+u = Coefficient(V, count=3)
+i, j = indices(2)
+F = Identity(3) + grad(u)
+print((exp(F[i, j]*F[i, j]) + det(F)*tr(F)).ufl_digest())
+"""
+
+
+def test_digest_is_independent_of_hash_seed():
+    digests = set()
+    for seed in ("1", "2"):
+        env = dict(os.environ)
+        env["PYTHONHASHSEED"] = seed
+        out = subprocess.check_output([sys.executable, "-c", _digest_script], env=env)
+        digests.add(out.strip())
+    assert len(digests) == 1
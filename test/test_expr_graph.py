@@ -0,0 +1,75 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the compact array representation of expression DAGs.
+"""
+
+import pytest
+
+from ufl import *
+from ufl.classes import Sum, Product, Division, Sin, Grad, Terminal, FormArgument
+from ufl.corealg.graph import build_expr_graph
+from ufl.corealg.traversal import unique_pre_traversal
+
+
+def test_expr_graph_numbers_operands_before_operators():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    a = sin(f*g) + f*g
+    G = build_expr_graph(a)
+    assert len(G) == len(list(unique_pre_traversal(a)))
+    for i in range(len(G)):
+        assert all(j < i for j in G.operands(i))
+    assert G.roots.tolist() == [len(G) - 1]
+
+
+def test_expr_graph_shares_nodes_between_expressions():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    a = f*g
+    b = sin(f*g)
+    G = build_expr_graph([a, b, a])
+    assert len(G) == 4
+    assert G.roots[0] == G.roots[2]
+    assert G.use_counts()[G.roots[0]] == 1
+
+
+def test_expr_graph_roundtrip():
+    V = VectorElement("CG", triangle, 2)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    f = Coefficient(V)
+    i, j = indices(2)
+    exprs = [inner(grad(u), grad(v)),
+             conditional(lt(f[0], 0.5), f[i]*f[i], exp(f[1]))*u[j]*v[j],
+             as_vector((f[1], -f[0]))[i]*u.dx(i)[0]*v[0]]
+    G = build_expr_graph(exprs)
+    assert G.expressions() == exprs
+
+
+def test_expr_graph_type_queries():
+    V = FiniteElement("CG", triangle, 1)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+    a = sin(f)*u + f*grad(u)[0]
+    G = build_expr_graph(a)
+
+    counts = G.type_counts()
+    assert counts[Product._ufl_typecode_] == 2
+    assert counts[Sum._ufl_typecode_] == 1
+
+    assert G.has_type(Grad)
+    assert G.has_type(Sin)
+    assert G.has_type(FormArgument)
+    assert not G.has_type(Division)
+
+    assert set(G.extract_terminals(FormArgument)) == set((u, f))
+    assert set(G.extract_terminals(Coefficient)) == set((f,))
+    assert len(G.extract_terminals()) == G.type_mask(Terminal).sum()
+
+
+def test_expr_graph_requires_expressions():
+    with pytest.raises(Exception):
+        build_expr_graph([1.0])
@@ -134,3 +134,19 @@ def test_form_call():
         a = u*v*dx
         M = eval("(a @ f) @ g")
         assert M == g*f*dx
+
+
+def test_form_sum_sorts_integrals_canonically():
+    V = FiniteElement("CG", triangle, 1)
+    v = TestFunction(V)
+    fs = [Coefficient(V) for i in range(6)]
+    terms = [fs[0]*v*ds(2), fs[1]*v*dx(1), fs[2]*v*ds(1),
+             fs[3]*v*dx(0), fs[4]*v*dx(1), fs[5]*v*ds(2)]
+    a = sum(terms)
+    b = Form([itg for t in terms for itg in t.integrals()])
+    assert a.integrals() == b.integrals()
+    assert [(itg.integral_type(), itg.subdomain_id()) for itg in a.integrals()] == \
+        [("cell", 0), ("cell", 1), ("cell", 1),
+         ("exterior_facet", 1), ("exterior_facet", 2), ("exterior_facet", 2)]
+    assert [itg.integrand() for itg in a.integrals_by_type("cell")] == \
+        [fs[3]*v, fs[1]*v, fs[4]*v]
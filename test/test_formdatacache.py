@@ -0,0 +1,200 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the persistent cache of compute_form_data results.
+"""
+
+import os
+import sys
+import subprocess
+import pytest
+
+from ufl import *
+from ufl.algorithms import compute_form_data
+from ufl.algorithms.formdatacache import FormDataDiskCache, \
+    set_default_disk_cache, get_default_disk_cache, form_data_memory_cache
+
+
+def hyperelasticity(count):
+    cell = tetrahedron
+    V = VectorElement("CG", cell, 2)
+    Q = FiniteElement("DG", cell, 0)
+    v = TestFunction(V)
+    u = Coefficient(V, count=count)
+    mu = Coefficient(Q, count=count + 1)
+    F = Identity(3) + grad(u)
+    C = F.T*F
+    J = det(F)
+    psi = mu*(tr(C) - 3) - ln(J) + ln(J)**2
+    return derivative(psi*dx + mu*inner(u, u)*ds, u, v)
+
+
+def test_disk_cache_roundtrip(tmpdir):
+    cache = FormDataDiskCache(str(tmpdir))
+    L = hyperelasticity(10)
+    fd = compute_form_data(L, do_apply_geometry_lowering=True, disk_cache=cache)
+    assert len(cache.entries()) == 1
+
+    fd2 = compute_form_data(L, do_apply_geometry_lowering=True, disk_cache=cache)
+    assert len(cache.entries()) == 1
+    assert fd2 is not fd
+    assert fd2.original_form is L
+    assert fd2.preprocessed_form == fd.preprocessed_form
+    assert fd2.reduced_coefficients == fd.reduced_coefficients
+    assert fd2.function_replace_map == fd.function_replace_map
+    assert fd2.original_coefficient_positions == fd.original_coefficient_positions
+    assert [itg_data.enabled_coefficients for itg_data in fd2.integral_data] == \
+        [itg_data.enabled_coefficients for itg_data in fd.integral_data]
+
+
+_hash_seed_script = """
+import sys
+from ufl import *
+from ufl.algorithms import compute_form_data
+from ufl.algorithms.formdatacache import FormDataDiskCache
+cell = tetrahedron
+V = VectorElement("CG", cell, 2)
+v = TestFunction(V)
+u = Coefficient(V, count=10)
+F = Identity(3) + grad(u)
+L = derivative((tr(F.T*F) - ln(det(F)))*dx, u, v)
+cache = FormDataDiskCache(sys.argv[1])
+if sys.argv[2] == "write":
+    compute_form_data(L, do_apply_geometry_lowering=True, disk_cache=cache)
+else:
+    # Computed first, such that the indices get the same counts as in
+    # the process writing the cache
+    fd = compute_form_data(L, do_apply_geometry_lowering=True, disk_cache=False)
+    fd2 = compute_form_data(L, do_apply_geometry_lowering=True, disk_cache=cache)
+    print(fd2.preprocessed_form.equals(fd.preprocessed_form))
+print(len(cache.entries()))
+"""
+
+
+def test_disk_cache_is_independent_of_hash_seed(tmpdir):
+    results = []
+    for seed, mode in (("1", "write"), ("2", "read"), ("1", "read")):
+        env = dict(os.environ)
+        env["PYTHONHASHSEED"] = seed
+        out = subprocess.check_output([sys.executable, "-c", _hash_seed_script,
+                                       str(tmpdir), mode], env=env)
+        results.append(out.split())
+    assert results == [[b"1"], [b"True", b"1"], [b"True", b"1"]]
+
+
+def test_disk_cache_refers_to_objects_of_given_form(tmpdir):
+    cache = FormDataDiskCache(str(tmpdir))
+    L1 = hyperelasticity(10)
+    L2 = hyperelasticity(20)
+    assert L1.signature() == L2.signature()
+
+    compute_form_data(L1, disk_cache=cache)
+    fd = compute_form_data(L2, disk_cache=cache)
+    assert len(cache.entries()) == 1
+    assert fd.original_form is L2
+    assert set(fd.function_replace_map.keys()) == set(L2.coefficients())
+    for f in L2.coefficients():
+        assert any(g is f for g in fd.function_replace_map.keys())
+
+
+def test_disk_cache_is_keyed_on_options(tmpdir):
+    cache = FormDataDiskCache(str(tmpdir))
+    L = hyperelasticity(10)
+    compute_form_data(L, disk_cache=cache)
+    compute_form_data(L, do_apply_geometry_lowering=True, disk_cache=cache)
+    compute_form_data(L, do_apply_geometry_lowering=True,
+                      preserve_geometry_types=(Jacobian,), disk_cache=cache)
+    assert len(cache.entries()) == 3
+
+
+def test_disk_cache_eviction(tmpdir):
+    cache = FormDataDiskCache(str(tmpdir))
+    L = hyperelasticity(10)
+    compute_form_data(L, disk_cache=cache)
+    compute_form_data(L, do_estimate_degrees=False, disk_cache=cache)
+    assert len(cache.entries()) == 2
+
+    size = cache.size()
+    cache.evict(size - 1)
+    assert len(cache.entries()) == 1
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_default_disk_cache(tmpdir):
+    cache = FormDataDiskCache(str(tmpdir))
+    set_default_disk_cache(cache)
+    try:
+        L = hyperelasticity(10)
+        compute_form_data(L)
+        assert len(cache.entries()) == 1
+        compute_form_data(L, do_estimate_degrees=False, disk_cache=False)
+        assert len(cache.entries()) == 1
+    finally:
+        set_default_disk_cache(None)
+    assert get_default_disk_cache() is None
+
+
+def test_memory_cache():
+    cache = form_data_memory_cache
+    assert cache.max_size == 0
+    cache.set_max_size(2)
+    try:
+        L1 = hyperelasticity(10)
+        L2 = hyperelasticity(20)
+        fd = compute_form_data(L1)
+        assert compute_form_data(L1) is fd
+        fd2 = compute_form_data(L1, do_estimate_degrees=False)
+        assert fd2 is not fd
+        assert compute_form_data(L1) is fd
+        assert (cache.hits, cache.misses) == (2, 2)
+
+        # Equal but not identical forms are cached separately,
+        # evicting the least recently used entry
+        assert compute_form_data(L2) is not fd
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (2, 3)
+        assert compute_form_data(L1) is fd
+        assert compute_form_data(L1, do_estimate_degrees=False) is not fd2
+        assert (cache.hits, cache.misses) == (3, 4)
+
+        # Both entries for L1 are invalidated
+        cache.invalidate(L1)
+        assert len(cache) == 0
+        assert compute_form_data(L1) is not fd
+    finally:
+        cache.set_max_size(0)
+        cache.clear()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+    L1 = hyperelasticity(10)
+    assert compute_form_data(L1) is not compute_form_data(L1)
+
+
+def test_memory_cache_is_keyed_on_checks_and_statistics():
+    cache = form_data_memory_cache
+    cache.set_max_size(10)
+    try:
+        L = hyperelasticity(10)
+        fd = compute_form_data(L)
+        assert compute_form_data(L, check_arities="verify") is not fd
+        fd2 = compute_form_data(L, count_pass_nodes=True)
+        assert fd2 is not fd
+        assert compute_form_data(L, count_pass_nodes=True) is fd2
+        assert (cache.hits, cache.misses) == (1, 3)
+
+        # The callback is called for each pass, bypassing the cache
+        recorded = []
+        fd3 = compute_form_data(L, pass_callback=recorded.append)
+        assert fd3 is not fd
+        assert recorded
+        assert (cache.hits, cache.misses) == (1, 3)
+
+        # Lists of options are accepted like tuples
+        fd4 = compute_form_data(L, do_apply_geometry_lowering=True,
+                                preserve_geometry_types=[Jacobian])
+        assert compute_form_data(L, do_apply_geometry_lowering=True,
+                                 preserve_geometry_types=(Jacobian,)) is fd4
+    finally:
+        cache.set_max_size(0)
+        cache.clear()
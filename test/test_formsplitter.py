@@ -0,0 +1,61 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the splitting of forms on mixed spaces into blocks.
+"""
+
+from ufl import *
+from ufl.algorithms import expand_derivatives
+from ufl.algorithms.formsplitter import compute_nonzero_blocks
+from ufl.classes import ListTensor, Indexed, FixedIndex
+from ufl.corealg.traversal import unique_pre_traversal
+
+
+def mixed_form():
+    P2 = VectorElement("CG", triangle, 2)
+    P1 = FiniteElement("CG", triangle, 1)
+    W = MixedElement([P2, P1, P1])
+    w = Coefficient(W)
+    u, p, c = split(w)
+    v, q, d = TestFunctions(W)
+    F = (inner(grad(u), grad(v)) + div(v)*p + div(u)*q + c**2*d)*dx
+    return F, w, (P2, P1, P1)
+
+
+def test_nonzero_blocks_of_mixed_forms():
+    F, w, elements = mixed_form()
+    J = derivative(F, w)
+    assert compute_nonzero_blocks(expand_derivatives(J)) == [(0, 0), (0, 1), (1, 0), (2, 2)]
+    assert compute_nonzero_blocks(F) == [(0,), (1,), (2,)]
+
+    blocks = extract_blocks(J)
+    assert sorted(blocks) == [(0, 0), (0, 1), (1, 0), (2, 2)]
+    for (i, j), block in blocks.items():
+        v, u = block.arguments()
+        assert v.ufl_element() == elements[i]
+        assert u.ufl_element() == elements[j]
+    assert sorted(extract_blocks(F)) == [(0,), (1,), (2,)]
+
+
+def test_block_split_drops_zero_blocks():
+    F, w, elements = mixed_form()
+    J = expand_derivatives(derivative(F, w))
+    assert block_split(J, 2, 0).empty()
+    assert block_split(J, 0, 2).empty()
+    assert not block_split(J, 1, 0).empty()
+
+
+def test_derivative_of_mixed_coefficient_components():
+    F, w, elements = mixed_form()
+    # Differentiate w.r.t. the first field only, giving a variation
+    # which is zero in the other components
+    du = TrialFunction(FunctionSpace(w.ufl_domain(), elements[0]))
+    G = expand_derivatives(derivative(F, as_vector([w[0], w[1]]), du))
+    # Fixed components of the variation are picked directly
+    for itg in G.integrals():
+        for o in unique_pre_traversal(itg.integrand()):
+            if isinstance(o, Indexed):
+                A, ii = o.ufl_operands
+                assert not (isinstance(A, ListTensor) and isinstance(ii[0], FixedIndex))
+    # The blocks of the vector valued trial function are its components
+    assert compute_nonzero_blocks(G) == [(0, 0), (0, 1), (1, 0), (1, 1)]
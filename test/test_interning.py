@@ -0,0 +1,84 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test interning of expression objects.
+"""
+
+import pytest
+import gc
+
+from ufl import *
+from ufl.core.expr import Expr
+from ufl.classes import FloatValue
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.corealg.multifunction import MultiFunction
+
+
+@pytest.fixture
+def interning():
+    Expr.ufl_enable_interning()
+    yield
+    Expr.ufl_disable_interning()
+
+
+def test_interning_is_disabled_by_default():
+    assert not Expr.ufl_is_interning_enabled()
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    assert f*f + 2 == f*f + 2
+    assert f*f + 2 is not f*f + 2
+
+
+def test_equal_operators_are_identical(interning):
+    V = VectorElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    i, j = indices(2)
+    a = exp(f[i]*g[i]) + grad(f)[i, j]*grad(g)[j, i]
+    b = exp(f[i]*g[i]) + grad(f)[i, j]*grad(g)[j, i]
+    assert a is b
+    assert a.ufl_operands[0] is b.ufl_operands[0]
+
+
+def test_equal_terminals_are_identical(interning):
+    assert FloatValue(0.5) is FloatValue(0.5)
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V, count=7)
+    assert Coefficient(V, count=7) is f
+    assert Coefficient(V, count=8) is not f
+
+
+def test_different_operators_are_not_identical(interning):
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    assert f*g is not f + g
+    assert sin(f) is not cos(f)
+    assert sin(f) is not sin(g)
+
+
+def test_intern_table_does_not_keep_objects_alive(interning):
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    n = len(Expr._ufl_intern_table_)
+    a = sin(f)*cos(f)
+    assert len(Expr._ufl_intern_table_) > n
+    del a
+    gc.collect()
+    assert len(Expr._ufl_intern_table_) == n
+
+
+def test_map_expr_dag_with_interning(interning):
+    class Doubler(MultiFunction):
+        expr = MultiFunction.reuse_if_untouched
+
+        def coefficient(self, o):
+            return 2*o
+
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    a = map_expr_dag(Doubler(), f*g + sin(f*g))
+    b = map_expr_dag(Doubler(), f*g + sin(f*g))
+    assert a is b
+    assert a is (2*f)*(2*g) + sin((2*f)*(2*g))
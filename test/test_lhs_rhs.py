@@ -8,6 +8,8 @@ __authors__ = "Marie E. Rognes"
 
 import pytest
 from ufl import *
+from ufl.algorithms import compute_form_arities, compute_form_arity_parts
+from ufl.classes import Variable
 
 
 def test_lhs_rhs_simple():
@@ -71,3 +73,56 @@ def test_lhs_rhs_slightly_obscure():
     F = f * w * dx
     a, L = system(F)
     assert(len(L.integrals()) == 1)
+
+
+def test_arity_parts_computed_at_once():
+    V = FiniteElement("CG", triangle, 1)
+    v = TestFunction(V)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+
+    F = (f + u) * v * dx + f**2 * dx + inner(grad(u - f), grad(v)) * ds
+    forms = compute_form_arity_parts(F)
+    assert sorted(forms) == [0, 1, 2]
+    assert forms[0] == f**2 * dx
+    assert forms[1] == f * v * dx + inner(grad(-f), grad(v)) * ds
+    assert forms[2] == u * v * dx + inner(grad(u), grad(v)) * ds
+    assert compute_form_arities(F) == set([0, 1, 2])
+
+    a, L = system(F)
+    assert a.signature() == lhs(F).signature()
+    assert L.signature() == rhs(F).signature()
+
+    # A form of a single arity is kept
+    a = u * v * dx
+    assert compute_form_arity_parts(a, arities=[2])[2] is a
+
+
+def test_arity_parts_of_list_tensors_and_variables():
+    V = FiniteElement("CG", triangle, 1)
+    v = TestFunction(V)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+
+    w = variable(u + f)
+    label = w.label()
+    F = inner(as_vector((u, f)), grad(v)) * dx + w * v * dx
+    forms = compute_form_arity_parts(F)
+    assert forms[2] == (inner(as_vector((u, 0)), grad(v)) * dx +
+                        Variable(u, label) * v * dx)
+    assert forms[1] == (inner(as_vector((0, f)), grad(v)) * dx +
+                        Variable(f, label) * v * dx)
+
+
+def test_arity_parts_with_different_arguments():
+    V = FiniteElement("CG", triangle, 1)
+    v = TestFunction(V)
+    u = TrialFunction(V)
+    f = Coefficient(V)
+
+    with pytest.raises(UFLException):
+        compute_form_arities((u + v) * dx)
+    with pytest.raises(UFLException):
+        compute_form_arities(exp(u) * v * dx)
+    with pytest.raises(UFLException):
+        compute_form_arities(v / u * dx)
@@ -0,0 +1,125 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the linearization of expressions into scalar operations.
+"""
+
+import pytest
+
+from ufl import *
+from ufl.algorithms import compute_form_data
+from ufl.algorithms.linearize import (linearize, CELLWISE_CONSTANT,
+                                      QUADRATURE_POINT, ARGUMENT)
+from ufl.classes import (Sin, ReferenceGrad, ReferenceValue, QuadratureWeight,
+                         Indexed)
+from ufl.log import UFLException
+
+
+def test_linearize_shares_subexpressions():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    e = sin(f)*sin(f) + sin(f)*g
+    p = linearize(e)
+
+    sines = [k for k, v in enumerate(p.values) if isinstance(v, Sin)]
+    assert len(sines) == 1
+    assert p.use_counts[sines[0]] == 3
+    assert set(p.values[k] for k in p.inputs()) == set([f, g])
+    for k in p.operations():
+        assert all(j < k for j in p.operands[k])
+        assert tuple(p.values[j] for j in p.operands[k]) == p.values[k].ufl_operands
+    # The root is used once by the caller
+    root, = p.roots[0]
+    assert p.values[root] == e
+    assert p.use_counts[root] == 1
+    assert sum(p.use_counts) == sum(len(ops) for ops in p.operands) + 1
+
+
+def test_linearize_expands_index_notation():
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    w = Coefficient(V)
+    A = as_tensor(u[i]*w[j], (i, j))
+    e = A[i, j]*A[j, i] + u[i]*w[i]
+    p = linearize([e, A])
+    assert len(p.roots) == 2
+    assert len(p.roots[0]) == 1
+    assert len(p.roots[1]) == 4
+    # Only scalar nodes without free indices
+    for v in p.values:
+        assert v.ufl_shape == () and v.ufl_free_indices == ()
+    # The inputs are the components of the coefficients
+    assert set(p.values[k] for k in p.inputs()) == \
+        set([u[0], u[1], w[0], w[1]])
+
+    mapping = {u: (0.3, 0.7), w: (1.1, -0.4)}
+    x = (0.0, 0.0)
+    root, = p.roots[0]
+    assert abs(p.values[root](x, mapping) - e(x, mapping)) < 1e-14
+    for k, (c0, c1) in zip(p.roots[1], [(0, 0), (0, 1), (1, 0), (1, 1)]):
+        assert abs(p.values[k](x, mapping) - A[c0, c1](x, mapping)) < 1e-14
+
+
+def test_linearize_tags_preprocessed_integrands():
+    V = FiniteElement("CG", triangle, 2)
+    f = Coefficient(V)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    a = f*inner(grad(u), grad(v))*dx
+    fd = compute_form_data(a, do_apply_function_pullbacks=True,
+                           do_apply_integral_scaling=True,
+                           do_apply_geometry_lowering=True,
+                           preserve_geometry_types=())
+    integrand = fd.integral_data[0].integrals[0].integrand()
+    p = linearize(integrand)
+
+    partitions = p.partition()
+    assert sorted(k for ks in partitions.values() for k in ks) == list(range(len(p)))
+    for k, v in enumerate(p.values):
+        if p.is_input(k):
+            if isinstance(v, QuadratureWeight):
+                assert p.tags[k] == QUADRATURE_POINT
+            elif isinstance(v, Indexed) and isinstance(v.ufl_operands[0], ReferenceGrad):
+                terminal = v.ufl_operands[0].ufl_operands[0]
+                if isinstance(terminal, SpatialCoordinate):
+                    # The Jacobian of an affine cell
+                    assert p.tags[k] == CELLWISE_CONSTANT
+        else:
+            # Operations get the last tag of their operands
+            assert p.tags[k] == max((p.tags[j] for j in p.operands[k]),
+                                    key=[CELLWISE_CONSTANT, QUADRATURE_POINT, ARGUMENT].index)
+    root, = p.roots[0]
+    assert p.tags[root] == ARGUMENT
+    # The inverse Jacobian can be computed once per cell
+    assert any(not p.is_input(k) for k in partitions[CELLWISE_CONSTANT])
+    assert p.tags[p.values.index(QuadratureWeight(triangle))] == QUADRATURE_POINT
+    assert "return 0: t%d" % root in str(p)
+
+
+def test_linearize_tags_reference_derivatives_on_quadrilaterals():
+    cell = quadrilateral
+    domain = Mesh(VectorElement("Q", cell, 1))
+    V = FunctionSpace(domain, FiniteElement("Q", cell, 1))
+    f = Coefficient(V)
+    x = SpatialCoordinate(domain)
+    f1 = ReferenceGrad(ReferenceValue(f))
+    f2 = ReferenceGrad(f1)
+    K = ReferenceGrad(x)
+    p = linearize([f1[0], f2[0, 1], K[0, 1]])
+
+    (a,), (b,), (c,) = p.roots
+    # Bilinear functions have varying first derivatives, including the
+    # Jacobian of a quadrilateral, but constant second derivatives
+    assert p.tags[a] == QUADRATURE_POINT
+    assert p.tags[b] == CELLWISE_CONSTANT
+    assert p.tags[c] == QUADRATURE_POINT
+
+
+def test_linearize_requires_preprocessed_expressions():
+    V = VectorElement("CG", triangle, 1)
+    u = Coefficient(V)
+    with pytest.raises(UFLException):
+        linearize(inner(u, u))
+    with pytest.raises(UFLException):
+        linearize(grad(u[0]*u[1])[0])
@@ -0,0 +1,145 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test map_expr_dag with a cache shared between calls.
+"""
+
+import gc
+
+import pytest
+
+from ufl import *
+from ufl.corealg.map_dag import map_expr_dag, MapExprDagCache
+from ufl.corealg.multifunction import MultiFunction
+from ufl.algorithms.apply_algebra_lowering import apply_algebra_lowering
+from ufl.algorithms.apply_derivatives import apply_derivatives
+
+
+class CountingDoubler(MultiFunction):
+    "Replace each coefficient f by 2*f, counting the calls."
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        self.calls = 0
+
+    def expr(self, o, *ops):
+        self.calls += 1
+        return self.reuse_if_untouched(o, *ops)
+
+    def coefficient(self, o):
+        self.calls += 1
+        return 2*o
+
+
+class IdentityMap(MultiFunction):
+    expr = MultiFunction.reuse_if_untouched
+
+
+def test_map_expr_dag_reuses_cached_results():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    a = sin(f)*g
+    b = sin(f) + cos(g)
+
+    cache = MapExprDagCache()
+    mf = CountingDoubler()
+    ra = map_expr_dag(mf, a, cache=cache)
+    assert ra == sin(2*f)*(2*g)
+    n = mf.calls
+    assert n == 4
+    assert cache.misses == 4 and cache.hits == 0
+
+    # Only cos(g) and the sum are new
+    rb = map_expr_dag(mf, b, cache=cache)
+    assert rb == sin(2*f) + cos(2*g)
+    assert mf.calls == n + 2
+    assert any(x is y for x in ra.ufl_operands for y in rb.ufl_operands)
+
+    # Mapping the same expression again is free, without visiting
+    # the operands
+    hits = cache.hits
+    assert map_expr_dag(mf, a, cache=cache) is ra
+    assert mf.calls == n + 2
+    assert cache.hits == hits + 1
+
+
+def test_map_expr_dag_cache_does_not_keep_expressions_alive():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    cache = MapExprDagCache()
+    e = sin(f) + cos(f)
+    assert map_expr_dag(IdentityMap(), e, cache=cache) is e
+    assert len(cache) == 4
+    del e
+    gc.collect()
+    # Only the coefficient f is still alive
+    assert len(cache) == 1
+
+
+def test_map_expr_dag_cache_max_size():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    cache = MapExprDagCache(max_size=3)
+    mf = CountingDoubler()
+    e = sin(cos(exp(ln(f))))
+    map_expr_dag(mf, e, cache=cache)
+    assert len(cache) == 3
+    # The oldest entries were removed, but the result for e is kept
+    n = mf.calls
+    map_expr_dag(mf, e, cache=cache)
+    assert mf.calls == n
+
+
+def test_map_expr_dag_cache_max_size_keeps_recently_used_entries():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    h = Coefficient(V)
+    cache = MapExprDagCache(max_size=2)
+    cache.set(f, "f")
+    cache.set(g, "g")
+    # A hit makes f the most recently used entry, so g is removed
+    assert cache.get(f) == "f"
+    cache.set(h, "h")
+    assert len(cache) == 2
+    assert cache.get(g) is None
+    assert cache.get(f) == "f"
+    assert cache.get(h) == "h"
+    # The moved entry is still removed with its expression
+    del f
+    gc.collect()
+    assert len(cache) == 1
+
+
+def test_apply_derivatives_with_shared_cache():
+    V = FiniteElement("CG", triangle, 2)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    psi = exp(u**2)*inner(grad(u), grad(u))
+    F = apply_algebra_lowering(derivative(psi*dx, u, v))
+    J = apply_algebra_lowering(derivative(derivative(psi*dx, u, v), u))
+
+    cache = MapExprDagCache()
+    F1 = apply_derivatives(F, cache=cache)
+    J1 = apply_derivatives(J, cache=cache)
+    assert F1.signature() == apply_derivatives(F).signature()
+    assert J1.signature() == apply_derivatives(J).signature()
+    assert cache.hits > 0
+
+    # Repeated application reuses the previous results
+    assert apply_derivatives(F, cache=cache).integrals()[0].integrand() \
+        is F1.integrals()[0].integrand()
+
+
+def test_apply_derivatives_shares_gateaux_derivatives_between_integrals():
+    V = FiniteElement("CG", triangle, 2)
+    u = Coefficient(V)
+    v = TestFunction(V)
+    # Without compound operators, which are lowered with new indices
+    # for each integral
+    psi = exp(u**2)*grad(u)[0]**2 + sin(u)
+    H = derivative(derivative(psi*dx(1) + psi*dx(2), u, v), u)
+    H1 = apply_derivatives(apply_algebra_lowering(H))
+    a, b = [itg.integrand() for itg in H1.integrals()]
+    assert a is b
@@ -505,3 +505,29 @@ def test_signature_of_forms_change_with_operators(self):
                 a = f*dx
                 yield a
     check_unique_signatures(forms())
+
+
+def test_signature_is_independent_of_subexpression_sharing(self):
+    cell = triangle
+    V = FiniteElement("CG", cell, 1)
+    u = Coefficient(V)
+    v = Coefficient(V)
+    # The same expression with and without shared subexpression objects
+    w = u*v + 1
+    shared = (w*w)*dx
+    unshared = ((u*v + 1)*(v*u + 1))*dx
+    self.assertEqual(shared.signature(), unshared.signature())
+    self.assertNotEqual(shared.signature(), (((u*v + 2)*(u*v + 1))*dx).signature())
+
+
+def test_signature_of_deeply_shared_dag(self):
+    cell = triangle
+    V = FiniteElement("CG", cell, 1)
+    u = Coefficient(V)
+    # The expanded tree of this DAG has 2**100 nodes
+    f = u
+    for i in range(100):
+        f = sin(f) + f*f
+    a = f*dx
+    self.assertEqual(len(a.signature()), 128)
+    self.assertNotEqual(a.signature(), (sin(f)*dx).signature())
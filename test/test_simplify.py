@@ -5,6 +5,8 @@ import pytest
 from ufl.classes import Sum, Product
 import math
 from ufl import *
+from ufl.classes import IntValue, FloatValue, Indexed, ComponentTensor, MultiIndex, FixedIndex
+from ufl.algorithms.apply_simplification import apply_simplification
 
 
 def xtest_zero_times_argument(self):
@@ -127,3 +129,52 @@ def test_indexing(self):
     Bij2 = as_tensor(Bij, (i, j))[i, j]
     Bij3 = as_tensor(Bij, (i, j))
     assert Bij2 == Bij
+
+
+def test_apply_simplification_folds_constants_and_units():
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+    g = Coefficient(element)
+    assert apply_simplification(Product(IntValue(2), Product(IntValue(3), f))) == 6*f
+    assert apply_simplification(sin(FloatValue(0.5))*f) == math.sin(0.5)*f
+    assert apply_simplification(conditional(lt(1.0, 2.0), f, g)) == f
+    assert apply_simplification(conditional(lt(f, 2.0), g, g)) == g
+    e = Indexed(Identity(2), MultiIndex((FixedIndex(0), FixedIndex(1))))*f
+    assert apply_simplification(e + g) == g
+
+
+def test_apply_simplification_collects_like_terms():
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+    g = Coefficient(element)
+    assert apply_simplification(2*f + g - 2*f) == g
+    assert apply_simplification(2*f + 3*f) == 5*f
+    assert apply_simplification(1.0 + f + 2.0) == 3.0 + f
+    # Collecting x + x to 2*x saves nothing
+    assert apply_simplification(f + f) == f + f
+
+
+def test_apply_simplification_collapses_index_chains():
+    element = VectorElement("CG", triangle, 1)
+    u = Coefficient(element)
+    A = grad(u)
+    assert apply_simplification(ComponentTensor(A[i, j], MultiIndex((i, j)))) == A
+    B = as_tensor(A[j, i], (i, j))
+    assert apply_simplification(B[0, 1]) == A[1, 0]
+    assert apply_simplification(as_vector([u[1], u[0]])[1]) == u[0]
+    # A component tensor used once is replaced by its expression
+    # with renamed indices, but shared ones are kept
+    C = as_tensor(u[i]*u[j], (i, j))
+    assert apply_simplification(C[1, 0]*u[0]) == (u[1]*u[0])*u[0]
+    assert apply_simplification(C[1, 0]*C[0, 0]) == C[1, 0]*C[0, 0]
+
+
+def test_apply_simplification_of_forms():
+    element = FiniteElement("CG", triangle, 1)
+    f = Coefficient(element)
+    v = TestFunction(element)
+    L = (f - f)*v*dx(1) + (2*(3*f))*v*dx(2)
+    L2 = apply_simplification(L)
+    assert len(L2.integrals()) == 1
+    assert L2.integrals()[0].integrand() == (6*f)*v
+    assert apply_simplification(L2) is L2
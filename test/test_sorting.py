@@ -0,0 +1,93 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the canonical ordering of expressions.
+"""
+
+import pickle
+from functools import cmp_to_key
+
+import pytest
+
+from ufl import *
+from ufl.core.multiindex import MultiIndex
+from ufl.sorting import (cmp_expr, sorted_expr, expr_sort_key,
+                         _cmp_expr_iterative)
+
+
+def sample_expressions():
+    V = FiniteElement("CG", triangle, 1)
+    W = VectorElement("CG", triangle, 1)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    w = Coefficient(W)
+    i, j = indices(2)
+    return [f, g, u, v, f*g, g*f, f + u, u*v, f*u*v, sin(f), cos(f),
+            exp(f*g), w[0], w[1], w[i]*w[i], w[j]*w[j], grad(w)[i, j],
+            grad(w)[0, i], as_vector((f, g)), as_vector((g, f)), f**2,
+            Constant(triangle), FacetNormal(triangle)[0], f + 2.0, f + 3.0,
+            variable(f), dot(grad(f), grad(v))]
+
+
+def test_sort_key_ordering_matches_comparison():
+    exprs = sample_expressions()
+    by_key = sorted_expr(exprs)
+    by_cmp = sorted(exprs, key=cmp_to_key(_cmp_expr_iterative))
+    assert by_key == by_cmp
+    for a in exprs:
+        for b in exprs:
+            assert cmp_expr(a, b) == _cmp_expr_iterative(a, b)
+
+
+def test_sort_key_ignores_index_counts():
+    V = VectorElement("CG", triangle, 1)
+    w = Coefficient(V)
+    i, j = indices(2)
+    assert expr_sort_key(w[i]*w[i]) == expr_sort_key(w[j]*w[j])
+    assert cmp_expr(w[i]*w[i], w[j]*w[j]) == 0
+    assert cmp_expr(w[0], w[i]) < 0
+
+
+def test_sort_key_orders_multi_indices_with_equal_prefix_by_length():
+    i, j = indices(2)
+    ii = MultiIndex((i,))
+    ij = MultiIndex((i, j))
+    # These were undecided by the tree comparison before the sort
+    # keys; the shorter now sorts first in both comparisons
+    assert expr_sort_key(ii) < expr_sort_key(ij)
+    assert cmp_expr(ii, ij) == _cmp_expr_iterative(ii, ij) == -1
+    assert cmp_expr(ij, ii) == _cmp_expr_iterative(ij, ii) == 1
+
+
+def test_sort_key_is_cached_and_not_pickled():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    e = sin(f)*f
+    key = expr_sort_key(e)
+    assert expr_sort_key(e) is key
+    assert e.ufl_operands[0]._sort_key is not None
+
+    e2 = pickle.loads(pickle.dumps(e))
+    assert e2 == e
+    assert e2._sort_key is None
+    assert expr_sort_key(e2) == key
+
+
+def test_cmp_expr_of_deep_chains():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    a = f
+    b = f
+    for k in range(5000):
+        a = sin(a)
+        b = sin(b)
+    b = cos(b)
+    # Keys are computed without recursion, and comparing them falls
+    # back to the iterative comparison if nested too deep
+    expr_sort_key(a)
+    assert cmp_expr(a, a) == 0
+    assert cmp_expr(a, b) == _cmp_expr_iterative(a, b)
+    assert sorted_expr([b, a]) == sorted(
+        [b, a], key=cmp_to_key(_cmp_expr_iterative))
@@ -0,0 +1,120 @@
+#!/usr/bin/env py.test
+# -*- coding: utf-8 -*-
+"""
+Test the cached type masks of expressions.
+"""
+
+import pickle
+
+import pytest
+
+from ufl import *
+from ufl.core.expr import Expr
+from ufl.corealg.traversal import pre_traversal, traverse_unique_terminals
+from ufl.classes import (Grad, Sin, Product, Terminal, Operator,
+                         FormArgument, MathFunction, Division)
+from ufl.corealg.typemask import (expr_type_mask, types_mask, contains_type,
+                                  unique_pre_traversal_of_types)
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.corealg.multifunction import MultiFunction
+from ufl.algorithms.analysis import has_type, has_exact_type, extract_type
+
+
+@pytest.fixture
+def expr():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    v = TestFunction(V)
+    return sin(f)*v + grad(f)[0]
+
+
+def test_type_mask_of_expression(expr):
+    mask = expr_type_mask(expr)
+    assert expr._type_mask == mask
+    for tc, cls in enumerate(Expr._ufl_all_classes_):
+        found = any(o._ufl_typecode_ == tc for o in pre_traversal(expr))
+        assert bool(mask & (1 << tc)) == found, cls
+
+
+def test_contains_type(expr):
+    assert contains_type(expr, Grad)
+    assert contains_type(expr, (Division, Sin))
+    assert contains_type(expr, MathFunction)
+    assert not contains_type(expr, MathFunction, exact=True)
+    assert not contains_type(expr, Division)
+    product, = [o for o in expr.ufl_operands if isinstance(o, Product)]
+    assert not contains_type(product, Grad)
+    assert types_mask(Operator) & types_mask(Terminal) == 0
+
+
+def test_has_type_and_extract_type(expr):
+    assert has_type(expr, Grad)
+    assert has_type(expr, Argument)
+    assert not has_type(expr, Division)
+    assert has_exact_type(expr, Sin)
+    assert not has_exact_type(expr, MathFunction)
+    assert extract_type(expr, Sin) == set(o for o in pre_traversal(expr) if isinstance(o, Sin))
+    assert len(extract_type(expr, FormArgument)) == 2
+
+
+def test_has_type_of_class_defined_outside_ufl(expr):
+    class MyCoefficient(Coefficient):
+        pass
+
+    assert not has_type(expr, MyCoefficient)
+    V = FiniteElement("CG", triangle, 1)
+    g = MyCoefficient(V)
+    assert has_type(expr*g, MyCoefficient)
+    assert extract_type(expr*g, MyCoefficient) == set([g])
+
+
+def test_pruned_traversal(expr):
+    nodes = list(unique_pre_traversal_of_types(expr, Grad))
+    assert all(contains_type(o, Grad) for o in nodes)
+    assert not any(isinstance(o, Sin) for o in nodes)
+    assert any(isinstance(o, Grad) for o in nodes)
+
+
+def test_map_expr_dag_skips_subexpressions_without_transformed_types(expr):
+    class SinToCos(MultiFunction):
+        transformed_types = (Sin,)
+        expr = MultiFunction.reuse_if_untouched
+
+        def __init__(self):
+            MultiFunction.__init__(self)
+            self.visited = []
+
+        def sin(self, o, f):
+            return cos(f)
+
+        def terminal(self, o):
+            self.visited.append(o)
+            return o
+
+    mf = SinToCos()
+    r = map_expr_dag(mf, expr)
+    f, = [o for o in traverse_unique_terminals(expr) if isinstance(o, Coefficient)]
+    v, = [o for o in traverse_unique_terminals(expr) if isinstance(o, Argument)]
+    assert r == cos(f)*v + grad(f)[0]
+    # Only sin and the nodes above it are visited
+    assert mf.visited == []
+
+
+def test_type_mask_is_not_pickled(expr):
+    expr_type_mask(expr)
+    expr2 = pickle.loads(pickle.dumps(expr))
+    assert expr2 == expr
+    assert expr2._type_mask is None
+    assert expr_type_mask(expr2) == expr_type_mask(expr)
+
+
+def test_replace_skips_unaffected_subexpressions():
+    V = FiniteElement("CG", triangle, 1)
+    f = Coefficient(V)
+    g = Coefficient(V)
+    h = Coefficient(V)
+    a = exp(f)*g
+    b = replace(a + sin(h), {h: f})
+    assert b == a + sin(f)
+    assert a in b.ufl_operands
+    assert replace(a, {h: f}) is a
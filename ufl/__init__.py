@@ -165,6 +165,11 @@ A very brief overview of the language contents follows:
     - elem_pow
     - elem_op
 
+* Sums and products of many operands::
+
+    - balanced_sum
+    - balanced_product
+
 * Differential operators::
 
     - variable
@@ -216,6 +221,12 @@ A very brief overview of the language contents follows:
     - energy_norm,
     - sensitivity_rhs
     - derivative
+    - derivatives
+    - block_split, extract_blocks
+
+* Evaluation::
+
+    - evaluate_batch
 """
 
 # Copyright (C) 2008-2016 Martin Sandve Alnæs and Anders Logg
@@ -330,7 +341,8 @@ from ufl.operators import rank, shape, \
                        variable, diff, \
                        Dx,  grad, div, curl, rot, nabla_grad, nabla_div, Dn, exterior_derivative, \
                        jump, avg, cell_avg, facet_avg, \
-                       elem_mult, elem_div, elem_pow, elem_op
+                       elem_mult, elem_div, elem_pow, elem_op, \
+                       balanced_sum, balanced_product
 
 # Measure classes
 from ufl.measure import Measure, register_integral_type, integral_types, custom_integral_types
@@ -346,8 +358,11 @@ from ufl.integral import Integral
 import ufl.measureoperators as __measureoperators
 
 # Representations of transformed forms
-from ufl.formoperators import replace, derivative, action, energy_norm, rhs, lhs,\
-    system, functional, adjoint, sensitivity_rhs, block_split #, dirichlet_functional
+from ufl.formoperators import replace, derivative, derivatives, action, energy_norm, rhs, lhs,\
+    system, functional, adjoint, sensitivity_rhs, block_split, extract_blocks #, dirichlet_functional
+
+# Evaluation of expressions at many points
+from ufl.algorithms.batch_evaluation import evaluate_batch
 
 # Predefined convenience objects
 from ufl.objects import (
@@ -408,10 +423,12 @@ __all__ = as_native_strings([
     'Dx', 'grad', 'div', 'curl', 'rot', 'nabla_grad', 'nabla_div', 'Dn', 'exterior_derivative',
     'jump', 'avg', 'cell_avg', 'facet_avg',
     'elem_mult', 'elem_div', 'elem_pow', 'elem_op',
+    'balanced_sum', 'balanced_product',
     'Form',
     'Integral', 'Measure', 'register_integral_type', 'integral_types', 'custom_integral_types',
-    'replace', 'replace_integral_domains', 'derivative', 'action', 'energy_norm', 'rhs', 'lhs', 'block_split',
+    'replace', 'replace_integral_domains', 'derivative', 'derivatives', 'action', 'energy_norm', 'rhs', 'lhs', 'block_split', 'extract_blocks',
     'system', 'functional', 'adjoint', 'sensitivity_rhs',
+    'evaluate_batch',
     'dx', 'ds', 'dS', 'dP',
     'dc', 'dC', 'dO', 'dI', 'dX',
     'ds_b', 'ds_t', 'ds_tb', 'ds_v', 'dS_h', 'dS_v',
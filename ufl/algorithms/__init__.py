@@ -62,8 +62,11 @@ __all__ = as_native_strings([
     "compute_form_lhs",
     "compute_form_rhs",
     "compute_form_functional",
+    "compute_form_system",
+    "compute_form_arity_parts",
     "compute_form_signature",
     "tree_format",
+    "compile_callable",
     ])
 
 # Utilities for traversing over expression trees in different ways
@@ -121,13 +124,18 @@ from ufl.algorithms.formtransformations import compute_energy_norm
 from ufl.algorithms.formtransformations import compute_form_lhs
 from ufl.algorithms.formtransformations import compute_form_rhs
 from ufl.algorithms.formtransformations import compute_form_functional
+from ufl.algorithms.formtransformations import compute_form_system
 from ufl.algorithms.formtransformations import compute_form_arities
+from ufl.algorithms.formtransformations import compute_form_arity_parts
 
 from ufl.algorithms.formsplitter import FormSplitter
 
 # Utilities for Automatic Functional Differentiation
 from ufl.algorithms.ad import expand_derivatives
 
+# Utilities for evaluating expressions
+from ufl.algorithms.numpy_callables import compile_callable
+
 # Utilities for form file handling
 from ufl.algorithms.formfiles import read_ufl_file
 from ufl.algorithms.formfiles import load_ufl_file
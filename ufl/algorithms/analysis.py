@@ -31,6 +31,7 @@ from ufl.argument import Argument
 from ufl.coefficient import Coefficient
 from ufl.algorithms.traversal import iter_expressions
 from ufl.corealg.traversal import unique_pre_traversal, traverse_unique_terminals
+from ufl.corealg.typemask import contains_type, unique_pre_traversal_of_types
 
 
 # TODO: Some of these can possibly be optimised by implementing
@@ -70,32 +71,26 @@ def extract_type(a, ufl_type):
                    for o in traverse_unique_terminals(e)
                    if isinstance(o, ufl_type))
     else:
+        # Skip subtrees not containing ufl_type
+        visited = set()
         return set(o for e in iter_expressions(a)
-                   for o in unique_pre_traversal(e)
+                   for o in unique_pre_traversal_of_types(e, ufl_type, visited)
                    if isinstance(o, ufl_type))
 
 
 def has_type(a, ufl_type):
     """Return if an object of class ufl_type can be found in a.
     The argument a can be a Form, Integral or Expr."""
-    if issubclass(ufl_type, Terminal):
-        # Optimization
-        traversal = traverse_unique_terminals
-    else:
-        traversal = unique_pre_traversal
-    return any(isinstance(o, ufl_type) for e in iter_expressions(a) for o in traversal(e))
+    if ufl_type._ufl_class_ is ufl_type:
+        # The type mask is exact for UFL classes
+        return any(contains_type(e, ufl_type) for e in iter_expressions(a))
+    return bool(extract_type(a, ufl_type))
 
 
 def has_exact_type(a, ufl_type):
     """Return if an object of class ufl_type can be found in a.
     The argument a can be a Form, Integral or Expr."""
-    tc = ufl_type._ufl_typecode_
-    if issubclass(ufl_type, Terminal):
-        # Optimization
-        traversal = traverse_unique_terminals
-    else:
-        traversal = unique_pre_traversal
-    return any(o._ufl_typecode_ == tc for e in iter_expressions(a) for o in traversal(e))
+    return any(contains_type(e, ufl_type, exact=True) for e in iter_expressions(a))
 
 
 def extract_arguments(a):
@@ -23,13 +23,13 @@ from ufl.log import error, warning
 
 from ufl.core.expr import ufl_err_str
 from ufl.core.terminal import Terminal
-from ufl.core.multiindex import MultiIndex, FixedIndex, indices
+from ufl.core.multiindex import MultiIndex, FixedIndex, Index, indices
 
 from ufl.tensors import as_tensor, as_scalar, as_scalars, unit_indexed_tensor, unwrap_list_tensor
 
-from ufl.classes import ConstantValue, Identity, Zero, FloatValue
+from ufl.classes import ConstantValue, Identity, Zero, FloatValue, IntValue, ScalarValue
 from ufl.classes import Coefficient, FormArgument, ReferenceValue
-from ufl.classes import Grad, ReferenceGrad, Variable
+from ufl.classes import Derivative, Grad, ReferenceGrad, Variable
 from ufl.classes import Indexed, ListTensor, ComponentTensor
 from ufl.classes import ExprList, ExprMapping
 from ufl.classes import Product, Sum, IndexSum
@@ -37,7 +37,8 @@ from ufl.classes import JacobianInverse
 from ufl.classes import SpatialCoordinate
 
 from ufl.constantvalue import is_true_ufl_scalar, is_ufl_scalar
-from ufl.operators import (conditional, sign,
+from ufl.index_combination_utils import merge_unique_indices
+from ufl.operators import (conditional, sign, balanced_sum,
                            sqrt, exp, ln, cos, sin, cosh, sinh,
                            bessel_J, bessel_Y, bessel_I, bessel_K,
                            cell_avg, facet_avg)
@@ -45,10 +46,12 @@ from ufl.operators import (conditional, sign,
 from math import pi
 
 from ufl.corealg.multifunction import MultiFunction
-from ufl.corealg.map_dag import map_expr_dag
+from ufl.corealg.map_dag import map_expr_dag, MapExprDagCache
+from ufl.corealg.traversal import unique_post_traversal
 from ufl.algorithms.map_integrands import map_integrand_dags
 
 from ufl.checks import is_cellwise_constant
+from ufl.corealg.dependencies import depends_on, is_spatially_independent
 
 # TODO: Add more rulesets?
 # - DivRuleset
@@ -104,6 +107,17 @@ class GenericDerivativeRuleset(MultiFunction):
         "Return a zero with the right shape and indices for operators independent of differentiation variable."
         return Zero(o.ufl_shape + self._var_shape, o.ufl_free_indices, o.ufl_index_dimensions)
 
+    def _is_independent(self, o):
+        "Return whether operator o is known to be independent of the differentiation variable."
+        return False
+
+    def shortcut(self, o):
+        """Return zero for operators known to be independent of the
+        differentiation variable, to skip their operands in map_expr_dag."""
+        if o._ufl_is_terminal_ or not self._is_independent(o):
+            return None
+        return self.independent_operator(o)
+
     # --- All derivatives need to define grad and averaging
 
     grad = override
@@ -179,6 +193,12 @@ class GenericDerivativeRuleset(MultiFunction):
         if isinstance(Ap, Zero):
             return self.independent_operator(o)
 
+        # Pick components of list tensors directly, such that zero
+        # components, e.g. of variations of mixed coefficients,
+        # are propagated as zeros
+        if isinstance(Ap, ListTensor) and isinstance(ii[0], FixedIndex):
+            return Ap[ii]
+
         # Untangle as_tensor(C[kk], jj)[ii] -> C[ll] to simplify
         # resulting expression
         if isinstance(Ap, ComponentTensor):
@@ -476,6 +496,9 @@ class GradRuleset(GenericDerivativeRuleset):
         GenericDerivativeRuleset.__init__(self, var_shape=(geometric_dimension,))
         self._Id = Identity(geometric_dimension)
 
+    def _is_independent(self, o):
+        return is_spatially_independent(o)
+
     # --- Specialized rules for geometric quantities
 
     def geometric_quantity(self, o):
@@ -586,6 +609,9 @@ class ReferenceGradRuleset(GenericDerivativeRuleset):
                                           var_shape=(topological_dimension,))
         self._Id = Identity(topological_dimension)
 
+    def _is_independent(self, o):
+        return is_spatially_independent(o)
+
     # --- Specialized rules for geometric quantities
 
     def geometric_quantity(self, o):
@@ -773,6 +799,14 @@ class GateauxDerivativeRuleset(GenericDerivativeRuleset):
         cd = coefficient_derivatives.ufl_operands
         self._cd = {cd[2*i]: cd[2*i+1] for i in range(len(cd)//2)}
 
+        # The form arguments with nonzero derivatives
+        self._dependencies = set(w.ufl_operands[0] if isinstance(w, Indexed) else w
+                                 for w in self._w)
+        self._dependencies.update(self._cd)
+
+    def _is_independent(self, o):
+        return not depends_on(o, self._dependencies)
+
     # Explicitly defining dg/dw == 0
     geometric_quantity = GenericDerivativeRuleset.independent_terminal
 
@@ -935,10 +969,22 @@ class GateauxDerivativeRuleset(GenericDerivativeRuleset):
 
                 elif isinstance(v, ListTensor):
                     # Case: d/dt [w + t <...,v,...>]
+                    # Place the gradients of the nonzero components in
+                    # a list tensor, with zeros for the other ones
+                    gshape = g.ufl_shape[len(wshape):]
+                    gcomps = {}
                     for wcomp, vsub in unwrap_list_tensor(v):
                         if not isinstance(vsub, Zero):
                             vval, vcomp = analyse_variation_argument(vsub)
-                            gprimesum = gprimesum + compute_gprimeterm(ngrads, vval, vcomp, wshape, wcomp)
+                            kk = indices(ngrads)
+                            gcomps[wcomp] = as_tensor(apply_grads(vval)[vcomp+kk], kk)
+
+                    def build_list_tensor(wcomp):
+                        if len(wcomp) == len(wshape):
+                            return gcomps.get(wcomp, Zero(gshape))
+                        return ListTensor(*[build_list_tensor(wcomp + (k,))
+                                            for k in range(wshape[len(wcomp)])])
+                    gprimesum = gprimesum + build_list_tensor(())
 
                 else:
                     if wshape != ():
@@ -1008,8 +1054,19 @@ class GateauxDerivativeRuleset(GenericDerivativeRuleset):
 
 
 class DerivativeRuleDispatcher(MultiFunction):
-    def __init__(self):
+    # Subexpressions without derivatives are left untouched
+    transformed_types = (Derivative,)
+
+    def __init__(self, cache=None):
         MultiFunction.__init__(self)
+        # Derivatives of subexpressions shared by different derivative
+        # nodes are computed once, using a cache for each ruleset and
+        # differentiation variable. In particular the inner derivative
+        # of nested Gateaux derivatives, e.g. a Hessian, is computed
+        # once for all integrals
+        if cache is None:
+            cache = MapExprDagCache()
+        self._cache = cache
 
     def terminal(self, o):
         return o
@@ -1021,11 +1078,13 @@ class DerivativeRuleDispatcher(MultiFunction):
 
     def grad(self, o, f):
         rules = GradRuleset(o.ufl_shape[-1])
-        return map_expr_dag(rules, f)
+        cache = self._cache.subcache((GradRuleset, o.ufl_shape[-1]))
+        return map_expr_dag(rules, f, cache=cache)
 
     def reference_grad(self, o, f):
         rules = ReferenceGradRuleset(o.ufl_shape[-1])  # FIXME: Look over this and test better.
-        return map_expr_dag(rules, f)
+        cache = self._cache.subcache((ReferenceGradRuleset, o.ufl_shape[-1]))
+        return map_expr_dag(rules, f, cache=cache)
 
     def variable_derivative(self, o, f, dummy_v):
         rules = VariableRuleset(o.ufl_operands[1])
@@ -1034,13 +1093,18 @@ class DerivativeRuleDispatcher(MultiFunction):
     def coefficient_derivative(self, o, f, dummy_w, dummy_v, dummy_cd):
         dummy, w, v, cd = o.ufl_operands
         rules = GateauxDerivativeRuleset(w, v, cd)
-        return map_expr_dag(rules, f)
+        cache = self._cache.subcache((GateauxDerivativeRuleset, w, v, cd))
+        return map_expr_dag(rules, f, cache=cache)
 
     def indexed(self, o, Ap, ii):  # TODO: (Partially) duplicated in generic rules
         # Reuse if untouched
         if Ap is o.ufl_operands[0]:
             return o
 
+        # Pick components of list tensors directly
+        if isinstance(Ap, ListTensor) and isinstance(ii[0], FixedIndex):
+            return Ap[ii]
+
         # Untangle as_tensor(C[kk], jj)[ii] -> C[ll] to simplify
         # resulting expression
         if isinstance(Ap, ComponentTensor):
@@ -1066,6 +1130,222 @@ class DerivativeRuleDispatcher(MultiFunction):
         return op
 
 
-def apply_derivatives(expression):
-    rules = DerivativeRuleDispatcher()
-    return map_integrand_dags(rules, expression)
+def apply_derivatives(expression, cache=None):
+    """Apply the differentiation rules to all derivative nodes in the
+    integrands of *expression*, a Form, Integral or Expr.
+
+    If a ``MapExprDagCache`` *cache* is given, it is used to reuse the
+    results of previous calls with the same cache for shared
+    subexpressions, e.g. when differentiating the residual and the
+    Jacobian of a nonlinear problem.
+    """
+    if cache is None:
+        # Share the derivatives of subexpressions between integrals
+        cache = MapExprDagCache()
+    rules = DerivativeRuleDispatcher(cache)
+    return map_integrand_dags(rules, expression, cache=cache)
+
+
+# --- Reverse mode differentiation of scalar expressions
+
+def _sum_free_indices(f, keep=()):
+    "Sum *f* over its free indices, except those with counts in *keep*."
+    for i in f.ufl_free_indices:
+        if i not in keep:
+            f = IndexSum(f, MultiIndex((Index(i),)))
+    return f
+
+
+def _broadcast_free_indices(f, fi, fid):
+    "Extend *f* to be constant along the free indices *fi* it lacks."
+    missing = [(i, d) for i, d in zip(fi, fid) if i not in f.ufl_free_indices]
+    if not missing:
+        return f
+    f, jj = as_scalar(f)
+    for i, d in missing:
+        ones = ListTensor(*[IntValue(1)]*d)
+        f = Product(f, Indexed(ones, MultiIndex((Index(i),))))
+    if jj:
+        f = as_tensor(f, jj)
+    return f
+
+
+def _accumulate_adjoint(contributions):
+    "Sum the contributions to an adjoint, which may lack free indices."
+    if len(contributions) == 1:
+        return contributions[0]
+    fi, fid = (), ()
+    for c in contributions:
+        fi, fid = merge_unique_indices(fi, fid, c.ufl_free_indices,
+                                       c.ufl_index_dimensions)
+    return balanced_sum(_broadcast_free_indices(c, fi, fid)
+                        for c in contributions)
+
+
+def _contract_adjoint(a, d):
+    "Return the sum over all components and free indices of a*d."
+    if d.ufl_shape:
+        kk = indices(len(d.ufl_shape))
+        a, d = a[kk], d[kk]
+    return _sum_free_indices(Product(a, d))
+
+
+class ReverseDerivativeRuleset(MultiFunction):
+    """Rules propagating the adjoint *a* of an expression *o*, that is
+    the derivative of some scalar expression with respect to *o*,
+    to the operands of *o*.
+
+    The adjoint has the shape of *o* and a subset of its free indices,
+    being constant along the others. Each handler returns a tuple
+    with the contribution to the adjoint of each operand, with None
+    for no contribution, or None if *o* must be differentiated in
+    forward mode instead.
+    """
+    def __init__(self):
+        MultiFunction.__init__(self)
+        # Forward rules, reused for the elementary functions
+        self._forward = GenericDerivativeRuleset(var_shape=())
+
+    def expr(self, o, a):
+        return None
+
+    def variable(self, o, a):
+        return (a, None)
+
+    def sum(self, o, a):
+        return (a, a)
+
+    def product(self, o, a):
+        f, g = o.ufl_operands
+        return (_sum_free_indices(Product(a, g), f.ufl_free_indices),
+                _sum_free_indices(Product(a, f), g.ufl_free_indices))
+
+    def division(self, o, a):
+        f, g = o.ufl_operands
+        if not is_true_ufl_scalar(g):
+            return None
+        return (a / g, -_sum_free_indices(Product(a, o)) / g)
+
+    def power(self, o, a):
+        f, g = o.ufl_operands
+        zero = Zero()
+        if isinstance(g, ScalarValue):
+            return (self._forward(o, a, zero), None)
+        return (self._forward(o, a, zero), self._forward(o, zero, a))
+
+    def abs(self, o, a):
+        if o.ufl_shape:
+            return None
+        f, = o.ufl_operands
+        return (Product(a, sign(f)),)
+
+    def math_function(self, o, a):
+        return (self._forward(o, a),)
+
+    def atan_2(self, o, a):
+        zero = Zero()
+        return (self._forward(o, a, zero), self._forward(o, zero, a))
+
+    def bessel_function(self, o, a):
+        return (None, self._forward(o, None, a))
+
+    def conditional(self, o, a):
+        c = o.ufl_operands[0]
+        zero = Zero(a.ufl_shape, a.ufl_free_indices, a.ufl_index_dimensions)
+        return (None, conditional(c, a, zero), conditional(c, zero, a))
+
+    def max_value(self, o, a):
+        f, g = o.ufl_operands
+        dc = conditional(f > g, 1, 0)
+        return (dc*a, (1.0 - dc)*a)
+
+    def min_value(self, o, a):
+        f, g = o.ufl_operands
+        dc = conditional(f < g, 1, 0)
+        return (dc*a, (1.0 - dc)*a)
+
+    def indexed(self, o, a):
+        A, ii = o.ufl_operands
+        # Place a in the component ii of a tensor shaped like A,
+        # using the free indices of ii directly where possible
+        jj = []
+        for i, d in zip(ii, A.ufl_shape):
+            if (isinstance(i, Index) and i not in jj and
+                    i.count() not in A.ufl_free_indices):
+                a = _broadcast_free_indices(a, (i.count(),), (d,))
+                jj.append(i)
+            else:
+                j = Index()
+                a = Product(a, Identity(d)[i, j])
+                jj.append(j)
+        keep = A.ufl_free_indices + tuple(j.count() for j in jj)
+        a = _sum_free_indices(a, keep)
+        return (as_tensor(a, tuple(jj)), None)
+
+    def component_tensor(self, o, a):
+        A, ii = o.ufl_operands
+        return (Indexed(a, ii), None)
+
+    def index_sum(self, o, a):
+        return (a, None)
+
+    def list_tensor(self, o, a):
+        # The components are subtensors of one rank lower
+        rest = (slice(None),)*(len(o.ufl_shape) - 1)
+        return tuple(a[(k,) + rest] for k in range(len(o.ufl_operands)))
+
+
+def compute_reverse_derivatives(expression, coefficients, arguments):
+    """Compute the Gateaux derivatives D_w[v](e) of the scalar
+    *expression* e for each coefficient w in *coefficients* and the
+    corresponding argument v in *arguments*, in a single reverse sweep.
+
+    The adjoints of the subexpressions are computed once and shared by
+    all derivatives, while the subexpressions without reverse rules,
+    such as gradients of coefficients and restrictions, are
+    differentiated in forward mode. The expression must not contain
+    derivatives or compound algebra operators, see
+    ``apply_derivatives`` and ``apply_algebra_lowering``.
+
+    Returns a list with one expression for each coefficient.
+    """
+    if expression.ufl_shape or expression.ufl_free_indices:
+        error("Expecting a scalar expression without free indices in "
+              "reverse mode differentiation.")
+    coefficients = tuple(coefficients)
+    arguments = tuple(arguments)
+    if len(coefficients) != len(arguments):
+        error("Expecting one argument for each coefficient.")
+    dependencies = set(coefficients)
+
+    # Forward rules and results for each coefficient
+    forward = [GateauxDerivativeRuleset(ExprList(w), ExprList(v), ExprMapping())
+               for w, v in zip(coefficients, arguments)]
+    caches = [MapExprDagCache() for w in coefficients]
+    terms = [[] for w in coefficients]
+
+    # Visit the nodes depending on the coefficients, each after all
+    # nodes using it, accumulating adjoints from the root
+    nodes = [o for o in unique_post_traversal(expression)
+             if depends_on(o, dependencies)]
+    rules = ReverseDerivativeRuleset()
+    adjoints = {expression: [FloatValue(1.0)]}
+    for o in reversed(nodes):
+        contributions = adjoints.pop(o, None)
+        if contributions is None:
+            continue
+        a = _accumulate_adjoint(contributions)
+        ops = rules(o, a)
+        if ops is None:
+            for k, w in enumerate(coefficients):
+                if depends_on(o, (w,)):
+                    d = map_expr_dag(forward[k], o, cache=caches[k])
+                    if not isinstance(d, Zero):
+                        terms[k].append(_contract_adjoint(a, d))
+            continue
+        for f, c in zip(o.ufl_operands, ops):
+            if (c is not None and not isinstance(c, Zero) and
+                    depends_on(f, dependencies)):
+                adjoints.setdefault(f, []).append(c)
+
+    return [balanced_sum(t) for t in terms]
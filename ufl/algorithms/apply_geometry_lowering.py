@@ -496,6 +496,8 @@ def apply_geometry_lowering(form, preserve_types=()):
 
         mf = GeometryLoweringApplier(preserve_types)
         newintegrand = map_expr_dag(mf, integral.integrand())
+        if newintegrand is integral.integrand():
+            return integral
         return integral.reconstruct(integrand=newintegrand)
 
     elif isinstance(form, Expr):
@@ -20,7 +20,10 @@
 
 
 from ufl.log import error
-from ufl.classes import Restricted
+from ufl.classes import (Restricted, SpatialCoordinate, FacetJacobian,
+                         FacetJacobianDeterminant, FacetJacobianInverse,
+                         FacetArea, MinFacetEdgeLength, MaxFacetEdgeLength,
+                         FacetOrigin)
 from ufl.corealg.multifunction import MultiFunction
 from ufl.corealg.map_dag import map_expr_dag
 from ufl.algorithms.map_integrands import map_integrand_dags
@@ -180,6 +183,13 @@ def apply_restrictions(expression):
 
 
 class DefaultRestrictionApplier(MultiFunction):
+    # Subexpressions without the terminals restricted by default
+    # below are left untouched
+    transformed_types = (SpatialCoordinate, FacetJacobian,
+                         FacetJacobianDeterminant, FacetJacobianInverse,
+                         FacetArea, MinFacetEdgeLength, MaxFacetEdgeLength,
+                         FacetOrigin)
+
     def __init__(self, side=None):
         MultiFunction.__init__(self)
         self.current_restriction = side
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""This module contains the apply_simplification algorithm, which
+shrinks integrands with local algebraic rewrite rules before code
+generation."""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from ufl.log import error
+from ufl.core.expr import Expr
+from ufl.core.multiindex import MultiIndex, FixedIndex
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.corealg.traversal import unique_pre_traversal
+from ufl.algorithms.map_integrands import map_integrands
+from ufl.constantvalue import Zero, ScalarValue, Identity, as_ufl
+from ufl.algebra import Sum, Product
+from ufl.indexed import Indexed
+from ufl.tensors import ListTensor, ComponentTensor
+from ufl.conditional import BinaryCondition, AndCondition, OrCondition, NotCondition
+
+
+def _is_literal(e):
+    "Return whether *e* is a scalar literal without free indices."
+    return isinstance(e, ScalarValue) or (isinstance(e, Zero) and
+                                          e.ufl_shape == () and
+                                          not e.ufl_free_indices)
+
+
+def _is_literal_condition(c):
+    "Return whether the condition *c* compares literals only."
+    if isinstance(c, BinaryCondition):
+        return all(_is_literal(op) for op in c.ufl_operands)
+    elif isinstance(c, (AndCondition, OrCondition, NotCondition)):
+        return all(_is_literal_condition(op) for op in c.ufl_operands)
+    return False
+
+
+def _split_factor(e):
+    "Split *e* into a literal factor and the remaining term."
+    if isinstance(e, Product):
+        a, b = e.ufl_operands
+        # Product places a scalar literal operand first
+        if isinstance(a, ScalarValue):
+            return a._value, b
+    return 1, e
+
+
+class IndexRenamer(MultiFunction):
+    """Replace free indices of an expression according to *mapping*,
+    from ``Index`` objects to ``Index`` or ``FixedIndex`` objects.
+
+    Sets ``conflict`` if an index sum or component tensor in the
+    expression binds one of the new indices, in which case the result
+    must not be used."""
+
+    def __init__(self, mapping):
+        MultiFunction.__init__(self)
+        self.mapping = mapping
+        self._counts = frozenset(i.count() for i in mapping)
+        self._new_counts = frozenset(i.count() for i in mapping.values()
+                                     if not isinstance(i, FixedIndex))
+        self.conflict = False
+
+    def shortcut(self, o):
+        # Subexpressions without the replaced indices are unchanged
+        if isinstance(o, MultiIndex):
+            return None
+        if self._counts.isdisjoint(o.ufl_free_indices):
+            return o
+        return None
+
+    expr = MultiFunction.reuse_if_untouched
+
+    def terminal(self, o):
+        return o
+
+    def multi_index(self, o):
+        mapping = self.mapping
+        if not any(i in mapping for i in o):
+            return o
+        return MultiIndex(tuple(mapping.get(i, i) for i in o))
+
+    def _binding(self, o, A, ii):
+        if any(i.count() in self._new_counts for i in o.ufl_operands[1]):
+            self.conflict = True
+        return self.reuse_if_untouched(o, A, ii)
+
+    index_sum = _binding
+    component_tensor = _binding
+
+
+class SimplificationRuleset(MultiFunction):
+    """Local algebraic rewrite rules applied bottom-up.
+
+    The rules fold constants, eliminate unit factors and repeated
+    literal factors, collapse chains of ``Indexed`` and
+    ``ComponentTensor`` nodes, renaming the indices of component
+    tensors used once to those they are indexed with, pick fixed
+    components of list tensors and identities, fold conditionals with
+    literal conditions or equal branches, and collect like terms of
+    scalar sums. Each rule
+    replaces a node by an equivalent expression with fewer operators.
+    """
+
+    def __init__(self, use_counts=None):
+        MultiFunction.__init__(self)
+        # Number of parents of each node of the input expression, if
+        # known, to avoid copying shared subexpressions
+        self.use_counts = use_counts
+
+    expr = MultiFunction.reuse_if_untouched
+
+    def terminal(self, o):
+        return o
+
+    # --- Constant folding
+
+    def _fold_literals(self, o, *ops):
+        "Evaluate *o* if all its operands are literals."
+        r = self.reuse_if_untouched(o, *ops)
+        if (isinstance(r, Expr) and not r._ufl_is_terminal_ and
+                all(_is_literal(op) for op in r.ufl_operands)):
+            try:
+                return as_ufl(r.evaluate(None, {}, (), {}))
+            except (ValueError, ArithmeticError):
+                # Keep an invalid operation for the user to find
+                pass
+        return r
+
+    math_function = _fold_literals
+    abs = _fold_literals
+    power = _fold_literals
+    atan_2 = _fold_literals
+    min_value = _fold_literals
+    max_value = _fold_literals
+
+    def conditional(self, o, c, t, f):
+        if t == f:
+            return t
+        if _is_literal_condition(c):
+            return t if c.evaluate(None, {}, (), {}) else f
+        return self.reuse_if_untouched(o, c, t, f)
+
+    # --- Unit elimination and literal factors
+
+    def product(self, o, a, b):
+        r = self.reuse_if_untouched(o, a, b)
+        if isinstance(r, Product):
+            # c1*(c2*x) -> (c1*c2)*x
+            a, b = r.ufl_operands
+            if isinstance(a, ScalarValue) and isinstance(b, Product):
+                c, x = _split_factor(b)
+                if c != 1:
+                    return Product(as_ufl(a._value * c), x)
+        return r
+
+    # --- Like term collection
+
+    def sum(self, o, a, b):
+        r = self.reuse_if_untouched(o, a, b)
+        if not isinstance(r, Sum) or r.ufl_shape != ():
+            return r
+
+        # Collect the terms of the chain of sums with their literal
+        # factors, keeping the first ordering of the terms
+        factors = {}
+        terms = []
+        num_terms = 0
+        num_products = 0
+        constant = 0
+        num_constants = 0
+        stack = [r]
+        while stack:
+            e = stack.pop()
+            if isinstance(e, Sum):
+                stack.extend(reversed(e.ufl_operands))
+            elif isinstance(e, ScalarValue):
+                constant += e._value
+                num_constants += 1
+            else:
+                num_terms += 1
+                c, t = _split_factor(e)
+                num_products += c != 1
+                if t in factors:
+                    factors[t] += c
+                else:
+                    factors[t] = c
+                    terms.append(t)
+        # Keep the sum unless collecting like terms saves operations,
+        # e.g. x + x is as cheap as 2*x
+        nonzero = [t for t in terms if factors[t] != 0]
+        num_ops = num_terms + num_constants - 1 + num_products
+        num_new_ops = (len(nonzero) + (constant != 0) - 1 +
+                       sum(1 for t in nonzero if factors[t] != 1))
+        if num_new_ops >= num_ops:
+            return r
+
+        result = Zero((), r.ufl_free_indices, r.ufl_index_dimensions)
+        if constant != 0:
+            result = as_ufl(constant)
+        for t in nonzero:
+            result = Sum(result, Product(as_ufl(factors[t]), t))
+        return result
+
+    # --- Index chain collapse
+
+    def indexed(self, o, A, ii):
+        if isinstance(A, ListTensor) and isinstance(ii[0], FixedIndex):
+            # [a, b, c][1] -> b
+            return A[ii]
+        if isinstance(A, Identity) and all(isinstance(i, FixedIndex) for i in ii):
+            # I[0, 1] -> 0
+            return A[ii]
+        if isinstance(A, ComponentTensor):
+            B, jj = A.ufl_operands
+            if jj == ii:
+                # as_tensor(B, ii)[ii] -> B
+                return B
+            if isinstance(B, Indexed) and not any(j.count() in B.ufl_operands[0].ufl_free_indices
+                                                  for j in jj):
+                # as_tensor(C[mm], jj)[ii] -> C[mm with jj replaced by ii]
+                C, mm = B.ufl_operands
+                renaming = dict(zip(jj, ii))
+                return Indexed(C, MultiIndex(tuple(renaming.get(m, m) for m in mm)))
+            if self.use_counts is not None and self.use_counts.get(o.ufl_operands[0]) == 1:
+                # as_tensor(B, jj)[ii] -> B with jj replaced by ii,
+                # if the component tensor is not used elsewhere
+                renamer = IndexRenamer(dict(zip(jj, ii)))
+                B2 = map_expr_dag(renamer, B)
+                if not renamer.conflict:
+                    return B2
+        return self.reuse_if_untouched(o, A, ii)
+
+    def component_tensor(self, o, A, ii):
+        if isinstance(A, Indexed):
+            B, jj = A.ufl_operands
+            if jj == ii:
+                # as_tensor(B[ii], ii) -> B
+                return B
+        return self.reuse_if_untouched(o, A, ii)
+
+
+def _use_counts(expr):
+    "Return a dict with the number of parents of each node of *expr*."
+    counts = {}
+    for o in unique_pre_traversal(expr):
+        for op in o.ufl_operands:
+            counts[op] = counts.get(op, 0) + 1
+    return counts
+
+
+def simplify_expr(expr, max_iterations=10):
+    """Apply the rules of ``SimplificationRuleset`` to *expr* until
+    the result no longer changes, or at most *max_iterations* times."""
+    for k in range(max_iterations):
+        rules = SimplificationRuleset(_use_counts(expr))
+        result = map_expr_dag(rules, expr)
+        if result is expr:
+            break
+        expr = result
+    return expr
+
+
+def apply_simplification(expression, max_iterations=10):
+    """Simplify the integrands of a Form, Integral or expression with
+    local algebraic rewrite rules, see ``SimplificationRuleset``.
+
+    The rules are applied to a fixed point, or at most
+    *max_iterations* times. Integrals with integrands simplifying to
+    zero are removed from forms."""
+    if max_iterations < 1:
+        error("Expecting a positive number of iterations.")
+    return map_integrands(lambda expr: simplify_expr(expr, max_iterations),
+                          expression)
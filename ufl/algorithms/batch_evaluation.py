@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""This module contains the evaluate_batch algorithm, which evaluates
+an expression at many points at once with NumPy."""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import math
+from itertools import product as iter_product
+
+import numpy
+
+from ufl.log import error
+from ufl.core.multiindex import FixedIndex
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag
+from ufl.differentiation import Grad
+from ufl.geometry import SpatialCoordinate
+from ufl.constantvalue import as_ufl
+
+# Names of the NumPy functions of math functions with other names
+_numpy_names = {"ln": "log", "acos": "arccos", "asin": "arcsin",
+                "atan": "arctan"}
+
+# Letters naming the axes of numpy.einsum subscripts
+_letters = "abcdefghijklmnoqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _subscripts(counts, letters):
+    """Return the einsum subscripts of the indices with *counts*,
+    adding new letters to the dict *letters*."""
+    for c in counts:
+        if c not in letters:
+            if len(letters) == len(_letters):
+                error("Too many indices to evaluate with einsum.")
+            letters[c] = _letters[len(letters)]
+    return "".join(letters[c] for c in counts)
+
+
+class BatchEvaluator(MultiFunction):
+    """Evaluate each node of an expression at all *points* at once.
+
+    The value of a node with shape ``sh`` and free indices with
+    dimensions ``fid`` is an array with shape ``(npoints,) + sh +
+    fid``, with the free index axes ordered as ``ufl_free_indices``.
+
+    The *mapping* gives the values of terminals and other
+    subexpressions, as scalars or arrays with the value shape of the
+    expression, arrays with an extra leading axis over the points, or
+    callables taking the points array and returning such a value. As
+    for ``Expr.__call__``, callables mapping form arguments are called
+    with the tuple of derivative directions as the second argument to
+    evaluate their derivatives.
+    """
+
+    def __init__(self, points, mapping):
+        MultiFunction.__init__(self)
+        self.points = points
+        self.mapping = mapping
+
+    def _as_values(self, o, value, shape=None):
+        "Return *value* as an array with the values of *o* at all points."
+        npoints = len(self.points)
+        if shape is None:
+            shape = o.ufl_shape + o.ufl_index_dimensions
+        if callable(value):
+            value = value(self.points)
+        value = numpy.asarray(value, dtype=float)
+        if value.shape == shape:
+            return numpy.broadcast_to(value, (npoints,) + shape)
+        if value.shape != (npoints,) + shape:
+            error("Expecting value of %s with shape %s or %s, not %s." % (
+                o, shape, (npoints,) + shape, value.shape))
+        return value
+
+    def shortcut(self, o):
+        # Values in the mapping override the evaluation of any node
+        value = self.mapping.get(o)
+        if value is not None:
+            return self._as_values(o, value)
+        return None
+
+    def expr(self, o, *ops):
+        error("Batch evaluation of %s is not supported." % o._ufl_class_.__name__)
+
+    # --- Terminals
+
+    def terminal(self, o):
+        error("No value given for %s in mapping." % o)
+
+    def scalar_value(self, o):
+        return self._as_values(o, float(o))
+
+    def zero(self, o):
+        return numpy.zeros((len(self.points),) + o.ufl_shape + o.ufl_index_dimensions)
+
+    def identity(self, o):
+        return self._as_values(o, numpy.eye(o.ufl_shape[0]))
+
+    def permutation_symbol(self, o):
+        values = numpy.zeros(o.ufl_shape)
+        for c in iter_product(*[range(n) for n in o.ufl_shape]):
+            values[c] = o.evaluate(None, {}, c, {})
+        return self._as_values(o, values)
+
+    def spatial_coordinate(self, o):
+        return self._as_values(o, numpy.reshape(self.points, (len(self.points),) + o.ufl_shape))
+
+    def multi_index(self, o):
+        return None
+
+    def label(self, o):
+        return None
+
+    def grad(self, o):
+        # Find the number of derivatives of the terminal
+        f = o
+        nderivs = 0
+        while isinstance(f, Grad):
+            f, = f.ufl_operands
+            nderivs += 1
+        if not f._ufl_is_terminal_:
+            error("Expecting expand_derivatives to have been applied.")
+        gdim = o.ufl_shape[-1]
+        npoints = len(self.points)
+
+        if isinstance(f, SpatialCoordinate):
+            if nderivs == 1:
+                return self._as_values(o, numpy.eye(gdim))
+            return numpy.zeros((npoints,) + o.ufl_shape)
+
+        value = self.mapping.get(f)
+        if value is None:
+            error("No value given for %s in mapping." % f)
+        if not callable(value):
+            # Derivatives of values without a callable are zero
+            return numpy.zeros((npoints,) + o.ufl_shape)
+
+        # Evaluate the callable for each combination of derivatives
+        result = numpy.empty((npoints,) + o.ufl_shape)
+        for derivatives in iter_product(*[range(gdim)]*nderivs):
+            d = self._as_values(f, value(self.points, derivatives), f.ufl_shape)
+            result[(Ellipsis,) + derivatives] = d
+        return result
+
+    # --- Index notation
+
+    def indexed(self, o, A, ii):
+        a, ii = o.ufl_operands
+        # Take the fixed components first
+        key = (slice(None),) + tuple(int(i) if isinstance(i, FixedIndex) else slice(None)
+                                     for i in ii)
+        A = A[key]
+        counts = [i.count() for i in ii if not isinstance(i, FixedIndex)]
+        letters = {}
+        source = "z" + _subscripts(counts + list(a.ufl_free_indices), letters)
+        target = "z" + _subscripts(o.ufl_free_indices, letters)
+        return numpy.einsum("%s->%s" % (source, target), A)
+
+    def component_tensor(self, o, A, ii):
+        a, ii = o.ufl_operands
+        letters = {}
+        source = "z" + _subscripts(a.ufl_free_indices, letters)
+        target = "z" + _subscripts([i.count() for i in ii] + list(o.ufl_free_indices), letters)
+        return numpy.einsum("%s->%s" % (source, target), A)
+
+    def index_sum(self, o, A, ii):
+        a, ii = o.ufl_operands
+        axis = 1 + len(a.ufl_shape) + a.ufl_free_indices.index(ii[0].count())
+        return A.sum(axis=axis)
+
+    def list_tensor(self, o, *ops):
+        return numpy.stack(ops, axis=1)
+
+    def variable(self, o, a, l):
+        return a
+
+    def restricted(self, o, a):
+        # As Restricted.evaluate, without a cell to restrict to
+        return a
+
+    cell_avg = restricted
+    facet_avg = restricted
+
+    # --- Algebra
+
+    def sum(self, o, a, b):
+        return a + b
+
+    def _multiply(self, o, a, b):
+        """Multiply the values *a* and *b* of the operands of *o*,
+        where the second operand is scalar, merging free indices."""
+        fa, fb = o.ufl_operands
+        # Shape axes get letters keyed by negative numbers, which
+        # are not index counts
+        letters = {}
+        shape = _subscripts([-1 - k for k in range(len(fa.ufl_shape))], letters)
+        sa = "z" + shape + _subscripts(fa.ufl_free_indices, letters)
+        sb = "z" + _subscripts(fb.ufl_free_indices, letters)
+        target = "z" + shape + _subscripts(o.ufl_free_indices, letters)
+        return numpy.einsum("%s,%s->%s" % (sa, sb, target), a, b)
+
+    def _broadcast(self, b, a):
+        "Reshape the values *b* of a scalar to broadcast with *a*."
+        return b.reshape(b.shape + (1,)*(a.ndim - b.ndim))
+
+    def product(self, o, a, b):
+        # Product operands are scalars, possibly with free indices
+        return self._multiply(o, a, b)
+
+    def division(self, o, a, b):
+        return self._multiply(o, a, 1.0 / b)
+
+    def power(self, o, a, b):
+        return a ** self._broadcast(b, a)
+
+    def abs(self, o, a):
+        return numpy.abs(a)
+
+    def math_function(self, o, a):
+        name = _numpy_names.get(o._name, o._name)
+        f = getattr(numpy, name, None)
+        if f is None:
+            f = numpy.vectorize(getattr(math, name))
+        return f(a)
+
+    def atan_2(self, o, a, b):
+        return numpy.arctan2(a, b)
+
+    def bessel_function(self, o, nu, a):
+        try:
+            import scipy.special
+        except ImportError:
+            error("You must have scipy installed to evaluate bessel functions in python.")
+        name = o._name[-1]
+        if o.ufl_operands[0]._ufl_is_literal_ and float(o.ufl_operands[0]) == int(o.ufl_operands[0]) \
+           and name != "i":
+            nu = int(o.ufl_operands[0])
+            functype = "n"
+        else:
+            functype = "v"
+        return getattr(scipy.special, name + functype)(nu, a)
+
+    def min_value(self, o, a, b):
+        return numpy.minimum(a, b)
+
+    def max_value(self, o, a, b):
+        return numpy.maximum(a, b)
+
+    # --- Conditions
+
+    def eq(self, o, a, b):
+        return a == b
+
+    def ne(self, o, a, b):
+        return a != b
+
+    def le(self, o, a, b):
+        return a <= b
+
+    def ge(self, o, a, b):
+        return a >= b
+
+    def lt(self, o, a, b):
+        return a < b
+
+    def gt(self, o, a, b):
+        return a > b
+
+    def and_condition(self, o, a, b):
+        return numpy.logical_and(a, b)
+
+    def or_condition(self, o, a, b):
+        return numpy.logical_or(a, b)
+
+    def not_condition(self, o, a):
+        return numpy.logical_not(a)
+
+    def conditional(self, o, c, t, f):
+        return numpy.where(self._broadcast(c, t), t, f)
+
+
+def evaluate_batch(expression, points, mapping=None):
+    """Evaluate *expression* at all *points*.
+
+    *points* is an array with shape ``(npoints, gdim)``, or
+    ``(npoints,)`` in one dimension. The *mapping* gives the values of
+    the terminals, see ``BatchEvaluator``.
+
+    Each node of the expression DAG is evaluated once for all points
+    with NumPy. Returns an array with shape ``(npoints,) +
+    expression.ufl_shape``.
+    """
+    from ufl.algorithms.ad import expand_derivatives
+
+    expression = as_ufl(expression)
+    if expression.ufl_free_indices:
+        error("Cannot evaluate expression with free indices.")
+    points = numpy.asarray(points, dtype=float)
+    if points.ndim == 1:
+        points = points.reshape((len(points), 1))
+    if points.ndim != 2:
+        error("Expecting points array with shape (npoints, gdim).")
+    if mapping is None:
+        mapping = {}
+
+    expression = expand_derivatives(expression)
+    values = map_expr_dag(BatchEvaluator(points, mapping), expression,
+                          compress=False)
+    return numpy.array(values, dtype=float).reshape((len(points),) + expression.ufl_shape)
@@ -14,6 +14,42 @@ class ArityMismatch(UFLException):
     pass
 
 
+class ArityCache(object):
+    """Cache of the arguments found by ``ArityChecker`` for each
+    subexpression, to be passed to ``check_integrand_arity``.
+
+    Unlike ``MapExprDagCache``, the expressions are identified by
+    identity and kept alive by the cache, so a lookup never compares
+    large expressions which are equal but not the same object. The
+    cache is meant to live as long as the processing of a single form.
+
+    The numbers of cache hits and misses are counted in ``hits`` and
+    ``misses``.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # id(expr) -> (expr, arguments)
+        self._results = {}
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, expr, default=None):
+        "Return the arguments found for *expr*, or *default* if not found."
+        r = self._results.get(id(expr))
+        if r is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return r[1]
+
+    def set(self, expr, arguments):
+        "Store the *arguments* found for *expr*."
+        self._results[id(expr)] = (expr, arguments)
+
+
 class ArityChecker(MultiFunction):
     def __init__(self, arguments):
         MultiFunction.__init__(self)
@@ -138,15 +174,22 @@ class ArityChecker(MultiFunction):
             return self._et
 
 
-def check_integrand_arity(expr, arguments):
+def check_integrand_arity(expr, arguments, cache=None):
+    """Check that each term of *expr* is linear in each of the
+    *arguments* and depends on no other arguments.
+
+    If an ``ArityCache`` *cache* is given, the arguments found for
+    each subexpression are stored in it, and subexpressions found in
+    it are not checked again."""
     arguments = tuple(sorted(set(arguments),
                              key=lambda x: (x.number(), x.part())))
     rules = ArityChecker(arguments)
-    args = map_expr_dag(rules, expr, compress=False)
+    args = map_expr_dag(rules, expr, compress=False, cache=cache)
     if args != arguments:
         raise ArityMismatch("Integrand arguments {0} differ from form arguments {1}.".format(args, arguments))
 
 
-def check_form_arity(form, arguments):
+def check_form_arity(form, arguments, cache=None):
+    "Check the arity of each integrand of *form*, see ``check_integrand_arity``."
     for itg in form.integrals():
-        check_integrand_arity(itg.integrand(), arguments)
+        check_integrand_arity(itg.integrand(), arguments, cache)
@@ -20,16 +20,24 @@ raw input form given by a user."""
 # You should have received a copy of the GNU Lesser General Public License
 # along with UFL. If not, see <http://www.gnu.org/licenses/>.
 
+import functools
+from io import BytesIO
 from itertools import chain
 
 from ufl.log import error, info
 
-from ufl.classes import GeometricFacetQuantity, Coefficient, Form
+from ufl.classes import GeometricFacetQuantity, Coefficient, Form, Zero
 from ufl.corealg.traversal import traverse_unique_terminals
+from ufl.corealg.typemask import contains_type
 from ufl.algorithms.analysis import extract_coefficients, extract_sub_elements, unique_tuple
 from ufl.algorithms.formdata import FormData
 from ufl.algorithms.formtransformations import compute_form_arities
-from ufl.algorithms.check_arities import check_form_arity
+from ufl.algorithms.check_arities import check_form_arity, ArityCache
+from ufl.algorithms.formdatacache import get_default_disk_cache, form_data_memory_cache
+from ufl.algorithms.formdatacache import (_FormDataPickler, _FormDataUnpickler,
+                                          _plain_form_objects)
+from ufl.algorithms.renumbering import update_global_counts
+from ufl.algorithms.passmanager import PassManager
 
 # These are the main symbolic processing steps:
 from ufl.algorithms.apply_function_pullbacks import apply_function_pullbacks
@@ -38,6 +46,7 @@ from ufl.algorithms.apply_derivatives import apply_derivatives
 from ufl.algorithms.apply_integral_scaling import apply_integral_scaling
 from ufl.algorithms.apply_geometry_lowering import apply_geometry_lowering
 from ufl.algorithms.apply_restrictions import apply_restrictions, apply_default_restrictions
+from ufl.algorithms.apply_simplification import apply_simplification
 from ufl.algorithms.estimate_degrees import estimate_total_polynomial_degree
 
 # See TODOs at the call sites of these below:
@@ -162,6 +171,8 @@ def _check_facet_geometry(integral_data):
             # that's not really strict enough.
             if not ("facet" in it or "custom" in it or "interface" in it):
                 # Not a facet integral
+                if not contains_type(itg.integrand(), GeometricFacetQuantity):
+                    continue
                 for expr in traverse_unique_terminals(itg.integrand()):
                     cls = expr._ufl_class_
                     if issubclass(cls, GeometricFacetQuantity):
@@ -202,16 +213,148 @@ def attach_estimated_degrees(form):
     :arg form: The :class:`~.Form` to inspect.
     :returns: A new Form with estimate degrees attached.
     """
-    integrals = form.integrals()
+    return Form([_attach_estimated_degree(integral)
+                 for integral in form.integrals()])
+
+
+def _attach_estimated_degree(integral):
+    "Attach estimated polynomial degree to the metadata of an integral."
+    md = {}
+    md.update(integral.metadata())
+    degree = estimate_total_polynomial_degree(integral.integrand())
+    md["estimated_polynomial_degree"] = degree
+    return integral.reconstruct(metadata=md)
+
+
+def _carry_arity(arity_cache, integral, result):
+    """Store the arguments checked for the integrand of *integral* in
+    *arity_cache* as those of the integrand of *result*, computed from
+    *integral* by a pass preserving the arity of integrands."""
+    if result is integral or isinstance(result.integrand(), Zero):
+        return
+    arguments = arity_cache.get(integral.integrand())
+    if arguments is not None:
+        arity_cache.set(result.integrand(), arguments)
+
+
+def _preprocess_integral(integral, pass_manager,
+                         do_apply_function_pullbacks,
+                         do_apply_integral_scaling,
+                         do_apply_geometry_lowering,
+                         preserve_geometry_types,
+                         do_apply_default_restrictions,
+                         do_apply_restrictions,
+                         do_estimate_degrees,
+                         do_apply_simplification=False,
+                         arity_cache=None):
+    """Apply the symbolic processing steps following integral grouping
+    to a single integral, see ``compute_form_data``. The passes are
+    run by *pass_manager*.
+
+    If an *arity_cache* is given, the arity checked for the input
+    integrand is carried to the integrands returned by the passes
+    preserving it, i.e. all passes except the simplification.
+
+    Returns the processed integral, which may have a zero integrand.
+    """
+    def run(function, integral, *args, **kwargs):
+        result = pass_manager.run(function, integral, *args, **kwargs)
+        if arity_cache is not None and function in _arity_preserving_passes:
+            _carry_arity(arity_cache, integral, result)
+        return result
+
+    # Estimate polynomial degree of integrands now, before applying
+    # any pullbacks and geometric lowering.  Otherwise quad degrees
+    # blow up horrifically.
+    if do_estimate_degrees:
+        integral = run(_attach_estimated_degree, integral,
+                       name="estimate_degrees")
+
+    if do_apply_function_pullbacks:
+        # Rewrite coefficients and arguments in terms of their
+        # reference cell values with Piola transforms and symmetry
+        # transforms injected where needed.
+        # Decision: Not supporting grad(dolfin.Expression) without a
+        #           Domain.  Current dolfin works if Expression has a
+        #           cell but this should be changed to a mesh.
+        integral = run(apply_function_pullbacks, integral)
+
+    # Scale integrals to reference cell frames
+    if do_apply_integral_scaling:
+        integral = run(apply_integral_scaling, integral)
+
+    # Apply default restriction to fully continuous terminals
+    if do_apply_default_restrictions:
+        integral = run(apply_default_restrictions, integral)
 
-    new_integrals = []
-    for integral in integrals:
-        md = {}
-        md.update(integral.metadata())
-        degree = estimate_total_polynomial_degree(integral.integrand())
-        md["estimated_polynomial_degree"] = degree
-        new_integrals.append(integral.reconstruct(metadata=md))
-    return Form(new_integrals)
+    # Lower abstractions for geometric quantities into a smaller set
+    # of quantities, allowing the form compiler to deal with a smaller
+    # set of types and treating geometric quantities like any other
+    # expressions w.r.t. loop-invariant code motion etc.
+    if do_apply_geometry_lowering:
+        integral = run(apply_geometry_lowering, integral,
+                       (preserve_geometry_types,))
+
+    # Apply differentiation again, because the algorithms above can
+    # generate new derivatives or rewrite expressions inside
+    # derivatives
+    if do_apply_function_pullbacks or do_apply_geometry_lowering:
+        integral = run(apply_derivatives, integral, repeat=True)
+
+        # Neverending story: apply_derivatives introduces new Jinvs,
+        # which needs more geometry lowering. The repeated passes are
+        # skipped if the previous pass left the integral unchanged.
+        if do_apply_geometry_lowering:
+            integral = run(apply_geometry_lowering, integral,
+                           (preserve_geometry_types,), repeat=True)
+            # Lower derivatives that may have appeared
+            integral = run(apply_derivatives, integral, repeat=True)
+
+    # Propagate restrictions to terminals
+    if do_apply_restrictions:
+        integral = run(apply_restrictions, integral)
+
+    # Shrink the integrand with local rewrite rules, always recording
+    # the node counts to report the reduction
+    if do_apply_simplification:
+        integral = run(apply_simplification, integral, count_nodes=True)
+
+    return integral
+
+
+# Passes run by _preprocess_integral that map integrands linear in
+# each argument to integrands linear in the same arguments: they
+# rewrite form arguments and geometry in terms of linear operators of
+# reference values, scale by geometric factors, apply spatial
+# derivatives or move restrictions.
+_arity_preserving_passes = frozenset((
+    _attach_estimated_degree,
+    apply_function_pullbacks,
+    apply_integral_scaling,
+    apply_default_restrictions,
+    apply_geometry_lowering,
+    apply_derivatives,
+    apply_restrictions,
+    ))
+
+
+def _preprocess_integral_remotely(data, objects, count_nodes, **options):
+    """Call ``_preprocess_integral`` with a new ``PassManager``, e.g.
+    in another process, and return the processed integral and the
+    pass statistics.
+
+    The integral is passed and returned pickled in *data*, with the
+    arguments, coefficients and domains of the form replaced by the
+    plain *objects*, see ``_plain_form_objects``."""
+    integral = _FormDataUnpickler(BytesIO(data), None, objects).load()
+    # The worker may have been started before the indices of the
+    # integral were created, so new indices must not reuse their counts
+    update_global_counts([integral.integrand()])
+    pass_manager = PassManager(count_nodes=count_nodes)
+    integral = _preprocess_integral(integral, pass_manager, **options)
+    f = BytesIO()
+    _FormDataPickler(f, None, objects).dump(integral)
+    return f.getvalue(), pass_manager.statistics
 
 
 def compute_form_data(form,
@@ -223,7 +366,117 @@ def compute_form_data(form,
                       do_apply_default_restrictions=True,
                       do_apply_restrictions=True,
                       do_estimate_degrees=True,
+                      do_apply_simplification=False,
+                      disk_cache=None,
+                      executor=None,
+                      pass_callback=None,
+                      count_pass_nodes=False,
+                      check_arities="trust",
                       ):
+    """Preprocess *form* and return a ``FormData`` object.
+
+    If enabled, the result is memoized for the *form* object and the
+    options in ``formdatacache.form_data_memory_cache``.
+
+    If *disk_cache* is a ``FormDataDiskCache``, the result is looked
+    up in and stored to that persistent cache. If it is ``None``, the
+    cache set with ``set_default_disk_cache`` is used, if any. Pass
+    ``False`` to disable the persistent cache.
+
+    If *executor* is given, e.g. a ``concurrent.futures`` process or
+    thread pool, the symbolic processing steps following the grouping
+    of integrals are applied to each integral in parallel with
+    ``executor.map``. The integrals are pickled with plain UFL copies
+    of the arguments, coefficients and domains of the form, so these
+    need not be picklable for a process pool, and the result refers to
+    the objects of the form. The result does not depend on the executor.
+
+    Statistics of each symbolic pass are recorded by a ``PassManager``
+    and stored as a list of ``PassStatistics`` objects in
+    ``FormData.pass_statistics``. If *pass_callback* is given, it is
+    called with each ``PassStatistics`` object when the pass is done.
+    With an *executor*, it is called when the integral is done.
+    The number of expression nodes before and after each pass is only
+    recorded if *count_pass_nodes* is true, as counting them adds
+    noticeably to the preprocessing time. The statistics
+    of a cached result are those recorded when it was computed. With a
+    *pass_callback*, the caches are not used, so it is called for each
+    pass.
+
+    If *do_apply_simplification* is true, the integrands are finally
+    shrunk by ``apply_simplification``. The number of nodes before and
+    after this pass is always recorded in its ``PassStatistics``.
+
+    The arity of the integrands, i.e. that each term is linear in each
+    argument of the form, is checked according to *check_arities*:
+
+    ``"trust"`` (default)
+        Check the integrands once after the derivatives are applied.
+        The result is carried through the following passes known to
+        preserve the arity, and only integrands changed by other
+        passes, i.e. the simplification, are checked again. Since the
+        cache holds just the nodes of the checked input integrands and
+        the carried results, a simplified integrand is checked in full
+        as in ``"verify"`` mode. With an *executor*, the processed
+        integrands come from other processes and are all checked again.
+    ``"verify"``
+        Check each processed integrand without trusting the passes.
+    """
+    if check_arities not in ("verify", "trust"):
+        error("Invalid check_arities mode %r, expecting 'verify' or 'trust'." % (check_arities,))
+
+    options = dict(
+        do_apply_function_pullbacks=do_apply_function_pullbacks,
+        do_apply_integral_scaling=do_apply_integral_scaling,
+        do_apply_geometry_lowering=do_apply_geometry_lowering,
+        preserve_geometry_types=preserve_geometry_types,
+        do_apply_default_restrictions=do_apply_default_restrictions,
+        do_apply_restrictions=do_apply_restrictions,
+        do_estimate_degrees=do_estimate_degrees,
+        do_apply_simplification=do_apply_simplification,
+        )
+
+    def compute():
+        pass_manager = PassManager(callback=pass_callback,
+                                   count_nodes=count_pass_nodes)
+        return _compute_form_data(form, executor=executor,
+                                  pass_manager=pass_manager,
+                                  check_arities=check_arities, **options)
+
+    # The callback must be called for each pass, so the result is
+    # always computed
+    if pass_callback is not None:
+        return compute()
+
+    # Results checked in another arity mode or recorded without node
+    # counts must not be reused
+    cache_options = dict(options, check_arities=check_arities,
+                         count_pass_nodes=count_pass_nodes)
+
+    if disk_cache is None:
+        disk_cache = get_default_disk_cache()
+    if disk_cache:
+        def compute(compute=compute):
+            return disk_cache.get(form, cache_options, compute)
+
+    return form_data_memory_cache.get(form, cache_options, compute)
+
+
+def _compute_form_data(form,
+                       do_apply_function_pullbacks,
+                       do_apply_integral_scaling,
+                       do_apply_geometry_lowering,
+                       preserve_geometry_types,
+                       do_apply_default_restrictions,
+                       do_apply_restrictions,
+                       do_estimate_degrees,
+                       do_apply_simplification=False,
+                       executor=None,
+                       pass_manager=None,
+                       check_arities="trust"):
+    "Implementation of compute_form_data without caching."
+    if pass_manager is None:
+        pass_manager = PassManager(count_nodes=False)
 
     # TODO: Move this to the constructor instead
     self = FormData()
@@ -244,66 +497,67 @@ def compute_form_data(form,
     # Lower abstractions for tensor-algebra types into index notation,
     # reducing the number of operators later algorithms and form
     # compilers need to handle
-    form = apply_algebra_lowering(form)
+    form = pass_manager.run(apply_algebra_lowering, form)
 
     # Apply differentiation before function pullbacks, because for
     # example coefficient derivatives are more complicated to derive
     # after coefficients are rewritten, and in particular for
     # user-defined coefficient relations it just gets too messy
-    form = apply_derivatives(form)
+    form = pass_manager.run(apply_derivatives, form)
 
     # --- Group form integrals
     # TODO: Refactor this, it's rather opaque what this does
     # TODO: Is self.original_form.ufl_domains() right here?
     #       It will matter when we start including 'num_domains' in ufc form.
-    form = group_form_integrals(form, self.original_form.ufl_domains())
-
-    # Estimate polynomial degree of integrands now, before applying
-    # any pullbacks and geometric lowering.  Otherwise quad degrees
-    # blow up horrifically.
-    if do_estimate_degrees:
-        form = attach_estimated_degrees(form)
-
-    if do_apply_function_pullbacks:
-        # Rewrite coefficients and arguments in terms of their
-        # reference cell values with Piola transforms and symmetry
-        # transforms injected where needed.
-        # Decision: Not supporting grad(dolfin.Expression) without a
-        #           Domain.  Current dolfin works if Expression has a
-        #           cell but this should be changed to a mesh.
-        form = apply_function_pullbacks(form)
-
-    # Scale integrals to reference cell frames
-    if do_apply_integral_scaling:
-        form = apply_integral_scaling(form)
-
-    # Apply default restriction to fully continuous terminals
-    if do_apply_default_restrictions:
-        form = apply_default_restrictions(form)
-
-    # Lower abstractions for geometric quantities into a smaller set
-    # of quantities, allowing the form compiler to deal with a smaller
-    # set of types and treating geometric quantities like any other
-    # expressions w.r.t. loop-invariant code motion etc.
-    if do_apply_geometry_lowering:
-        form = apply_geometry_lowering(form, preserve_geometry_types)
-
-    # Apply differentiation again, because the algorithms above can
-    # generate new derivatives or rewrite expressions inside
-    # derivatives
-    if do_apply_function_pullbacks or do_apply_geometry_lowering:
-        form = apply_derivatives(form)
-
-        # Neverending story: apply_derivatives introduces new Jinvs,
-        # which needs more geometry lowering
-        if do_apply_geometry_lowering:
-            form = apply_geometry_lowering(form, preserve_geometry_types)
-            # Lower derivatives that may have appeared
-            form = apply_derivatives(form)
-
-    # Propagate restrictions to terminals
-    if do_apply_restrictions:
-        form = apply_restrictions(form)
+    form = pass_manager.run(group_form_integrals, form,
+                            (self.original_form.ufl_domains(),))
+
+    # Check the arity of the integrands once, caching the arguments of
+    # each subexpression for the final check below
+    if check_arities == "trust":
+        arity_cache = ArityCache()
+        check_form_arity(form, self.original_form.arguments(), arity_cache)
+    else:
+        arity_cache = None
+
+    # Apply the remaining passes to each integral, optionally in
+    # parallel. The integrals are independent at this point.
+    options = dict(
+        do_apply_function_pullbacks=do_apply_function_pullbacks,
+        do_apply_integral_scaling=do_apply_integral_scaling,
+        do_apply_geometry_lowering=do_apply_geometry_lowering,
+        preserve_geometry_types=preserve_geometry_types,
+        do_apply_default_restrictions=do_apply_default_restrictions,
+        do_apply_restrictions=do_apply_restrictions,
+        do_estimate_degrees=do_estimate_degrees,
+        do_apply_simplification=do_apply_simplification)
+    if executor is None:
+        integrals = [_preprocess_integral(itg, pass_manager,
+                                          arity_cache=arity_cache, **options)
+                     for itg in form.integrals()]
+    else:
+        # The form arguments and domains are sent as references to
+        # plain copies, and come back as the objects of the form.
+        # Executor.map keeps the ordering of the integrals.
+        preprocess = functools.partial(_preprocess_integral_remotely,
+                                       objects=_plain_form_objects(form),
+                                       count_nodes=pass_manager.count_nodes,
+                                       **options)
+        data = []
+        for itg in form.integrals():
+            f = BytesIO()
+            _FormDataPickler(f, form).dump(itg)
+            data.append(f.getvalue())
+        integrals = []
+        for itg_data, statistics in executor.map(preprocess, data):
+            integrals.append(_FormDataUnpickler(BytesIO(itg_data), form).load())
+            for stats in statistics:
+                pass_manager.record(stats)
+        # Integrals computed in other processes may contain indices
+        # with counts not known to this process
+        update_global_counts(itg.integrand() for itg in integrals)
+    form = Form([itg for itg in integrals
+                 if not isinstance(itg.integrand(), Zero)])
 
     # --- Group integrals into IntegralData objects
     # Most of the heavy lifting is done above in group_form_integrals.
@@ -330,7 +584,7 @@ def compute_form_data(form,
                                        key=lambda c: c.count())
     self.num_coefficients = len(self.reduced_coefficients)
     self.original_coefficient_positions = [i for i, c in enumerate(self.original_form.coefficients())
-                                           if c in self.reduced_coefficients]
+                                           if c in reduced_coefficients_set]
 
     # Store back into integral data which form coefficients are used
     # by each integral
@@ -381,13 +635,17 @@ def compute_form_data(form,
     _check_elements(self)
     _check_facet_geometry(self.integral_data)
 
-    # TODO: This is a very expensive check... Replace with something
-    # faster!
+    # Check the arity of the processed integrands. In trust mode, the
+    # cache holds the results for the integrands carried through arity
+    # preserving passes, simplified integrands are checked in full
     preprocessed_form = reconstruct_form_from_integral_data(self.integral_data)
-    check_form_arity(preprocessed_form, self.original_form.arguments())  # Currently testing how fast this is
+    check_form_arity(preprocessed_form, self.original_form.arguments(),
+                     arity_cache)
 
     # TODO: This member is used by unit tests, change the tests to
     # remove this!
     self.preprocessed_form = preprocessed_form
 
+    self.pass_statistics = pass_manager.statistics
+
     return self
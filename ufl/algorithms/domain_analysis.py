@@ -27,7 +27,8 @@ from ufl.log import error
 from ufl.utils.py23 import as_native_strings
 from ufl.integral import Integral
 from ufl.form import Form
-from ufl.sorting import cmp_expr, sorted_expr
+from ufl.sorting import cmp_expr
+from ufl.operators import balanced_sum
 from ufl.utils.sorting import canonicalize_metadata, sorted_by_key, sorted_by_tuple_key
 import numbers
 
@@ -239,9 +240,9 @@ def accumulate_integrands_with_same_metadata(integrals):
     # id
     for cdid in by_cdid:
         integrals, cd = by_cdid[cdid]
-        # Ensure canonical sorting of more than two integrands
-        integrands = sorted_expr((itg.integrand() for itg in integrals))
-        integrands_sum = sum(integrands[1:], integrands[0])
+        # Sum canonically sorted integrands as a balanced tree, to
+        # keep the depth of forms with many terms logarithmic
+        integrands_sum = balanced_sum(itg.integrand() for itg in integrals)
         by_cdid[cdid] = (integrands_sum, cd)
 
     # Sort integrands canonically by integrand first then compiler
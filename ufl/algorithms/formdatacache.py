@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""Caching of ``compute_form_data`` results in memory and on disk.
+
+The ``FormDataMemoryCache`` in ``form_data_memory_cache`` memoizes
+``FormData`` objects for ``Form`` objects in the current process. It
+is disabled by default, enable it with
+``form_data_memory_cache.set_max_size(n)``.
+
+A ``FormDataDiskCache`` stores pickled ``FormData`` objects in a
+directory, keyed on the form signature and the options passed to
+``compute_form_data``, such that processes preprocessing the same
+forms can share the results.
+
+The form arguments, domains and the form itself are not stored in
+the cache, but are replaced by references to the corresponding
+objects of the form passed to ``compute_form_data`` when an entry is
+loaded. This makes it safe to reuse entries computed for forms with
+the same signature but a different incidental numbering, and
+avoids pickling objects of form argument subclasses from other
+libraries.
+"""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import errno
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking on this platform, concurrent processes may
+    # then compute the same entry but will never see partial files
+    fcntl = None
+
+from ufl.log import warning
+from ufl.utils.py23 import as_bytes
+from ufl.core.terminal import FormArgument
+from ufl.argument import Argument
+from ufl.coefficient import Coefficient
+from ufl.domain import AbstractDomain, Mesh
+from ufl.functionspace import (FunctionSpace, MixedFunctionSpace,
+                               TensorProductFunctionSpace)
+from ufl.algorithms.renumbering import update_global_counts
+
+
+def _options_key(options):
+    "Return a hashable key for the dict *options*, with lists converted to tuples."
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                        for k, v in options.items()))
+
+
+class FormDataMemoryCache(object):
+    """In-process cache of ``compute_form_data`` results.
+
+    Results are cached per ``Form`` object and options, with the
+    least recently used entries removed when there are more than
+    *max_size* entries. Caching is disabled if *max_size* is zero.
+
+    The numbers of cache hits and misses are counted in ``hits`` and
+    ``misses``.
+    """
+
+    def __init__(self, max_size=0):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # (id(form), options key) -> FormData. The FormData refers to
+        # the form as original_form, keeping the id valid.
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_max_size(self, max_size):
+        "Set the maximal number of entries, removing least recently used entries if necessary."
+        self.max_size = max_size
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, form, options, compute):
+        """Return the ``FormData`` for *form* with *options*, computing
+        it by calling *compute* and storing it on a cache miss."""
+        if self.max_size <= 0:
+            return compute()
+
+        key = (id(form), _options_key(options))
+        form_data = self._entries.pop(key, None)
+        if form_data is None:
+            self.misses += 1
+            form_data = compute()
+        else:
+            self.hits += 1
+        # (Re)insert as most recently used entry
+        self._entries[key] = form_data
+        self._evict()
+        return form_data
+
+    def invalidate(self, form):
+        "Remove all entries for *form*."
+        for key in [key for key in self._entries if key[0] == id(form)]:
+            del self._entries[key]
+
+    def clear(self):
+        "Remove all entries and reset the hit and miss counters."
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# The in-process cache used by compute_form_data
+form_data_memory_cache = FormDataMemoryCache()
+
+# The default cache used by compute_form_data when no cache is passed
+_default_disk_cache = None
+
+
+def set_default_disk_cache(cache):
+    """Set the ``FormDataDiskCache`` used by ``compute_form_data`` by default.
+
+    Pass ``None`` to disable the default cache.
+    """
+    global _default_disk_cache
+    _default_disk_cache = cache
+
+
+def get_default_disk_cache():
+    "Return the ``FormDataDiskCache`` used by ``compute_form_data`` by default, or ``None``."
+    return _default_disk_cache
+
+
+class _FileLock(object):
+    "Exclusive lock on a file, held within a ``with`` statement."
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.filename, "a")
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def _form_objects(form):
+    "Return list of (persistent id, object) for the objects of *form* that are not pickled."
+    objects = [(("form", 0), form)]
+    objects.extend((("argument", i), f) for i, f in enumerate(form.arguments()))
+    objects.extend((("coefficient", i), f) for i, f in enumerate(form.coefficients()))
+    objects.extend((("domain", i), d) for i, d in enumerate(form.ufl_domains()))
+    return objects
+
+
+def _plain_function_space(space, domains):
+    "Return a copy of *space* without subclass state, with the domains mapped by *domains*."
+    if isinstance(space, FunctionSpace):
+        domain = space.ufl_domain()
+        return FunctionSpace(domains.get(domain, domain), space.ufl_element())
+    elif isinstance(space, MixedFunctionSpace):
+        return MixedFunctionSpace(*[_plain_function_space(s, domains)
+                                    for s in space.ufl_sub_spaces()])
+    elif isinstance(space, TensorProductFunctionSpace):
+        return TensorProductFunctionSpace(*[_plain_function_space(s, domains)
+                                            for s in space.ufl_sub_spaces()])
+    return space
+
+
+def _plain_form_objects(form):
+    """Return list of (persistent id, object) for the arguments,
+    coefficients and domains of *form*, with each object replaced by an
+    equal plain UFL object.
+
+    The plain objects carry no state of subclasses, e.g. DOLFIN
+    Functions and Meshes, so they can be pickled and stand in for the
+    form objects in other processes."""
+    objects = _form_objects(form)[1:]
+    domains = {}
+    for pid, obj in objects:
+        if isinstance(obj, Mesh):
+            domains[obj] = Mesh(obj.ufl_coordinate_element(), ufl_id=obj.ufl_id())
+    plain = []
+    for pid, obj in objects:
+        if isinstance(obj, AbstractDomain):
+            obj = domains.get(obj, obj)
+        elif isinstance(obj, Argument):
+            obj = Argument(_plain_function_space(obj.ufl_function_space(), domains),
+                           obj.number(), obj.part())
+        else:
+            obj = Coefficient(_plain_function_space(obj.ufl_function_space(), domains),
+                              count=obj.count())
+        plain.append((pid, obj))
+    return plain
+
+
+class _FormDataPickler(pickle.Pickler):
+    """Pickler storing references to the form objects instead of the
+    objects. *objects* is a list of (persistent id, object) replacing
+    the arguments, coefficients and domains of *form*."""
+
+    def __init__(self, file, form, objects=None):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self._form = form
+        if objects is None:
+            objects = _form_objects(form)[1:]
+        self._ids = dict((obj, pid) for pid, obj in objects)
+
+    def persistent_id(self, obj):
+        if obj is self._form and obj is not None:
+            return ("form", 0)
+        if isinstance(obj, (FormArgument, AbstractDomain)):
+            return self._ids.get(obj)
+        return None
+
+
+class _FormDataUnpickler(pickle.Unpickler):
+    """Unpickler resolving references to the form objects, or to the
+    replacing *objects* if given."""
+
+    def __init__(self, file, form, objects=None):
+        pickle.Unpickler.__init__(self, file)
+        self._objects = dict(_form_objects(form) if objects is None else objects)
+
+    def persistent_load(self, pid):
+        return self._objects[tuple(pid)]
+
+
+def compute_form_data_cache_key(form, options):
+    """Compute the cache key for the ``FormData`` of *form*.
+
+    *options* is a dict of the keyword arguments passed to ``compute_form_data``.
+    """
+    from ufl import __version__
+    data = (__version__, tuple(sys.version_info[:2]), form.signature(),
+            sorted((k, v) for k, v in options.items()
+                   if k != "preserve_geometry_types"),
+            sorted(t.__name__ for t in options.get("preserve_geometry_types", ())))
+    return hashlib.sha1(as_bytes(repr(data))).hexdigest()
+
+
+class FormDataDiskCache(object):
+    """Persistent cache of ``compute_form_data`` results in a directory.
+
+    The cache can be shared between concurrent processes. An entry is
+    computed by one process holding a lock on it, while other
+    processes wait for it to be available.
+
+    If *max_size* (bytes) is given, the least recently used entries
+    are removed when the total size of the entries exceeds it.
+    """
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def entries(self):
+        "Return list of the filenames of all entries in the cache."
+        return [os.path.join(self.directory, fn)
+                for fn in os.listdir(self.directory) if fn.endswith(".pickle")]
+
+    def size(self):
+        "Return the total size of all entries in bytes."
+        return sum(os.path.getsize(fn) for fn in self.entries())
+
+    def clear(self):
+        "Remove all entries from the cache."
+        for fn in os.listdir(self.directory):
+            if fn.endswith(".pickle") or fn.endswith(".lock"):
+                _remove(os.path.join(self.directory, fn))
+
+    def load(self, key, form):
+        "Return the cached ``FormData`` for *form*, or ``None`` if not found."
+        filename = self._filename(key)
+        try:
+            f = open(filename, "rb")
+        except IOError:
+            return None
+        try:
+            with f:
+                form_data = _FormDataUnpickler(f, form).load()
+        except Exception as e:
+            warning("Ignoring invalid form data cache entry %s: %s" % (filename, e))
+            return None
+
+        update_global_counts(itg.integrand()
+                             for itg_data in form_data.integral_data
+                             for itg in itg_data.integrals)
+
+        # Mark as recently used
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return form_data
+
+    def store(self, key, form, form_data):
+        "Store the ``FormData`` for *form* in the cache."
+        filename = self._filename(key)
+
+        # Write to a temporary file and move it in place, so no
+        # process ever sees a partially written entry
+        fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                _FormDataPickler(f, form).dump(form_data)
+            if os.name == "nt":
+                _remove(filename)
+            os.rename(tmpname, filename)
+        except Exception as e:
+            _remove(tmpname)
+            warning("Failed to store form data cache entry %s: %s" % (filename, e))
+            return
+
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def evict(self, max_size):
+        "Remove least recently used entries until the total size is at most *max_size* bytes."
+        entries = []
+        for fn in self.entries():
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fn))
+        entries.sort()
+
+        total = sum(e[1] for e in entries)
+        for mtime, size, fn in entries:
+            if total <= max_size:
+                break
+            _remove(fn)
+            total -= size
+
+    def get(self, form, options, compute):
+        """Return the ``FormData`` for *form* with *options*, computing
+        it by calling *compute* and storing it on a cache miss."""
+        key = compute_form_data_cache_key(form, options)
+        with _FileLock(self._filename(key) + ".lock"):
+            form_data = self.load(key, form)
+            if form_data is None:
+                form_data = compute()
+                self.store(key, form, form_data)
+        return form_data
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
@@ -19,11 +19,17 @@
 # along with UFL. If not, see <http://www.gnu.org/licenses/>.
 
 from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dag
 from ufl.algorithms.map_integrands import map_integrand_dags
 from ufl.constantvalue import Zero
-from ufl.tensors import as_vector
+from ufl.tensors import as_vector, as_tensor, ListTensor
+from ufl.core.multiindex import FixedIndex, indices
 from ufl.argument import Argument
 from ufl.functionspace import FunctionSpace
+from ufl.differentiation import Grad, ReferenceGrad
+from ufl.restriction import Restricted
+from ufl.form import as_form
+from ufl.utils.sequences import product
 
 
 class FormSplitter(MultiFunction):
@@ -33,7 +39,7 @@ class FormSplitter(MultiFunction):
         self.idx = [ix, iy]
         return map_integrand_dags(self, form)
 
-    def argument(self, obj):
+    def argument(self, obj, modifiers=()):
         Q = obj.ufl_function_space()
         dom = Q.ufl_domain()
         sub_elements = obj.ufl_element().sub_elements()
@@ -42,29 +48,148 @@ class FormSplitter(MultiFunction):
         if (len(sub_elements) == 0):
             return obj
 
-        # Split into sub-elements, creating appropriate space for each
+        # Split into sub-elements, creating appropriate space for each,
+        # and apply the terminal modifiers to each sub argument
         args = []
         for i, sub_elem in enumerate(sub_elements):
             Q_i = FunctionSpace(dom, sub_elem)
             a = Argument(Q_i, obj.number(), part=obj.part())
+            rank = len(a.ufl_shape)
+            for m in modifiers:
+                a = m._ufl_expr_reconstruct_(a)
+            dshape = a.ufl_shape[rank:]
+            kk = indices(len(dshape))
 
-            indices = [()]
-            for m in a.ufl_shape:
-                indices = [(k + (j,)) for k in indices for j in range(m)]
+            comps = [()]
+            for m in a.ufl_shape[:rank]:
+                comps = [(k + (j,)) for k in comps for j in range(m)]
 
             if (i == self.idx[obj.number()]):
-                args += [a[j] for j in indices]
+                args += [as_tensor(a[j + kk], kk) if kk else a[j]
+                         for j in comps]
             else:
-                args += [Zero() for j in indices]
+                args += [Zero(dshape) for j in comps]
 
         return as_vector(args)
 
+    def terminal_modifier(self, o):
+        # Split the arguments below gradients and restrictions, such
+        # that the modifiers of the other blocks become zero
+        modifiers = []
+        t = o
+        while isinstance(t, (Grad, ReferenceGrad, Restricted)):
+            modifiers.append(t)
+            t, = t.ufl_operands
+        if isinstance(t, Argument):
+            return self.argument(t, tuple(reversed(modifiers)))
+        elif t._ufl_is_terminal_:
+            return o
+        else:
+            # Modifier of an expression, e.g. with derivatives not
+            # yet applied
+            op, = o.ufl_operands
+            return self.reuse_if_untouched(o, map_expr_dag(self, op))
+
+    grad = terminal_modifier
+    reference_grad = terminal_modifier
+    restricted = terminal_modifier
+
     def multi_index(self, obj):
         return obj
 
+    def indexed(self, o, A, ii):
+        # Pick components of the split arguments directly, such that
+        # the terms of other blocks become zero
+        if isinstance(A, ListTensor) and isinstance(ii[0], FixedIndex):
+            return A[ii]
+        return self.reuse_if_untouched(o, A, ii)
+
     expr = MultiFunction.reuse_if_untouched
 
 
+def _sub_element_of_components(element):
+    """Return the index of the sub element of each value component of
+    *element*, flattened as in ``FormSplitter``."""
+    sub_elements = element.sub_elements()
+    if not sub_elements:
+        return None
+    return [i for i, e in enumerate(sub_elements)
+            for j in range(product(e.value_shape()))]
+
+
+class BlockSparsityAnalyser(MultiFunction):
+    """Compute for each expression the set of blocks it has nonzero
+    terms in, each a sorted tuple of pairs (argument number, sub
+    element index) of the arguments a term is linear in."""
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        self._empty = frozenset([()])
+        self._components = {}
+
+    def _sub_elements(self, o):
+        c = self._components.get(o)
+        if c is None:
+            c = _sub_element_of_components(o.ufl_element())
+            self._components[o] = c
+        return c
+
+    def terminal(self, o):
+        return self._empty
+
+    def zero(self, o):
+        return frozenset()
+
+    def argument(self, o):
+        components = self._sub_elements(o)
+        n = len(set(components)) if components else 1
+        return frozenset(((o.number(), i),) for i in range(n))
+
+    def expr(self, o, *ops):
+        # Multilinear in the operands, e.g. a product
+        r = self._empty
+        for op in ops:
+            r = frozenset(tuple(sorted(a + b)) for a in r for b in op)
+        return r
+
+    def _union(self, o, *ops):
+        return frozenset().union(*ops)
+
+    sum = _union
+    list_tensor = _union
+
+    def conditional(self, o, c, t, f):
+        return t | f
+
+    def indexed(self, o, A, ii):
+        # Find the block of a fixed component of a mixed argument
+        f, jj = o.ufl_operands
+        while isinstance(f, (Grad, ReferenceGrad, Restricted)):
+            f, = f.ufl_operands
+        if isinstance(f, Argument) and isinstance(jj[0], FixedIndex):
+            components = self._sub_elements(f)
+            if components:
+                return frozenset([((f.number(), components[int(jj[0])]),)])
+        return A
+
+
+def compute_nonzero_blocks(form):
+    """Return the sorted list of the blocks of *form* with nonzero
+    terms, as tuples (ix,) for a linear form or (ix, iy) for a
+    bilinear form, indexing the sub spaces of the mixed spaces of the
+    arguments as in ``block_split``. Derivatives are assumed to be
+    expanded."""
+    form = as_form(form)
+    arity = len(form.arguments())
+    rules = BlockSparsityAnalyser()
+    blocks = set()
+    for itg in form.integrals():
+        for term in map_expr_dag(rules, itg.integrand()):
+            if tuple(n for n, i in term) == tuple(range(arity)):
+                blocks.add(tuple(i for n, i in term))
+    return sorted(blocks)
+
+
 def block_split(form, ix, iy=0):
     fs = FormSplitter()
     return fs.split(form, ix, iy)
@@ -33,9 +33,12 @@ from ufl.core.expr import ufl_err_str
 from ufl.argument import Argument
 from ufl.coefficient import Coefficient
 from ufl.constantvalue import Zero
+from ufl.form import Form
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dags
+from ufl.corealg.typemask import expr_type_mask, types_mask
 
 # Other algorithms:
-from ufl.algorithms.map_integrands import map_integrands
 from ufl.algorithms.transformer import Transformer
 from ufl.algorithms.replace import replace
 
@@ -63,6 +66,8 @@ class PartExtracter(Transformer):
     given argument(s).
     """
 
+    share_visit_cache = True
+
     def __init__(self, arguments):
         Transformer.__init__(self)
         self._want = set(arguments)
@@ -311,16 +316,193 @@ class PartExtracter(Transformer):
         return (x, most_provides)
 
 
+def _nonzero_parts(items):
+    return dict((provides, part) for provides, part in items
+                if not isinstance(part, Zero))
+
+
+class ArityPartsExtracter(MultiFunction):
+    """Split expressions into parts by the arguments they provide.
+
+    Maps each node to a dict from the frozenset of arguments provided
+    by a part to the nonzero part, in a single ``map_expr_dag`` pass
+    covering all arities. Subexpressions without arguments are not
+    visited, and map to themselves providing no arguments. The parts
+    of a sum or product are the sums of the parts of the terms and
+    the products of the parts of the factors respectively, collected
+    by the union of the arguments they provide.
+    """
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        self._argument_mask = types_mask(Argument)
+
+    def shortcut(self, o):
+        "Return the parts of a subexpression without arguments."
+        if expr_type_mask(o) & self._argument_mask:
+            return None
+        if isinstance(o, Zero):
+            return {}
+        return {frozenset(): o}
+
+    def expr(self, o, *ops):
+        """The default is a nonlinear operator not accepting any
+        Arguments among its operands."""
+        error("Found Argument in %s, this is an invalid expression." % ufl_err_str(o))
+
+    def argument(self, o):
+        "An argument provides itself."
+        return {frozenset((o,)): o}
+
+    def _map_parts(self, o, parts, *other_operands):
+        """Return the parts of *o* given the *parts* of its first
+        operand, keeping the *other_operands*."""
+        return _nonzero_parts(
+            (provides, self.reuse_if_untouched(o, part, *other_operands))
+            for provides, part in parts.items())
+
+    def variable(self, o, parts, label):
+        "Return the parts of the variable expression, with the same label."
+        return self._map_parts(o, parts, o.ufl_operands[1])
+
+    def sum(self, o, a, b):
+        "Return the sums of the parts of the terms providing the same arguments."
+        result = dict(a)
+        for provides, part in b.items():
+            other = result.get(provides)
+            if other is None:
+                result[provides] = part
+            else:
+                result[provides] = self.reuse_if_untouched(o, other, part)
+        return _nonzero_parts(result.items())
+
+    def product(self, o, a, b):
+        "Return the products of the parts of the factors."
+        result = {}
+        for pa, parta in a.items():
+            for pb, partb in b.items():
+                part = self.reuse_if_untouched(o, parta, partb)
+                provides = pa | pb
+                other = result.get(provides)
+                result[provides] = part if other is None else other + part
+        return _nonzero_parts(result.items())
+
+    # inner, outer and dot all behave as product
+    inner = product
+    outer = product
+    dot = product
+
+    def division(self, o, numerator, denominator):
+        "Return the parts of the numerator divided by the denominator."
+        if any(denominator):
+            error("Found Argument in denominator of %s , this is an invalid expression." % ufl_err_str(o))
+        return self._map_parts(o, numerator, o.ufl_operands[1])
+
+    def linear_operator(self, o, parts):
+        "Return the operator applied to each part of its operand."
+        return self._map_parts(o, parts)
+
+    # Positive and negative restrictions behave as linear operators
+    positive_restricted = linear_operator
+    negative_restricted = linear_operator
+
+    # Cell and facet average are linear operators
+    cell_avg = linear_operator
+    facet_avg = linear_operator
+
+    # Grad is a linear operator
+    grad = linear_operator
+
+    def linear_indexed_type(self, o, parts, index):
+        "Return the parts of the indexed expression, with the same index."
+        return self._map_parts(o, parts, o.ufl_operands[1])
+
+    # All of these indexed thingies behave as a linear_indexed_type
+    indexed = linear_indexed_type
+    index_sum = linear_indexed_type
+    component_tensor = linear_indexed_type
+
+    def list_tensor(self, o, *ops):
+        """Return list tensors of the parts of the components, with
+        zero components where a component has no such part."""
+        components = o.ufl_operands
+        result = {}
+        for parts in ops:
+            for provides in parts:
+                if provides not in result:
+                    subparts = [p[provides] if provides in p else zero_expr(c)
+                                for p, c in zip(ops, components)]
+                    result[provides] = self.reuse_if_untouched(o, *subparts)
+        return result
+
+
+def _check_no_parts(arguments, name):
+    parts = [arg.part() for arg in arguments]
+    if set(parts) - {None}:
+        error("%s cannot handle parts." % name)
+
+
+def _integrand_arity_part(parts, sub_arguments):
+    """Return the part of an integrand providing exactly the arguments
+    *sub_arguments*, given its parts from ``ArityPartsExtracter``, or
+    None if there is no such part."""
+    part = parts.get(sub_arguments)
+    if part is None:
+        # Refuse to choose between parts providing different
+        # arguments, as many of the wanted arguments
+        sizes = [len(provides) for provides in parts
+                 if provides and provides <= sub_arguments]
+        if sizes and sizes.count(max(sizes)) > 1:
+            error("Don't know what to do with sums with different Arguments.")
+    return part
+
+
+def compute_form_arity_parts(form, arguments=None, arities=None):
+    """Compute the parts of form of all arities at once.
+
+    Return a dict mapping each arity from 0 to the number of
+    arguments, or each of *arities* if given, to the Form of the terms
+    providing exactly the first arity arguments. The integrands are
+    traversed once, sharing subexpressions between the integrals."""
+
+    # Extract all arguments in form
+    if arguments is None:
+        arguments = form.arguments()
+    _check_no_parts(arguments, "compute_form_arity_parts")
+
+    if arities is None:
+        arities = range(len(arguments) + 1)
+
+    integrals = form.integrals()
+    integrands = [itg.integrand() for itg in integrals]
+    integrand_parts = map_expr_dags(ArityPartsExtracter(), integrands,
+                                    compress=False)
+
+    forms = {}
+    for arity in arities:
+        sub_arguments = frozenset(arguments[:arity])
+        new_integrals = []
+        for itg, parts in zip(integrals, integrand_parts):
+            part = _integrand_arity_part(parts, sub_arguments)
+            if part is not None:
+                new_integrals.append(itg.reconstruct(part)
+                                     if part is not itg.integrand() else itg)
+        if len(new_integrals) == len(integrals) and \
+           all(a is b for a, b in zip(new_integrals, integrals)):
+            # Keep the form object if no integrand was changed
+            forms[arity] = form
+        else:
+            forms[arity] = Form(new_integrals)
+    return forms
+
+
 def compute_form_with_arity(form, arity, arguments=None):
     """Compute parts of form of given arity."""
 
     # Extract all arguments in form
     if arguments is None:
         arguments = form.arguments()
-
-    parts = [arg.part() for arg in arguments]
-    if set(parts) - {None}:
-        error("compute_form_with_arity cannot handle parts.")
+    _check_no_parts(arguments, "compute_form_with_arity")
 
     if len(arguments) < arity:
         warning("Form has no parts with arity %d." % arity)
@@ -330,15 +512,7 @@ def compute_form_with_arity(form, arity, arguments=None):
     # that depend on different arguments, e.g. (u+v)*dx
     # would result in just v*dx. But that doesn't make
     # any sense anyway.
-    sub_arguments = set(arguments[:arity])
-    pe = PartExtracter(sub_arguments)
-
-    def _transform(e):
-        e, provides = pe.visit(e)
-        if provides == sub_arguments:
-            return e
-        return Zero()
-    return map_integrands(_transform, form)
+    return compute_form_arity_parts(form, arguments, (arity,))[arity]
 
 
 def compute_form_arities(form):
@@ -346,22 +520,10 @@ def compute_form_arities(form):
 
     # Extract all arguments present in form
     arguments = form.arguments()
+    _check_no_parts(arguments, "compute_form_arities")
 
-    parts = [arg.part() for arg in arguments]
-    if set(parts) - {None}:
-        error("compute_form_arities cannot handle parts.")
-
-    arities = set()
-    for arity in range(len(arguments)+1):
-
-        # Compute parts with arity "arity"
-        parts = compute_form_with_arity(form, arity, arguments)
-
-        # Register arity if "parts" does not vanish
-        if parts and parts.integrals():
-            arities.add(arity)
-
-    return arities
+    forms = compute_form_arity_parts(form, arguments)
+    return set(arity for arity, f in forms.items() if f.integrals())
 
 
 def compute_form_lhs(form):
@@ -386,6 +548,22 @@ def compute_form_rhs(form):
     return -compute_form_with_arity(form, 1)
 
 
+def compute_form_system(form):
+    """Compute the left and right hand sides of a form, see
+    ``compute_form_lhs`` and ``compute_form_rhs``, with a single
+    traversal of the integrands."""
+    arguments = form.arguments()
+    _check_no_parts(arguments, "compute_form_system")
+
+    arities = [arity for arity in (2, 1) if arity <= len(arguments)]
+    forms = compute_form_arity_parts(form, arguments, arities)
+    for arity in (2, 1):
+        if arity not in forms:
+            warning("Form has no parts with arity %d." % arity)
+            forms[arity] = 0*form
+    return forms[2], -forms[1]
+
+
 def compute_form_functional(form):
     """Compute the functional part of a form, that
     is the terms independent of Arguments.
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+"""This module contains the linearize algorithm, which turns
+preprocessed integrands into an ordered list of unique scalar
+operations in static single assignment form, for form compilers to
+generate code from.
+
+It supersedes the linearized graphs of ``ufl.formatting.graph``, which
+keep tensor valued nodes and index notation."""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from itertools import product as iter_product
+
+from ufl.log import error
+from ufl.core.expr import Expr
+from ufl.core.terminal import FormArgument
+from ufl.core.multiindex import FixedIndex
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.map_dag import map_expr_dags
+from ufl.corealg.dependencies import form_argument_dependencies
+from ufl.argument import Argument
+from ufl.coefficient import Coefficient
+from ufl.geometry import SpatialCoordinate
+from ufl.differentiation import Grad, ReferenceGrad
+from ufl.constantvalue import Zero
+from ufl.indexed import Indexed
+from ufl.operators import balanced_sum
+from ufl.referencevalue import ReferenceValue
+from ufl.checks import is_cellwise_constant
+from ufl.utils.sequences import product
+
+# Tags of the values of a program, ordered such that a value depending
+# on values with several tags gets the last of them
+CELLWISE_CONSTANT = "cellwise_constant"
+QUADRATURE_POINT = "quadrature_point"
+ARGUMENT = "argument"
+TAGS = (CELLWISE_CONSTANT, QUADRATURE_POINT, ARGUMENT)
+
+
+def _components(shape):
+    "Return list of the component tuples of *shape* in row major ordering."
+    return list(iter_product(*[range(n) for n in shape]))
+
+
+def _flat_index(values, dims):
+    "Return the row major flat index of the tuple *values* with dimensions *dims*."
+    k = 0
+    for v, n in zip(values, dims):
+        k = k*n + v
+    return k
+
+
+class ScalarRebuilder(MultiFunction):
+    """Map each node of an expression to the list of its scalar
+    components.
+
+    The components of a node with shape ``sh`` and free indices with
+    dimensions ``fid`` are ordered with the flattened shape component
+    first and the flattened free index values last, i.e. the component
+    ``c`` with index values ``f`` is at position
+    ``flat(c)*product(fid) + flat(f)``.
+
+    The components of modified terminals, i.e. terminals wrapped in
+    derivatives, restrictions, averages or reference values, are
+    ``Indexed`` nodes with fixed indices. All other components are
+    built from scalar operators, folding constants and zeros on the
+    way.
+    """
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+
+    def expr(self, o, *ops):
+        error("Missing linearization rule for %s, expecting a preprocessed "
+              "expression." % o._ufl_class_.__name__)
+
+    # --- Inputs
+
+    def terminal(self, o):
+        if o.ufl_shape == ():
+            return [o]
+        return self.modified_terminal(o)
+
+    def zero(self, o):
+        return [Zero()]*(product(o.ufl_shape)*product(o.ufl_index_dimensions))
+
+    def multi_index(self, o):
+        return None
+
+    def label(self, o):
+        return None
+
+    def modified_terminal(self, o):
+        # Find the terminal, checking that the modifiers are applied
+        # to terminals only
+        t = o
+        reference_value = False
+        while not t._ufl_is_terminal_:
+            if not t._ufl_is_terminal_modifier_:
+                error("Expecting only terminal modifiers between %s and a "
+                      "terminal, apply derivatives and restrictions first."
+                      % o._ufl_class_.__name__)
+            reference_value = reference_value or isinstance(t, ReferenceValue)
+            t, = t.ufl_operands
+        if o.ufl_free_indices:
+            error("Not expecting free indices in modified terminal.")
+
+        if o.ufl_shape == ():
+            return [o]
+
+        # Map the value components of form arguments through the
+        # symmetry mapping of their element
+        symmetry = {}
+        if isinstance(t, FormArgument) and not reference_value:
+            symmetry = t.ufl_element().symmetry()
+        rank = len(t.ufl_shape)
+        components = []
+        for c in _components(o.ufl_shape):
+            c = symmetry.get(c[:rank], c[:rank]) + c[rank:]
+            components.append(o[c])
+        return components
+
+    grad = modified_terminal
+    reference_grad = modified_terminal
+    restricted = modified_terminal
+    reference_value = modified_terminal
+    cell_avg = modified_terminal
+    facet_avg = modified_terminal
+
+    # --- Index notation
+
+    def _free_index_values(self, o):
+        "Return list of dicts mapping the free indices of *o* to values."
+        fi = o.ufl_free_indices
+        return [dict(zip(fi, f)) for f in _components(o.ufl_index_dimensions)]
+
+    def _pick(self, a, components, c, values):
+        """Return the component *c* with free index values *values* of
+        the operand *a* with scalar *components*."""
+        fid = a.ufl_index_dimensions
+        f = tuple(values[k] for k in a.ufl_free_indices)
+        return components[_flat_index(c, a.ufl_shape)*product(fid) + _flat_index(f, fid)]
+
+    def indexed(self, o, A, ii):
+        a, ii = o.ufl_operands
+        result = []
+        for values in self._free_index_values(o):
+            c = tuple(int(i) if isinstance(i, FixedIndex) else values[i.count()]
+                      for i in ii)
+            result.append(self._pick(a, A, c, values))
+        return result
+
+    def component_tensor(self, o, A, ii):
+        a, ii = o.ufl_operands
+        counts = [i.count() for i in ii]
+        fvalues = self._free_index_values(o)
+        result = []
+        for c in _components(o.ufl_shape):
+            for values in fvalues:
+                values = dict(values)
+                values.update(zip(counts, c))
+                result.append(self._pick(a, A, (), values))
+        return result
+
+    def index_sum(self, o, A, ii):
+        a, ii = o.ufl_operands
+        count = ii[0].count()
+        n = o.dimension()
+        result = []
+        for c in _components(o.ufl_shape):
+            for values in self._free_index_values(o):
+                terms = []
+                for k in range(n):
+                    values[count] = k
+                    terms.append(self._pick(a, A, c, values))
+                result.append(balanced_sum(terms))
+        return result
+
+    def list_tensor(self, o, *ops):
+        # The components of a list tensor are the components of its
+        # operands in order
+        result = []
+        for op in ops:
+            result.extend(op)
+        return result
+
+    def variable(self, o, a, l):
+        return a
+
+    # --- Scalar operators
+
+    def elementwise(self, o, *ops):
+        """Apply *o* to each combination of components of its operands,
+        which are either scalar or have the shape of *o*."""
+        operands = o.ufl_operands
+        result = []
+        for c in _components(o.ufl_shape):
+            for values in self._free_index_values(o):
+                args = [self._pick(a, A, c if a.ufl_shape else (), values)
+                        for a, A in zip(operands, ops)]
+                result.append(o._ufl_expr_reconstruct_(*args))
+        return result
+
+    sum = elementwise
+    product = elementwise
+    division = elementwise
+    power = elementwise
+    abs = elementwise
+    math_function = elementwise
+    atan_2 = elementwise
+    bessel_function = elementwise
+    min_value = elementwise
+    max_value = elementwise
+    condition = elementwise
+    conditional = elementwise
+
+
+def _is_input(v):
+    "Return whether the scalar *v* is an input of a program."
+    return v._ufl_is_terminal_ or v._ufl_is_terminal_modifier_ or isinstance(v, Indexed)
+
+
+def _is_cellwise_constant_input(v):
+    """Return whether the input *v* is constant over each cell,
+    considering derivatives of polynomials of low degree."""
+    if is_cellwise_constant(v):
+        return True
+    # Count the derivatives of the modified terminal
+    if isinstance(v, Indexed):
+        v = v.ufl_operands[0]
+    reference_derivatives = 0
+    derivatives = 0
+    while not v._ufl_is_terminal_:
+        if isinstance(v, ReferenceGrad):
+            reference_derivatives += 1
+        elif isinstance(v, Grad):
+            derivatives += 1
+        v, = v.ufl_operands
+    if isinstance(v, SpatialCoordinate):
+        degree = v.ufl_domain().ufl_coordinate_element().degree()
+    elif isinstance(v, Coefficient):
+        degree = v.ufl_element().degree()
+    else:
+        return False
+    if degree is None:
+        return False
+    if derivatives and not v.ufl_domain().is_piecewise_linear_simplex_domain():
+        # Physical derivatives are not polynomials on other cells
+        return False
+    cell = v.ufl_domain().ufl_cell()
+    if isinstance(degree, tuple):
+        # Total degree of tensor product elements
+        degree = sum(degree)
+    elif not cell.is_simplex():
+        # Degree k per direction on quadrilaterals and hexahedra,
+        # e.g. x*y for Q1, bounding the total degree by k*tdim
+        degree *= cell.topological_dimension()
+    return derivatives + reference_derivatives >= degree
+
+
+def _input_tag(v):
+    "Return the tag of the input *v*."
+    if any(isinstance(f, Argument) for f in form_argument_dependencies(v)):
+        return ARGUMENT
+    elif _is_cellwise_constant_input(v):
+        return CELLWISE_CONSTANT
+    else:
+        return QUADRATURE_POINT
+
+
+class LinearizedProgram(object):
+    """An ordered list of unique scalar values in static single
+    assignment form.
+
+    Each value ``k`` is either an input, i.e. a literal, a scalar
+    modified terminal or a fixed component of a modified terminal, or
+    an operation applied to values numbered before ``k``.
+
+    *Attributes*
+        ``values[k]`` is the scalar ``Expr`` of value ``k``.
+
+        ``operands[k]`` is the tuple of the value numbers of the
+        operands of value ``k``, in the order of ``ufl_operands``,
+        and empty for inputs.
+
+        ``use_counts[k]`` is the number of times value ``k`` is
+        referenced by operations and roots.
+
+        ``tags[k]`` is one of ``CELLWISE_CONSTANT``,
+        ``QUADRATURE_POINT`` or ``ARGUMENT``, telling whether the
+        value is constant over each cell, varies with the quadrature
+        point, or depends on an argument.
+
+        ``roots[i]`` is the list of the value numbers of the flattened
+        components of the ``i``'th expression the program was built
+        from.
+    """
+
+    def __init__(self, values, operands, use_counts, tags, roots):
+        self.values = values
+        self.operands = operands
+        self.use_counts = use_counts
+        self.tags = tags
+        self.roots = roots
+
+    def __len__(self):
+        "Return the number of values of the program."
+        return len(self.values)
+
+    def is_input(self, k):
+        "Return whether value *k* is an input."
+        return not self.operands[k]
+
+    def inputs(self):
+        "Return list of the value numbers of the inputs."
+        return [k for k in range(len(self.values)) if self.is_input(k)]
+
+    def operations(self):
+        "Return list of the value numbers of the operations."
+        return [k for k in range(len(self.values)) if not self.is_input(k)]
+
+    def partition(self):
+        "Return dict mapping each tag to the list of value numbers with the tag."
+        partitions = dict((tag, []) for tag in TAGS)
+        for k, tag in enumerate(self.tags):
+            partitions[tag].append(k)
+        return partitions
+
+    def __str__(self):
+        lines = []
+        for k, v in enumerate(self.values):
+            if self.is_input(k):
+                rhs = str(v)
+            else:
+                rhs = "%s(%s)" % (v._ufl_class_.__name__,
+                                  ", ".join("t%d" % j for j in self.operands[k]))
+            lines.append("t%d = %s  # %s, %d uses" % (k, rhs, self.tags[k],
+                                                     self.use_counts[k]))
+        for i, root in enumerate(self.roots):
+            lines.append("return %d: %s" % (i, ", ".join("t%d" % k for k in root)))
+        return "\n".join(lines)
+
+
+def linearize(expressions):
+    """Linearize an ``Expr`` or a list of ``Expr`` objects into a
+    ``LinearizedProgram``.
+
+    The expressions must be preprocessed, i.e. with compound tensor
+    algebra lowered, derivatives applied and restrictions propagated
+    to terminals, as done by ``compute_form_data``. Index notation and
+    tensor valued expressions are expanded into scalar components.
+    Subexpressions shared between components and expressions are
+    computed once, and values are numbered such that operands are
+    numbered before the operations using them.
+    """
+    if isinstance(expressions, Expr):
+        expressions = [expressions]
+    if not all(isinstance(e, Expr) for e in expressions):
+        error("Expecting an Expr or a list of Expr objects.")
+
+    # Expand the expressions into scalar components
+    components = map_expr_dags(ScalarRebuilder(), expressions, compress=False)
+
+    # Number the unique scalar values in post traversal ordering,
+    # without visiting the operands of inputs
+    numbering = {}
+    values = []
+    operands = []
+    tags = []
+    for root in (v for comps in components for v in comps):
+        if root in numbering:
+            continue
+        stack = [root]
+        while stack:
+            v = stack[-1]
+            if v in numbering:
+                stack.pop()
+                continue
+            if _is_input(v):
+                ops = ()
+                tag = _input_tag(v)
+            else:
+                missing = [o for o in v.ufl_operands if o not in numbering]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                ops = tuple(numbering[o] for o in v.ufl_operands)
+                tag = TAGS[max([TAGS.index(tags[j]) for j in ops] or [0])]
+            stack.pop()
+            numbering[v] = len(values)
+            values.append(v)
+            operands.append(ops)
+            tags.append(tag)
+
+    roots = [[numbering[v] for v in comps] for comps in components]
+
+    use_counts = [0]*len(values)
+    for ops in operands:
+        for j in ops:
+            use_counts[j] += 1
+    for root in roots:
+        for k in root:
+            use_counts[k] += 1
+
+    return LinearizedProgram(values, operands, use_counts, tags, roots)
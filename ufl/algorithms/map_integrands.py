@@ -39,11 +39,18 @@ def map_integrands(function, form, only_integral_type=None):
                             for itg in form.integrals()]
         nonzero_integrals = [itg for itg in mapped_integrals
                              if not isinstance(itg.integrand(), Zero)]
+        if all(a is b for a, b in zip(nonzero_integrals, form.integrals())) and \
+           len(nonzero_integrals) == len(form.integrals()):
+            # Keep the form object if no integrand was changed
+            return form
         return Form(nonzero_integrals)
     elif isinstance(form, Integral):
         itg = form
         if (only_integral_type is None) or (itg.integral_type() in only_integral_type):
-            return itg.reconstruct(function(itg.integrand()))
+            integrand = function(itg.integrand())
+            if integrand is itg.integrand():
+                return itg
+            return itg.reconstruct(integrand)
         else:
             return itg
     elif isinstance(form, Expr):
@@ -53,6 +60,7 @@ def map_integrands(function, form, only_integral_type=None):
         error("Expecting Form, Integral or Expr.")
 
 
-def map_integrand_dags(function, form, only_integral_type=None, compress=True):
-    return map_integrands(lambda expr: map_expr_dag(function, expr, compress),
+def map_integrand_dags(function, form, only_integral_type=None, compress=True,
+                       cache=None):
+    return map_integrands(lambda expr: map_expr_dag(function, expr, compress, cache),
                           form, only_integral_type)
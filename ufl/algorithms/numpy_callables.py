@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""This module contains the compile_callable algorithm, which
+generates straight-line NumPy code evaluating an expression."""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+import numpy
+
+from ufl.log import error
+from ufl.core.terminal import FormArgument
+from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.traversal import traverse_unique_terminals
+from ufl.constantvalue import ConstantValue, as_ufl
+from ufl.exprcontainers import ExprList
+from ufl.indexed import Indexed
+from ufl.algorithms.ad import expand_derivatives
+from ufl.algorithms.linearize import linearize
+from ufl.algorithms.signature import compute_expression_signature
+from ufl.algorithms.batch_evaluation import _numpy_names
+
+# Generated functions by signature of the expression and arguments
+_compiled_callables = {}
+
+
+def _stack(components, shape):
+    "Stack the values of the scalar *components* into an array."
+    components = numpy.broadcast_arrays(*components)
+    return numpy.stack(components, axis=-1).reshape(components[0].shape + shape)
+
+
+class NumPyFormatter(MultiFunction):
+    """Format scalar operators as Python expressions of NumPy
+    functions, given the formatted operands."""
+
+    def __init__(self):
+        MultiFunction.__init__(self)
+        # Names to define in the namespace of the generated code
+        self.namespace = {"numpy": numpy, "_stack": _stack}
+
+    def expr(self, o, *ops):
+        error("Cannot generate NumPy code for %s." % o._ufl_class_.__name__)
+
+    def sum(self, o, a, b):
+        return "%s + %s" % (a, b)
+
+    def product(self, o, a, b):
+        return "%s * %s" % (a, b)
+
+    def division(self, o, a, b):
+        return "%s / %s" % (a, b)
+
+    def power(self, o, a, b):
+        return "%s ** %s" % (a, b)
+
+    def abs(self, o, a):
+        return "numpy.abs(%s)" % a
+
+    def math_function(self, o, a):
+        name = _numpy_names.get(o._name, o._name)
+        if not hasattr(numpy, name):
+            self.namespace[name] = numpy.vectorize(getattr(math, name))
+            return "%s(%s)" % (name, a)
+        return "numpy.%s(%s)" % (name, a)
+
+    def atan_2(self, o, a, b):
+        return "numpy.arctan2(%s, %s)" % (a, b)
+
+    def bessel_function(self, o, nu, a):
+        try:
+            import scipy.special
+        except ImportError:
+            error("You must have scipy installed to evaluate bessel functions in python.")
+        self.namespace["special"] = scipy.special
+        return "special.%sv(%s, %s)" % (o._name[-1], nu, a)
+
+    def min_value(self, o, a, b):
+        return "numpy.minimum(%s, %s)" % (a, b)
+
+    def max_value(self, o, a, b):
+        return "numpy.maximum(%s, %s)" % (a, b)
+
+    def binary_condition(self, o, a, b):
+        return "%s %s %s" % (a, o._name, b)
+
+    def and_condition(self, o, a, b):
+        return "numpy.logical_and(%s, %s)" % (a, b)
+
+    def or_condition(self, o, a, b):
+        return "numpy.logical_or(%s, %s)" % (a, b)
+
+    def not_condition(self, o, a):
+        return "numpy.logical_not(%s)" % a
+
+    def conditional(self, o, c, t, f):
+        return "numpy.where(%s, %s, %s)" % (c, t, f)
+
+
+def _renumbering(expr):
+    """Number the form arguments and domains of *expr* in the order
+    they are found, such that equal expressions of other form
+    arguments get equal signatures."""
+    renumbering = {}
+    coefficients = 0
+    domains = 0
+    for t in traverse_unique_terminals(expr):
+        if isinstance(t, FormArgument) and t not in renumbering:
+            renumbering[t] = coefficients
+            coefficients += 1
+        d = t.ufl_domain()
+        if d is not None and d not in renumbering:
+            renumbering[d] = domains
+            domains += 1
+    return renumbering
+
+
+def _generate_callable(expr, arguments):
+    "Generate the source code and namespace of a function evaluating *expr*."
+    expr = expand_derivatives(expr)
+    program = linearize(expr)
+    formatter = NumPyFormatter()
+
+    # Names of the values of the program, literals are inlined
+    names = []
+    lines = []
+    for k, v in enumerate(program.values):
+        if program.is_input(k):
+            if isinstance(v, ConstantValue):
+                # Parenthesize negative literals, as in (-2.0) ** t0
+                names.append("(%r)" % float(v) if float(v) < 0 else repr(float(v)))
+                continue
+            if isinstance(v, Indexed):
+                t, c = v.ufl_operands
+                c = tuple(int(i) for i in c)
+            else:
+                t, c = v, ()
+            if t not in arguments:
+                error("Expression depends on %s, which is not among the arguments." % t)
+            rhs = "a%d" % arguments.index(t)
+            if c:
+                rhs += "[..., %s]" % ", ".join(str(i) for i in c)
+        else:
+            rhs = formatter(v, *[names[j] for j in program.operands[k]])
+        names.append("t%d" % k)
+        lines.append("    t%d = %s" % (k, rhs))
+
+    components = ", ".join(names[k] for k in program.roots[0])
+    lines.append("    return _stack([%s], %s)" % (components, expr.ufl_shape))
+    parameters = ", ".join("a%d" % i for i in range(len(arguments)))
+    source = "def ufl_callable(%s):\n%s\n" % (parameters, "\n".join(lines))
+    return source, formatter.namespace
+
+
+def compile_callable(expr, arguments=()):
+    """Compile *expr* into a Python function of NumPy arrays.
+
+    The function takes the values of the expressions *arguments* in
+    order, e.g. of a ``SpatialCoordinate`` and of coefficients or
+    their gradients, as arrays with shape ``batch_shape + a.ufl_shape``
+    for each argument ``a``, and returns an array with shape
+    ``batch_shape + expr.ufl_shape``, where the batch shapes of the
+    arguments are broadcast together. The expression may not depend on
+    other terminals than the arguments and literals.
+
+    The expression is linearized into scalar operations once, and the
+    generated code computes each of them once for the whole batch.
+    Functions are cached by the signature of the expression and
+    arguments, such that compiling equal expressions of other
+    coefficients of the same space returns the same function. The
+    generated source is available as its ``source`` attribute.
+    """
+    expr = as_ufl(expr)
+    arguments = tuple(as_ufl(a) for a in arguments)
+    if expr.ufl_free_indices:
+        error("Cannot compile expression with free indices.")
+    if any(a.ufl_free_indices for a in arguments):
+        error("Expecting arguments without free indices.")
+
+    # Number the form arguments of the arguments first, as the
+    # generated code refers to them by position
+    key = ExprList(*(arguments + (expr,)))
+    signature = compute_expression_signature(key, _renumbering(key))
+    function = _compiled_callables.get(signature)
+    if function is None:
+        source, namespace = _generate_callable(expr, arguments)
+        exec(compile(source, "<ufl_callable>", "exec"), namespace)
+        function = namespace["ufl_callable"]
+        function.source = source
+        _compiled_callables[signature] = function
+    return function
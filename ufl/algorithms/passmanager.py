@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""A pass manager running and instrumenting the symbolic passes
+of the form preprocessing pipeline."""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from timeit import default_timer
+
+from ufl.log import error
+from ufl.core.expr import Expr
+from ufl.corealg.traversal import unique_post_traversal
+from ufl.integral import Integral
+from ufl.form import Form
+
+
+def _integrands(obj):
+    "Return list of the integrand expressions of a Form, Integral or Expr."
+    if isinstance(obj, Form):
+        return [itg.integrand() for itg in obj.integrals()]
+    elif isinstance(obj, Integral):
+        return [obj.integrand()]
+    elif isinstance(obj, Expr):
+        return [obj]
+    else:
+        error("Expecting Form, Integral or Expr.")
+
+
+def _describe(obj):
+    "Return short description of a Form, Integral or Expr for pass statistics."
+    if isinstance(obj, Form):
+        return "form"
+    elif isinstance(obj, Integral):
+        return "%s integral %s" % (obj.integral_type(), obj.subdomain_id())
+    else:
+        return "expression"
+
+
+def count_nodes(obj):
+    """Count the nodes of the integrands of a Form, Integral or Expr.
+
+    Returns a tuple ``(num_nodes, num_unique_nodes)``, where
+    ``num_nodes`` is the size of the expressions viewed as trees, and
+    ``num_unique_nodes`` is the number of unique nodes of the DAG.
+    Both are computed in time linear in the number of unique nodes.
+    """
+    sizes = {}
+    visited = set()
+    num_nodes = 0
+    for expr in _integrands(obj):
+        for v in unique_post_traversal(expr, visited):
+            sizes[v] = 1 + sum(sizes[o] for o in v.ufl_operands)
+        num_nodes += sizes[expr]
+    return num_nodes, len(sizes)
+
+
+# Alias for use where the name is shadowed by an argument
+_count_nodes = count_nodes
+
+
+class PassStatistics(object):
+    """Statistics of a single run of a pass.
+
+    *Attributes*
+        ``name``
+            The name of the pass.
+        ``target``
+            Description of the form or integral the pass was applied to.
+        ``time``
+            Wall time in seconds.
+        ``nodes_in``, ``nodes_out``
+            Number of expression nodes before and after the pass,
+            counting shared subexpressions once for each use.
+        ``unique_nodes_in``, ``unique_nodes_out``
+            Number of unique expression nodes before and after the pass.
+        ``skipped``
+            True if the pass was not run because its input was unchanged.
+
+    The node counts are ``None`` if node counting is disabled.
+    """
+
+    def __init__(self, name, target, time=0.0,
+                 nodes_in=None, nodes_out=None,
+                 unique_nodes_in=None, unique_nodes_out=None,
+                 skipped=False):
+        self.name = name
+        self.target = target
+        self.time = time
+        self.nodes_in = nodes_in
+        self.nodes_out = nodes_out
+        self.unique_nodes_in = unique_nodes_in
+        self.unique_nodes_out = unique_nodes_out
+        self.skipped = skipped
+
+    def __repr__(self):
+        return "PassStatistics(%r, %r, %r, %r, %r, %r, %r, %r)" % (
+            self.name, self.target, self.time,
+            self.nodes_in, self.nodes_out,
+            self.unique_nodes_in, self.unique_nodes_out,
+            self.skipped)
+
+    def __str__(self):
+        if self.skipped:
+            return "%s on %s: skipped" % (self.name, self.target)
+        s = "%s on %s: %.3g s" % (self.name, self.target, self.time)
+        if self.nodes_in is not None:
+            s += ", nodes %d -> %d, unique nodes %d -> %d" % (
+                self.nodes_in, self.nodes_out,
+                self.unique_nodes_in, self.unique_nodes_out)
+        return s
+
+
+class PassManager(object):
+    """Runs named passes on forms, integrals or expressions and
+    records a ``PassStatistics`` object for each run in ``statistics``.
+
+    If *callback* is given, it is called with each ``PassStatistics``
+    object as soon as it is recorded.
+
+    If *count_nodes* is true, the number of nodes before and after
+    each pass is recorded. This requires a traversal of the input
+    and output of each pass.
+    """
+
+    def __init__(self, callback=None, count_nodes=True):
+        self.callback = callback
+        self.count_nodes = count_nodes
+        self.statistics = []
+        # Pass name -> last object returned by that pass
+        self._last_results = {}
+
+    def record(self, stats):
+        "Record a ``PassStatistics`` object, e.g. from a pass run elsewhere."
+        self.statistics.append(stats)
+        if self.callback is not None:
+            self.callback(stats)
+
+    def run(self, function, obj, args=(), name=None, repeat=False,
+            count_nodes=None):
+        """Return ``function(obj, *args)`` and record statistics of the pass.
+
+        The pass name defaults to the name of *function*.
+
+        If *repeat* is true, the pass is a repeated application of an
+        idempotent pass, and is skipped if *obj* is the identical
+        object that the last run of the pass with the same name
+        returned.
+
+        If *count_nodes* is given, it overrides the ``count_nodes``
+        setting of the pass manager for this run, e.g. for passes whose
+        purpose is to reduce the number of nodes.
+        """
+        if name is None:
+            name = function.__name__
+        target = _describe(obj)
+        if count_nodes is None:
+            count_nodes = self.count_nodes
+
+        if repeat and self._last_results.get(name) is obj:
+            self.record(PassStatistics(name, target, skipped=True))
+            return obj
+
+        if count_nodes:
+            nodes_in, unique_nodes_in = _count_nodes(obj)
+
+        t0 = default_timer()
+        result = function(obj, *args)
+        t1 = default_timer()
+
+        stats = PassStatistics(name, target, t1 - t0)
+        if count_nodes:
+            stats.nodes_in = nodes_in
+            stats.unique_nodes_in = unique_nodes_in
+            stats.nodes_out, stats.unique_nodes_out = _count_nodes(result)
+
+        self._last_results[name] = result
+        self.record(stats)
+        return result
+
+    def total_times(self):
+        "Return dict mapping pass names to the total wall time of all runs."
+        times = {}
+        for stats in self.statistics:
+            times[stats.name] = times.get(stats.name, 0.0) + stats.time
+        return times
+
+    def __str__(self):
+        return "\n".join(str(stats) for stats in self.statistics)
@@ -25,9 +25,12 @@ from ufl.core.multiindex import Index, FixedIndex, MultiIndex
 from ufl.variable import Label, Variable
 from ufl.algorithms.transformer import ReuseTransformer, apply_transformer
 from ufl.classes import Zero
+from ufl.corealg.traversal import traverse_unique_terminals
 
 
 class VariableRenumberingTransformer(ReuseTransformer):
+    share_visit_cache = True
+
     def __init__(self):
         ReuseTransformer.__init__(self)
         self.variable_map = {}
@@ -83,3 +86,21 @@ def renumber_indices(expr):
         if num_free_indices != len(result.ufl_free_indices):
             error("The number of free indices left in expression should be invariant w.r.t. renumbering.")
     return result
+
+
+def update_global_counts(expressions):
+    """Make sure indices and labels created after this call get counts
+    that do not clash with those in *expressions*.
+
+    Needed for expressions created in another process, e.g. loaded
+    from a file.
+    """
+    for expr in expressions:
+        for t in traverse_unique_terminals(expr):
+            if isinstance(t, MultiIndex):
+                for i in t.indices():
+                    if isinstance(i, Index) and i.count() >= Index._globalcount:
+                        Index._globalcount = i.count() + 1
+            elif isinstance(t, Label):
+                if t.count() >= Label._globalcount:
+                    Label._globalcount = t.count() + 1
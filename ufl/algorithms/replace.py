@@ -38,6 +38,9 @@ class Replacer(MultiFunction):
             error("This implementation can only replace Terminal objects.")
         if not all(k.ufl_shape == v.ufl_shape for k, v in iteritems(mapping)):
             error("Replacement expressions must have the same shape as what they replace.")
+        # Subexpressions without the replaced terminals are left untouched
+        self.transformed_types = tuple(set(type(k) for k in iterkeys(mapping))) + \
+            (CoefficientDerivative,)
 
     expr = MultiFunction.reuse_if_untouched
 
@@ -18,6 +18,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with UFL. If not, see <http://www.gnu.org/licenses/>.
 
+import binascii
 import hashlib
 from ufl.classes import (Label,
                          Index, MultiIndex,
@@ -26,7 +27,7 @@ from ufl.classes import (Label,
                          ExprList, ExprMapping)
 from ufl.log import error
 from ufl.utils.py23 import as_bytes
-from ufl.corealg.traversal import traverse_unique_terminals, pre_traversal
+from ufl.corealg.traversal import traverse_unique_terminals
 from ufl.algorithms.domain_analysis import canonicalize_metadata
 
 
@@ -102,21 +103,54 @@ def compute_terminal_hashdata(expressions, renumbering):
     return terminal_hashdata
 
 
-def compute_expression_hashdata(expression, terminal_hashdata):
-    # The hashdata computed here can be interpreted as prefix operator
-    # notation, i.e. we store the equivalent of '+ * a b * c d' for
-    # the expression (a*b)+(c*d)
-    expression_hashdata = []
-    for expr in pre_traversal(expression):
-        if expr._ufl_is_terminal_:
-            data = terminal_hashdata[expr]
+def compute_expression_hashdata(expression, terminal_hashdata, node_hashdata=None):
+    """Compute the hashdata of *expression* as a Merkle-style digest.
+
+    Each unique node is hashed once, from the hashdata of terminals
+    and from the typecode and the operand digests of operators. The
+    cost is thus linear in the number of unique nodes in the DAG,
+    not in the size of the expanded tree.
+
+    The digests of all visited nodes are stored in the optional dict
+    *node_hashdata*, which can be shared between expressions with
+    common subexpressions.
+
+    Returns the hex digest of *expression*.
+    """
+    if node_hashdata is None:
+        node_hashdata = {}
+
+    # Modelled after compute_expr_hash to avoid recursion, with
+    # cutoff at nodes that have already been hashed
+    stack = []
+    if expression not in node_hashdata:
+        stack.append([expression, expression.ufl_operands, 0])
+    while stack:
+        entry = stack[-1]
+        expr, ops, k = entry
+
+        # Skip operands that have already been hashed
+        n = len(ops)
+        while k < n and ops[k] in node_hashdata:
+            k += 1
+        entry[2] = k
+
+        if k < n:
+            # Hash the next operand first
+            o = ops[k]
+            stack.append([o, o.ufl_operands, 0])
         else:
-            data = expr._ufl_typecode_  # TODO: Use expr._ufl_signature_data_()? More extensible, but more overhead.
-        expression_hashdata.append(data)
-    # Oneliner: TODO: Benchmark, maybe use a generator?
-    # expression_hashdata = [(terminal_hashdata[expr] if expr._ufl_is_terminal_ else expr._ufl_typecode_)
-    #                       for expr in pre_traversal(expression)]
-    return expression_hashdata
+            # All operands hashed, hash this node
+            if expr._ufl_is_terminal_:
+                data = as_bytes("T" + str(terminal_hashdata[expr]))
+            else:
+                # Operand digests have fixed size
+                data = as_bytes("O%d:" % expr._ufl_typecode_)
+                data += b"".join(node_hashdata[o] for o in ops)
+            node_hashdata[expr] = hashlib.sha256(data).digest()
+            stack.pop()
+
+    return binascii.hexlify(node_hashdata[expression]).decode("ascii")
 
 
 def compute_expression_signature(expr, renumbering):  # FIXME: Fix callers
@@ -130,7 +164,7 @@ def compute_expression_signature(expr, renumbering):  # FIXME: Fix callers
 
     # Pass it through a seriously overkill hashing algorithm
     # (should we use sha1 instead?)
-    data = as_bytes(str(expression_hashdata))
+    data = as_bytes(expression_hashdata)
     return hashlib.sha512(data).hexdigest()
 
 
@@ -143,12 +177,15 @@ def compute_form_signature(form, renumbering):  # FIXME: Fix callers
     # replacement of functions and index labels.
     terminal_hashdata = compute_terminal_hashdata(integrands, renumbering)
 
-    # Build hashdata for each integral
+    # Build hashdata for each integral, sharing the digests of
+    # subexpressions between integrals
+    node_hashdata = {}
     hashdata = []
     for integral in integrals:
         # Compute hash data for expression, this is the expensive part
         integrand_hashdata = compute_expression_hashdata(integral.integrand(),
-                                                         terminal_hashdata)
+                                                         terminal_hashdata,
+                                                         node_hashdata)
 
         domain_hashdata = integral.ufl_domain()._ufl_signature_data_(renumbering)
 
@@ -42,6 +42,11 @@ class Transformer(object):
     transform expression trees from one representation to another."""
     _handlers_cache = {}
 
+    # Set to True in subclasses where the results of all handlers
+    # depend on nothing but the visited expression, to reuse results
+    # between the calls to visit made by handlers
+    share_visit_cache = False
+
     def __init__(self, variable_cache=None):
         if variable_cache is None:
             variable_cache = {}
@@ -73,6 +78,8 @@ class Transformer(object):
         # Keep a stack of objects visit is called on, to ease
         # backtracking
         self._visit_stack = []
+        # Results of the outermost call to visit, if shared
+        self._visit_cache = None
 
     def print_visit_stack(self):
         print("/"*80)
@@ -86,30 +93,68 @@ class Transformer(object):
         print("\\"*80)
 
     def visit(self, o):
-        # Update stack
-        self._visit_stack.append(o)
-
-        # Get handler for the UFL class of o (type(o) may be an
-        # external subclass of the actual UFL class)
-        h, visit_children_first = self._handlers[o._ufl_typecode_]
-
-        # if not h:
-        #    # Failed to find a handler! Should never happen, but will happen if a non-Expr object is visited.
-        #    error("Can't handle objects of type %s" % str(type(o)))
-
-        # Is this a handler that expects transformed children as
-        # input?
-        if visit_children_first:
-            # Yes, visit all children first and then call h.
-            r = h(o, *[self.visit(op) for op in o.ufl_operands])
-        else:
-            # No, this is a handler that handles its own children
-            # (arguments self and o, where self is already bound)
-            r = h(o)
+        """Return the transformed expression *o*.
+
+        Handlers taking the transformed operands as arguments are
+        called child before parent, without recursion, and called
+        once for each unique subexpression visited by this call.
+        Handlers taking only the expression handle its operands
+        themselves by calling ``visit``, and may change the state of
+        the transformer between these calls, e.g. to push the current
+        component. The results of a call to ``visit`` are therefore
+        not reused in other calls, unless ``share_visit_cache`` is
+        true.
+        """
+        cache = self._visit_cache
+        toplevel = cache is None
+        if toplevel or not self.share_visit_cache:
+            cache = {}
+            if toplevel and self.share_visit_cache:
+                self._visit_cache = cache
+        try:
+            return self._visit(o, cache)
+        finally:
+            if toplevel:
+                self._visit_cache = None
+
+    def _visit(self, o, cache):
+        "Non-recursive implementation of visit, storing results in *cache*."
+        if o in cache:
+            return cache[o]
 
-        # Update stack and return
-        self._visit_stack.pop()
-        return r
+        # Keep a stack of objects visit is called on, to ease
+        # backtracking. The nodes above the initial size are the
+        # nodes being visited by this call, each an operand of the
+        # previous one
+        stack = self._visit_stack
+        size = len(stack)
+        stack.append(o)
+        handlers = self._handlers
+        while len(stack) > size:
+            e = stack[-1]
+
+            # Get handler for the UFL class of e (type(e) may be an
+            # external subclass of the actual UFL class)
+            h, visit_children_first = handlers[e._ufl_typecode_]
+
+            # Is this a handler that expects transformed children as
+            # input?
+            if visit_children_first:
+                # Yes, visit the first child without a result first,
+                # or call h when all children are done
+                for op in e.ufl_operands:
+                    if op not in cache:
+                        stack.append(op)
+                        break
+                else:
+                    cache[e] = h(e, *[cache[op] for op in e.ufl_operands])
+                    stack.pop()
+            else:
+                # No, this is a handler that handles its own children
+                # (arguments self and e, where self is already bound)
+                cache[e] = h(e)
+                stack.pop()
+        return cache[o]
 
     def undefined(self, o):
         "Trigger error."
@@ -214,6 +259,8 @@ class CopyTransformer(Transformer):
 
 
 class VariableStripper(ReuseTransformer):
+    share_visit_cache = True
+
     def __init__(self):
         ReuseTransformer.__init__(self)
 
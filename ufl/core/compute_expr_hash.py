@@ -2,7 +2,7 @@
 """Non-recursive traversal-based hash computation algorithm.
 
 Fast iteration over nodes in an ``Expr`` DAG to compute
-memorized hashes for all unique nodes.
+memorized hashes and digests for all unique nodes.
 """
 
 # Copyright (C) 2015 Martin Sandve Alnæs
@@ -24,9 +24,15 @@ memorized hashes for all unique nodes.
 #
 # Modified by Massimiliano Leoni, 2016
 
+import weakref
+
 # This limits the _depth_ of expression trees
 _recursion_limit_ = 6400  # should be enough for everyone
 
+# Expression -> digest, computed on demand and kept while the
+# expression is alive
+_digests = weakref.WeakKeyDictionary()
+
 
 def compute_expr_hash(expr):
     """Compute hashes of *expr* and all its nodes efficiently, without using Python recursion."""
@@ -59,3 +65,41 @@ def compute_expr_hash(expr):
             stacksize += 1
 
     return expr._hash
+
+
+def compute_expr_digest(expr):
+    """Compute digests of *expr* and all its nodes efficiently, without using Python recursion.
+
+    Unlike the hash, the digest is independent of the Python hash
+    seed and thus stable between processes and runs.
+    """
+    digest = _digests.get(expr)
+    if digest is not None:
+        return digest
+
+    stack = [None]*_recursion_limit_
+    stacksize = 0
+
+    ops = expr.ufl_operands
+    stack[stacksize] = [expr, ops, len(ops)]
+    stacksize += 1
+
+    while stacksize > 0:
+        entry = stack[stacksize - 1]
+        e = entry[0]
+        if e in _digests:
+            # cutoff: don't need to visit children when digest has previously been computed
+            stacksize -= 1
+        elif entry[2] == 0:
+            # all children consumed: trigger memoized digest computation
+            _digests[e] = e._ufl_compute_digest_()
+            stacksize -= 1
+        else:
+            # add children to stack to digest them first
+            entry[2] -= 1
+            o = entry[1][entry[2]]
+            oops = o.ufl_operands
+            stack[stacksize] = [o, oops, len(oops)]
+            stacksize += 1
+
+    return _digests[expr]
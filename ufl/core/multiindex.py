@@ -56,6 +56,11 @@ class FixedIndex(IndexBase):
     def __getnewargs__(self):
         return (self._value,)
 
+    def __reduce__(self):
+        # Unpickle to the cached object, without restoring the hash,
+        # which depends on the hash seed of the process
+        return (FixedIndex, (self._value,))
+
     def __new__(cls, value):
         self = FixedIndex._cache.get(value)
         if self is None:
@@ -20,10 +20,14 @@
 # Modified by Anders Logg, 2008
 # Modified by Massimiliano Leoni, 2016
 
+import hashlib
+
 from ufl.utils.py23 import as_native_str
 from ufl.utils.py23 import as_native_strings
+from ufl.utils.py23 import as_bytes
 from ufl.core.expr import Expr
 from ufl.core.ufl_type import ufl_type
+from ufl.core.compute_expr_hash import compute_expr_digest
 
 
 # --- Base class for operator objects ---
@@ -54,6 +58,13 @@ class Operator(Expr):
         "Compute a hash code for this expression. Used by sets and dicts."
         return hash((self._ufl_typecode_,) + tuple(hash(o) for o in self.ufl_operands))
 
+    def _ufl_compute_digest_(self):
+        "Compute a process independent digest from the type name and the operand digests."
+        h = hashlib.sha1(as_bytes(self._ufl_handler_name_ + "("))
+        for o in self.ufl_operands:
+            h.update(compute_expr_digest(o))
+        return h.digest()[:16]
+
     def __repr__(self):
         "Default repr string construction for operators."
         # This should work for most cases
@@ -22,7 +22,10 @@ for all types that are terminal nodes in an expression tree."""
 # Modified by Anders Logg, 2008
 # Modified by Massimiliano Leoni, 2016
 
+import hashlib
+
 from ufl.log import error, warning
+from ufl.utils.py23 import as_bytes
 from ufl.core.expr import Expr
 from ufl.core.ufl_type import ufl_type
 
@@ -96,6 +99,10 @@ class Terminal(Expr):
         "Default hash of terminals just hash the repr string."
         return hash(repr(self))
 
+    def _ufl_compute_digest_(self):
+        "Default digest of terminals just digest the repr string."
+        return hashlib.sha1(as_bytes(repr(self))).digest()[:16]
+
     def __eq__(self, other):
         "Default comparison of terminals just compare repr strings."
         return repr(self) == repr(other)
@@ -54,6 +54,46 @@ def attach_operators_from_hash_data(cls):
     return cls
 
 
+def attach_memoized_evaluate(cls):
+    """Wrap the ``evaluate`` implementation of *cls*, if it has one,
+    to store the value of each node for each component, bound index
+    values and derivatives in the ``memo`` dict of the index values,
+    if there is one.
+
+    Shared subexpressions are then evaluated once in point evaluation,
+    see ``Expr.__call__``, instead of once for each path to them.
+    """
+    evaluate = cls.__dict__.get("evaluate")
+    if evaluate is None:
+        return
+
+    def _evaluate(self, x, mapping, component, index_values, derivatives):
+        # Only some implementations take derivatives
+        if derivatives:
+            return evaluate(self, x, mapping, component, index_values, derivatives)
+        return evaluate(self, x, mapping, component, index_values)
+
+    def memoized_evaluate(self, x, mapping, component, index_values, derivatives=()):
+        memo = getattr(index_values, "memo", None)
+        # Multi-indices are evaluated without a component
+        if memo is None or component is None:
+            return _evaluate(self, x, mapping, component, index_values, derivatives)
+        fi = self.ufl_free_indices
+        if fi:
+            bound = tuple(sorted((i.count(), v) for i, v in index_values.items()
+                                 if i.count() in fi))
+        else:
+            bound = ()
+        key = (self, tuple(component), bound, tuple(derivatives))
+        value = memo.get(key)
+        if value is None:
+            value = _evaluate(self, x, mapping, component, index_values, derivatives)
+            memo[key] = value
+        return value
+    memoized_evaluate.__doc__ = evaluate.__doc__
+    cls.evaluate = memoized_evaluate
+
+
 def get_base_attr(cls, name):
     "Return first non-``None`` attribute of given name among base classes."
     for base in cls.mro():
@@ -372,6 +412,9 @@ def ufl_type(is_abstract=False,
                                                      inherit_shape_from_operand,
                                                      inherit_indices_from_operand)
 
+        # Memoize values of shared subexpressions in point evaluation
+        attach_memoized_evaluate(cls)
+
         # Update Expr
         update_global_expr_attributes(cls)
 
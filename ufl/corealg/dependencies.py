@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Summaries of the form arguments an expression depends on.
+
+The dependencies of an expression are the set of ``FormArgument``
+terminals, i.e. the arguments and coefficients, found in it. They are
+computed once for each operator node, from the dependencies of the
+operands, and cached while the node is alive, such that differentiation algorithms can skip
+subexpressions independent of the differentiation variable without
+visiting them.
+"""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+
+from ufl.core.terminal import FormArgument
+from ufl.geometry import GeometricQuantity
+from ufl.corealg.typemask import contains_type
+
+_no_dependencies = frozenset()
+
+# Operator -> frozenset of form arguments. Terminals are left out, as
+# the set of a form argument would keep it alive.
+_dependencies = weakref.WeakKeyDictionary()
+
+
+def _terminal_dependencies(e):
+    if isinstance(e, FormArgument):
+        return frozenset((e,))
+    return _no_dependencies
+
+
+def form_argument_dependencies(expr):
+    """Return the frozenset of the form arguments, i.e. arguments and
+    coefficients, found in *expr*.
+
+    The sets are computed without recursion and cached for the
+    operator nodes. Nodes share the set objects of their operands
+    where possible.
+    """
+    if expr._ufl_is_terminal_:
+        return _terminal_dependencies(expr)
+    deps = _dependencies.get(expr)
+    if deps is not None:
+        return deps
+
+    # Sets of the terminals found in this traversal
+    terminal_deps = {}
+
+    def operand_dependencies(o):
+        if o._ufl_is_terminal_:
+            d = terminal_deps.get(o)
+            if d is None:
+                d = _terminal_dependencies(o)
+                terminal_deps[o] = d
+            return d
+        return _dependencies.get(o)
+
+    stack = [expr]
+    while stack:
+        e = stack[-1]
+        if e in _dependencies:
+            stack.pop()
+        else:
+            ops = e.ufl_operands
+            missing = [o for o in ops
+                       if not o._ufl_is_terminal_ and o not in _dependencies]
+            if missing:
+                stack.extend(missing)
+            else:
+                # Union of the operand sets, reusing the largest set
+                # if it contains the others
+                deps = _no_dependencies
+                for o in ops:
+                    d = operand_dependencies(o)
+                    if d is deps or d <= deps:
+                        continue
+                    elif deps <= d:
+                        deps = d
+                    else:
+                        deps = deps | d
+                _dependencies[e] = deps
+                stack.pop()
+    return _dependencies[expr]
+
+
+def depends_on(expr, form_arguments):
+    """Return whether *expr* contains any of the *form_arguments*, a
+    set of arguments and coefficients."""
+    deps = form_argument_dependencies(expr)
+    if len(deps) > len(form_arguments):
+        return any(f in deps for f in form_arguments)
+    return any(f in form_arguments for f in deps)
+
+
+def is_spatially_independent(expr):
+    """Return whether *expr* is known to be constant in space, i.e.
+    contains no form arguments and no geometric quantities such as
+    the spatial coordinate."""
+    return not contains_type(expr, (FormArgument, GeometricQuantity))
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Compact array based representation of expression DAGs.
+
+An ``ExprGraph`` stores each unique node of one or more ``Expr`` DAGs
+as an entry in flat integer arrays instead of as a Python object,
+which is much more compact for large expressions and allows
+analyses to be written as vectorized NumPy operations.
+"""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+from ufl.log import error
+from ufl.core.expr import Expr
+from ufl.corealg.traversal import unique_post_traversal
+
+
+def _typecodes_of(ufl_type):
+    "Return array of the typecodes of *ufl_type* and all its subclasses."
+    return numpy.asarray([c._ufl_typecode_ for c in Expr._ufl_all_classes_
+                          if issubclass(c, ufl_type)], dtype=numpy.int32)
+
+
+class ExprGraph(object):
+    """Compact array representation of a collection of expression DAGs.
+
+    Each unique node is numbered in post traversal ordering, such that
+    the operands of a node are always numbered before the node itself.
+
+    *Arrays*
+        ``typecodes[i]`` is the typecode of node ``i``.
+
+        The operands of node ``i`` are the nodes
+        ``operand_indices[operand_offsets[i]:operand_offsets[i+1]]``,
+        in the same order as ``ufl_operands``.
+
+        ``terminal_numbers[i]`` is the position of node ``i`` in the
+        ``terminals`` list if node ``i`` is a terminal, or ``-1``
+        otherwise.
+
+        ``roots[k]`` is the node of the ``k``'th expression the graph
+        was built from.
+
+    Terminals are kept as ``Expr`` objects in the ``terminals`` list,
+    all other nodes are only represented by the arrays.
+    """
+
+    def __init__(self, typecodes, operand_offsets, operand_indices,
+                 terminal_numbers, terminals, roots):
+        self.typecodes = typecodes
+        self.operand_offsets = operand_offsets
+        self.operand_indices = operand_indices
+        self.terminal_numbers = terminal_numbers
+        self.terminals = terminals
+        self.roots = roots
+
+    def __len__(self):
+        "Return the number of unique nodes in the graph."
+        return len(self.typecodes)
+
+    @property
+    def nbytes(self):
+        "The number of bytes used by the arrays of the graph."
+        return (self.typecodes.nbytes + self.operand_offsets.nbytes +
+                self.operand_indices.nbytes + self.terminal_numbers.nbytes +
+                self.roots.nbytes)
+
+    def operands(self, i):
+        "Return array of operand nodes of node *i*."
+        return self.operand_indices[self.operand_offsets[i]:self.operand_offsets[i + 1]]
+
+    def num_operands(self):
+        "Return array of the number of operands of each node."
+        return numpy.diff(self.operand_offsets)
+
+    def use_counts(self):
+        "Return array of the number of times each node is used as an operand."
+        return numpy.bincount(self.operand_indices, minlength=len(self))
+
+    def type_counts(self):
+        "Return array of the number of nodes with each typecode."
+        return numpy.bincount(self.typecodes, minlength=Expr._ufl_num_typecodes_)
+
+    def type_mask(self, ufl_type):
+        "Return boolean array which is true for the nodes of class *ufl_type*."
+        return numpy.isin(self.typecodes, _typecodes_of(ufl_type))
+
+    def has_type(self, ufl_type):
+        "Return if a node of class *ufl_type* can be found in the graph."
+        return bool(self.type_mask(ufl_type).any())
+
+    def extract_terminals(self, ufl_type=Expr):
+        """Return list of the unique terminals of class *ufl_type*,
+        in graph node ordering."""
+        numbers = self.terminal_numbers[self.type_mask(ufl_type)]
+        return [self.terminals[k] for k in numbers[numbers >= 0]]
+
+    def expressions(self):
+        """Reconstruct the ``Expr`` DAGs the graph was built from.
+
+        Returns a list with one expression for each root.
+        """
+        classes = Expr._ufl_all_classes_
+        typecodes = self.typecodes.tolist()
+        offsets = self.operand_offsets.tolist()
+        indices = self.operand_indices.tolist()
+        terminal_numbers = self.terminal_numbers.tolist()
+        terminals = self.terminals
+
+        nodes = [None]*len(typecodes)
+        for i, tc in enumerate(typecodes):
+            k = terminal_numbers[i]
+            if k >= 0:
+                nodes[i] = terminals[k]
+            else:
+                ops = [nodes[j] for j in indices[offsets[i]:offsets[i + 1]]]
+                nodes[i] = classes[tc](*ops)
+        return [nodes[i] for i in self.roots.tolist()]
+
+
+def build_expr_graph(expressions):
+    """Build an ``ExprGraph`` from an ``Expr`` or a list of ``Expr`` objects.
+
+    Subexpressions shared between the expressions are only
+    represented once in the graph.
+    """
+    if isinstance(expressions, Expr):
+        expressions = [expressions]
+    if not all(isinstance(expression, Expr) for expression in expressions):
+        error("Expecting an Expr or a list of Expr objects.")
+
+    numbering = {}
+    typecodes = []
+    offsets = [0]
+    indices = []
+    terminal_numbers = []
+    terminals = []
+
+    # Share visited set between traversals to number each node once
+    visited = set()
+    for expression in expressions:
+        for v in unique_post_traversal(expression, visited):
+            if v in numbering:
+                # The root of an already handled expression
+                continue
+            numbering[v] = len(typecodes)
+            typecodes.append(v._ufl_typecode_)
+            if v._ufl_is_terminal_:
+                terminal_numbers.append(len(terminals))
+                terminals.append(v)
+            else:
+                terminal_numbers.append(-1)
+                indices.extend(numbering[o] for o in v.ufl_operands)
+            offsets.append(len(indices))
+
+    roots = [numbering[expression] for expression in expressions]
+
+    return ExprGraph(numpy.asarray(typecodes, dtype=numpy.int32),
+                     numpy.asarray(offsets, dtype=numpy.int32),
+                     numpy.asarray(indices, dtype=numpy.int32),
+                     numpy.asarray(terminal_numbers, dtype=numpy.int32),
+                     terminals,
+                     numpy.asarray(roots, dtype=numpy.int32))
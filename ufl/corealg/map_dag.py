@@ -20,42 +20,214 @@
 #
 # Modified by Massimiliano Leoni, 2016
 
+import weakref
+from collections import OrderedDict
+
 from ufl.core.expr import Expr
 from ufl.corealg.traversal import unique_post_traversal, cutoff_unique_post_traversal
 from ufl.corealg.multifunction import MultiFunction
+from ufl.corealg.typemask import expr_type_mask, types_mask
+
+
+# Marker for results identical to the input expression, stored
+# instead of the result to not keep the weakly referenced key alive
+_same = object()
+
+# Marker for missing cache entries
+_missing = object()
+
+
+class MapExprDagCache(object):
+    """Cache of the results of a function applied to expression
+    nodes by ``map_expr_dag``, shared between calls.
+
+    The cache may only be passed to calls with the same function, or
+    with equivalent functions, e.g. ``MultiFunction`` objects of the
+    same class and parameters. The function must be pure, i.e. its
+    result may depend on nothing but the node and the results for the
+    operands of the node.
+
+    The expressions are weakly referenced, so the cache does not keep
+    expressions alive that are not used elsewhere. Note that a result
+    containing its expression, e.g. ``grad(f)`` for ``f``, does keep
+    it alive as long as the entry is in the cache. If *max_size* is
+    given, the least recently used entries are removed when there are
+    more than *max_size* entries.
+
+    The numbers of cache hits and misses are counted in ``hits`` and
+    ``misses``.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # weakref(expr) -> result, from least to most recently used
+        self._results = OrderedDict()
+        # key -> MapExprDagCache, see subcache
+        self._subcaches = {}
+
+        # Remove entries when their expressions are garbage collected,
+        # without the callback keeping the cache itself alive
+        selfref = weakref.ref(self)
+
+        def _remove(wr):
+            cache = selfref()
+            if cache is not None:
+                cache._results.pop(wr, None)
+        self._remove = _remove
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, expr, default=None):
+        "Return the cached result for *expr*, or *default* if not found."
+        key = weakref.ref(expr)
+        r = self._results.get(key, _missing)
+        if r is _missing:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.max_size is not None:
+            # Move the entry to the end, keeping the removal callback
+            del self._results[key]
+            self._results[weakref.ref(expr, self._remove)] = r
+        return expr if r is _same else r
 
+    def set(self, expr, result):
+        "Store the *result* for *expr*, removing the least recently used entries if necessary."
+        key = weakref.ref(expr, self._remove)
+        self._results.pop(key, None)
+        self._results[key] = _same if result is expr else result
+        if self.max_size is not None:
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
 
-def map_expr_dag(function, expression, compress=True):
+    def subcache(self, key):
+        """Return the cache for another function identified by *key*,
+        created with the same *max_size* on first call.
+
+        This allows a function to cache the results of the functions
+        it applies in turn to subexpressions with ``map_expr_dag``.
+        """
+        cache = self._subcaches.get(key)
+        if cache is None:
+            cache = MapExprDagCache(self.max_size)
+            self._subcaches[key] = cache
+        return cache
+
+    def clear(self):
+        "Remove all entries, including those of subcaches, and reset the counters."
+        self._results.clear()
+        self._subcaches.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def _pruned_post_traversal(expr, cutoff_types, visited, vcache, cache=None,
+                           mask=None, shortcut=None):
+    """Yield each node of *expr* child before parent, like
+    ``cutoff_unique_post_traversal``, except the nodes with known
+    results, which are stored in *vcache* without visiting their
+    operands.
+
+    These are the nodes with results in *cache*, if *mask* is given,
+    the nodes not containing any of the types in the type mask *mask*,
+    which are their own results, and if *shortcut* is given, the nodes
+    for which it returns a result other than None.
+    """
+    stack = []
+
+    def enter(o):
+        if mask is not None and not expr_type_mask(o) & mask:
+            vcache[o] = o
+            visited.add(o)
+            return False
+        if shortcut is not None:
+            r = shortcut(o)
+            if r is not None:
+                vcache[o] = r
+                visited.add(o)
+                return False
+        if cache is not None:
+            r = cache.get(o, _missing)
+            if r is not _missing:
+                vcache[o] = r
+                visited.add(o)
+                return False
+        stack.append((o, () if cutoff_types[o._ufl_typecode_] else list(o.ufl_operands)))
+        return True
+
+    if expr in visited or not enter(expr):
+        return
+    while stack:
+        e, ops = stack[-1]
+        for i, o in enumerate(ops):
+            if o is not None and o not in visited:
+                ops[i] = None
+                if enter(o):
+                    break
+        else:
+            yield e
+            visited.add(e)
+            stack.pop()
+
+
+def map_expr_dag(function, expression, compress=True, cache=None):
     """Apply a function to each subexpression node in an expression DAG.
 
     If *compress* is ``True`` (default) the output object from
     the function is cached in a ``dict`` and reused such that the
     resulting expression DAG does not contain duplicate objects.
 
+    If a ``MapExprDagCache`` *cache* is given, results for nodes
+    found in it are reused, and new results are stored in it.
+
     Return the result of the final function call.
     """
-    result, = map_expr_dags(function, [expression], compress=compress)
+    result, = map_expr_dags(function, [expression], compress=compress,
+                            cache=cache)
     return result
 
 
-def map_expr_dags(function, expressions, compress=True):
+def map_expr_dags(function, expressions, compress=True, cache=None):
     """Apply a function to each subexpression node in an expression DAG.
 
     If *compress* is ``True`` (default) the output object from
     the function is cached in a ``dict`` and reused such that the
     resulting expression DAG does not contain duplicate objects.
 
+    If a ``MapExprDagCache`` *cache* is given, results for nodes
+    found in it are reused, and new results are stored in it.
+
+    If *function* is a ``MultiFunction`` with ``transformed_types``
+    set, subexpressions containing none of these types are reused
+    without calling any handlers, and with ``shortcut`` set, the
+    results it returns are used without visiting the operands.
+
     Return a list with the result of the final function call for each expression.
+
+    While interning is enabled (see ``Expr.ufl_enable_interning``),
+    newly constructed objects are unique by construction and the
+    compression is skipped.
     """
+    # Interned objects need no compression
+    if Expr.ufl_is_interning_enabled():
+        compress = False
 
     # Temporary data structures
     vcache = {}  # expr -> r = function(expr,...),  cache of intermediate results
     rcache = {}  # r -> r,  cache of result objects for memory reuse
 
     # Build mapping typecode:bool, for which types to skip the subtree of
+    mask = None
+    shortcut = None
     if isinstance(function, MultiFunction):
         cutoff_types = function._is_cutoff_type
         handlers = function._handlers  # Optimization
+        if function.transformed_types is not None:
+            mask = types_mask(function.transformed_types)
+        shortcut = function.shortcut
     else:
         # Regular function: no skipping supported
         cutoff_types = [False]*Expr._ufl_num_typecodes_
@@ -64,8 +236,13 @@ def map_expr_dags(function, expressions, compress=True):
     # Create visited set here to share between traversal calls
     visited = set()
 
-    # Pick faster traversal algorithm if we have no cutoffs
-    if any(cutoff_types):
+    # Pick faster traversal algorithm if we have no cutoffs, or
+    # skip the subtrees of nodes with known results
+    if cache is not None or mask is not None or shortcut is not None:
+        def traversal(expression):
+            return _pruned_post_traversal(expression, cutoff_types, visited,
+                                          vcache, cache, mask, shortcut)
+    elif any(cutoff_types):
         def traversal(expression):
             return cutoff_unique_post_traversal(expression, cutoff_types, visited)
     else:
@@ -99,5 +276,7 @@ def map_expr_dags(function, expressions, compress=True):
 
             # Store result in cache
             vcache[v] = r
+            if cache is not None:
+                cache.set(v, r)
 
     return [vcache[expression] for expression in expressions]
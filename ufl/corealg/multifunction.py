@@ -59,6 +59,16 @@ class MultiFunction(object):
 
     _handlers_cache = {}
 
+    # Set to a tuple of the types of the nodes that the handlers may
+    # change to make ``map_expr_dag`` reuse subexpressions containing
+    # none of these types, without calling any handlers
+    transformed_types = None
+
+    # Set to a function returning the result for an expression without
+    # visiting its operands, or None if they must be visited, to make
+    # ``map_expr_dag`` skip subexpressions with known results
+    shortcut = None
+
     def __init__(self):
         # Analyse class properties and cache handler data the
         # first time this is run for a particular class
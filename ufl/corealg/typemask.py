@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Summaries of the types found in expression subtrees.
+
+The type mask of an expression is an integer with bit ``tc`` set for
+each typecode ``tc`` of a node in the expression. It is computed once
+for each node, from the masks of the operands, and cached in the node,
+such that checking whether an expression contains a node of some type
+costs a single bitwise and.
+"""
+
+# Copyright (C) 2017 The FEniCS Project
+#
+# This file is part of UFL.
+#
+# UFL is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UFL is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with UFL. If not, see <http://www.gnu.org/licenses/>.
+
+from ufl.core.expr import Expr
+
+
+def expr_type_mask(expr):
+    """Return the type mask of *expr*, with bit ``tc`` set for each
+    typecode ``tc`` of a node in *expr*, including *expr* itself.
+
+    The masks are computed without recursion and cached in the nodes.
+    """
+    mask = expr._type_mask
+    if mask is not None:
+        return mask
+
+    stack = [expr]
+    while stack:
+        e = stack[-1]
+        if e._type_mask is not None:
+            stack.pop()
+        elif e._ufl_is_terminal_:
+            e._type_mask = 1 << e._ufl_typecode_
+            stack.pop()
+        else:
+            ops = e.ufl_operands
+            missing = [o for o in ops if o._type_mask is None]
+            if missing:
+                stack.extend(missing)
+            else:
+                mask = 1 << e._ufl_typecode_
+                for o in ops:
+                    mask |= o._type_mask
+                e._type_mask = mask
+                stack.pop()
+    return expr._type_mask
+
+
+# (types, exact, number of UFL classes) -> mask
+_types_masks = {}
+
+
+def types_mask(types, exact=False):
+    """Return the mask with the bits set for the typecodes of the UFL
+    classes that are subclasses of one of *types*, a class or a tuple
+    of classes, or only of *types* themselves if *exact* is true.
+
+    Classes defined outside UFL are represented by the UFL class they
+    derive from, so the mask may cover more nodes than those that are
+    instances of such a class.
+    """
+    if not isinstance(types, tuple):
+        types = (types,)
+    # Include the number of classes, in case more are defined later
+    key = (types, exact, len(Expr._ufl_all_classes_))
+    mask = _types_masks.get(key)
+    if mask is None:
+        types = tuple(t._ufl_class_ for t in types)
+        mask = 0
+        for c in Expr._ufl_all_classes_:
+            if (c in types) if exact else issubclass(c, types):
+                mask |= 1 << c._ufl_typecode_
+        _types_masks[key] = mask
+    return mask
+
+
+def contains_type(expr, types, exact=False):
+    """Return whether *expr* may contain a node of one of *types*, see
+    ``types_mask``. The result is exact for UFL classes."""
+    return bool(expr_type_mask(expr) & types_mask(types, exact))
+
+
+def unique_pre_traversal_of_types(expr, types, visited=None):
+    """Yield each node of *expr* that may contain a node of one of
+    *types*, parent before child, without visiting the subtrees that
+    contain none. Never visit a node twice."""
+    mask = types_mask(types)
+    if visited is None:
+        visited = set()
+    if expr in visited or not expr_type_mask(expr) & mask:
+        return
+    visited.add(expr)
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        yield e
+        for o in e.ufl_operands:
+            if o not in visited and expr_type_mask(o) & mask:
+                visited.add(o)
+                stack.append(o)
@@ -24,6 +24,7 @@ Sum and its superclass Expr."""
 
 from itertools import chain
 import numbers
+import weakref
 
 from ufl.log import error
 from ufl.utils.stacks import StackDict
@@ -316,18 +317,48 @@ def _restrict(self, side):
     error("Invalid side '%s' in restriction operator." % (side,))
 
 
+class _EvaluationIndexValues(StackDict):
+    """Index values of a point evaluation, with the values of the
+    nodes evaluated so far, see ``attach_memoized_evaluate``."""
+    def __init__(self):
+        StackDict.__init__(self)
+        self.memo = {}
+
+
+# Expression -> expression with derivatives expanded, or True if the
+# expression has no derivatives, see _expanded_derivatives
+_derivative_expansions = weakref.WeakKeyDictionary()
+
+
+def _expanded_derivatives(self):
+    "Return the expression with derivatives expanded, cached while the expression is alive."
+    f = _derivative_expansions.get(self)
+    if f is None:
+        from ufl.algorithms import expand_derivatives
+        f = expand_derivatives(self)
+        # Mark expressions without derivatives with True, to avoid
+        # keeping the expression alive through its own entry
+        if f is self:
+            _derivative_expansions[self] = True
+        else:
+            _derivative_expansions[self] = f
+            _derivative_expansions[f] = True
+    elif f is True:
+        f = self
+    return f
+
+
 def _eval(self, coord, mapping=None, component=()):
     # Evaluate expression at this particular coordinate, with provided
     # values for other terminals in mapping
 
     # Evaluate derivatives first
-    from ufl.algorithms import expand_derivatives
-    f = expand_derivatives(self)
+    f = _expanded_derivatives(self)
 
-    # Evaluate recursively
+    # Evaluate recursively, computing shared subexpressions once
     if mapping is None:
         mapping = {}
-    index_values = StackDict()
+    index_values = _EvaluationIndexValues()
     return f.evaluate(coord, mapping, component, index_values)
 
 
@@ -82,6 +82,8 @@ class Form(object):
     __slots__ = (
         # --- List of Integral objects (a Form is a sum of these Integrals, everything else is derived)
         "_integrals",
+        # --- The integrals in the order given, until they are sorted
+        "_unsorted_integrals",
         # --- Internal variables for caching various data
         "_integration_domains",
         "_domain_numbering",
@@ -100,12 +102,20 @@ class Form(object):
     def __init__(self, integrals):
         # Basic input checking (further compatibilty analysis happens
         # later)
+        integrals = list(integrals)
         if not all(isinstance(itg, Integral) for itg in integrals):
             error("Expecting list of integrals.")
+        if any(itg.ufl_domain() is None for itg in integrals):
+            error("Each integral in a form must have a uniquely defined integration domain.")
+        self._init(integrals)
 
-        # Store integrals sorted canonically to increase signature
-        # stability
-        self._integrals = _sorted_integrals(integrals)
+    def _init(self, integrals):
+        "Initialize form with a list of already checked integrals."
+        # Integrals are sorted canonically to increase signature
+        # stability when first requested, such that building a form
+        # by adding many forms does not sort the integrals each time
+        self._integrals = None
+        self._unsorted_integrals = integrals
 
         # Internal variables for caching domain data
         self._integration_domains = None
@@ -131,6 +141,15 @@ class Form(object):
 
     def integrals(self):
         "Return a sequence of all integrals in form."
+        if self._integrals is None:
+            self._integrals = _sorted_integrals(self._unsorted_integrals)
+            self._unsorted_integrals = None
+        return self._integrals
+
+    def _integrals_in_any_order(self):
+        "Return the integrals of the form without sorting them."
+        if self._integrals is None:
+            return self._unsorted_integrals
         return self._integrals
 
     def integrals_by_type(self, integral_type):
@@ -246,6 +265,14 @@ class Form(object):
 
     # --- Operator implementations ---
 
+    def __getstate__(self):
+        """Return the state for pickling, leaving out the cached hash,
+        which depends on the hash seed of the process."""
+        slots = dict((name, getattr(self, name)) for name in Form.__slots__
+                     if hasattr(self, name))
+        slots["_hash"] = None
+        return (None, slots)
+
     def __hash__(self):
         "Hash code for use in dicts (includes incidental numbering of indices etc.)"
         if self._hash is None:
@@ -269,11 +296,11 @@ class Form(object):
         "Evaluate ``bool(lhs_form == rhs_form)``."
         if type(other) != Form:
             return False
-        if len(self._integrals) != len(other._integrals):
+        if len(self._integrals_in_any_order()) != len(other._integrals_in_any_order()):
             return False
         if hash(self) != hash(other):
             return False
-        return all(a == b for a, b in zip(self._integrals, other._integrals))
+        return all(a == b for a, b in zip(self.integrals(), other.integrals()))
 
     def __radd__(self, other):
         # Ordering of form additions make no difference
@@ -281,8 +308,11 @@ class Form(object):
 
     def __add__(self, other):
         if isinstance(other, Form):
-            # Add integrals from both forms
-            return Form(list(chain(self.integrals(), other.integrals())))
+            # Add integrals from both forms, which are already checked
+            form = Form.__new__(Form)
+            form._init(list(chain(self._integrals_in_any_order(),
+                                  other._integrals_in_any_order())))
+            return form
 
         elif isinstance(other, (int, float)) and other == 0:
             # Allow adding 0 or 0.0 as a no-op, needed for sum([a,b])
@@ -412,7 +442,7 @@ class Form(object):
         from ufl.domain import join_domains, sort_domains
 
         # Collect unique integration domains
-        integration_domains = join_domains([itg.ufl_domain() for itg in self._integrals])
+        integration_domains = join_domains([itg.ufl_domain() for itg in self.integrals()])
 
         # Make canonically ordered list of the domains
         self._integration_domains = sort_domains(integration_domains)
@@ -35,7 +35,7 @@ from ufl.finiteelement import MixedElement
 from ufl.argument import Argument
 from ufl.coefficient import Coefficient
 from ufl.differentiation import CoefficientDerivative
-from ufl.constantvalue import is_true_ufl_scalar, as_ufl
+from ufl.constantvalue import Zero, is_true_ufl_scalar, as_ufl
 from ufl.indexed import Indexed
 from ufl.core.multiindex import FixedIndex, MultiIndex
 from ufl.tensors import as_tensor, ListTensor
@@ -46,8 +46,12 @@ from ufl.functionspace import FunctionSpace
 from ufl.algorithms import compute_form_adjoint, compute_form_action
 from ufl.algorithms import compute_energy_norm
 from ufl.algorithms import compute_form_lhs, compute_form_rhs, compute_form_functional
+from ufl.algorithms import compute_form_system
 from ufl.algorithms import expand_derivatives, extract_arguments
 from ufl.algorithms import FormSplitter
+from ufl.algorithms.formsplitter import compute_nonzero_blocks
+from ufl.algorithms.apply_algebra_lowering import apply_algebra_lowering
+from ufl.algorithms.apply_derivatives import apply_derivatives, compute_reverse_derivatives
 
 # Part of the external interface
 from ufl.algorithms import replace  # noqa
@@ -67,6 +71,23 @@ def block_split(form, ix, iy=0):
     return fs.split(form, ix, iy)
 
 
+def extract_blocks(form):
+    """UFL form operator:
+    Given a linear or bilinear form on a mixed space, return a dict
+    mapping the indices (ix,) or (ix, iy) of each block with nonzero
+    terms to the block, as given by block_split. Blocks found to be
+    zero from the structure of the form are left out.
+
+    Example:
+
+       a = inner(grad(u), grad(v))*dx + div(u)*q*dx + div(v)*p*dx
+       extract_blocks(a) -> {(0, 0): ..., (0, 1): ..., (1, 0): ...}
+    """
+    form = expand_derivatives(as_form(form))
+    fs = FormSplitter()
+    return dict((b, fs.split(form, *b)) for b in compute_nonzero_blocks(form))
+
+
 def lhs(form):
     """UFL form operator:
     Given a combined bilinear and linear form,
@@ -100,7 +121,9 @@ def rhs(form):
 def system(form):
     """UFL form operator: Split a form into the left hand side and right hand
     side, see ``lhs`` and ``rhs``."""
-    return lhs(form), rhs(form)
+    form = as_form(form)
+    form = expand_derivatives(form)
+    return compute_form_system(form)
 
 
 def functional(form):  # TODO: Does this make sense for anything other than testing?
@@ -307,6 +330,60 @@ def derivative(form, coefficient, argument=None, coefficient_derivatives=None):
     error("Invalid argument type %s." % str(type(form)))
 
 
+def derivatives(form, coefficients, arguments=None):
+    """UFL form operator:
+    Compute the Gateaux derivatives of *form* w.r.t. each of the
+    ``Coefficient`` s in *coefficients*, in the direction of the
+    corresponding argument in *arguments*.
+
+    Returns a list with one form for each coefficient, with the
+    derivatives already expanded. This is equivalent to applying
+    ``derivative`` to *form* for each coefficient in turn, but the
+    derivatives are computed in reverse mode in a single sweep over
+    each integrand, which is much faster for many coefficients, e.g.
+    the gradient of an objective functional w.r.t. many controls.
+
+    If the arguments are omitted, a new ``Argument`` is created in the
+    space of each coefficient as for ``derivative``. Passing the
+    components of an argument in a mixed space instead, e.g.
+    ``split(TestFunction(W))``, the sum of the returned forms is the
+    derivative with a single mixed ``Argument``.
+    """
+    coefficients = tuple(coefficients)
+    if arguments is None:
+        arguments = (None,)*len(coefficients)
+    else:
+        arguments = tuple(arguments)
+        if len(arguments) != len(coefficients):
+            error("Expecting one argument for each coefficient.")
+
+    ws = []
+    vs = []
+    for c, a in zip(coefficients, arguments):
+        if not isinstance(c, Coefficient):
+            error("Expecting a Coefficient, not %s." % ufl_err_str(c))
+        w, v = _handle_derivative_arguments(form, c, a)
+        ws.extend(w.ufl_operands)
+        vs.extend(v.ufl_operands)
+
+    form = apply_derivatives(apply_algebra_lowering(form))
+
+    if isinstance(form, Form):
+        integrals = [[] for w in ws]
+        for itg in form.integrals():
+            ds = compute_reverse_derivatives(itg.integrand(), ws, vs)
+            for itgs, d in zip(integrals, ds):
+                if not isinstance(d, Zero):
+                    itgs.append(itg.reconstruct(d))
+        return [Form(itgs) for itgs in integrals]
+
+    elif isinstance(form, Expr):
+        # What we got was in fact an integrand
+        return compute_reverse_derivatives(form, ws, vs)
+
+    error("Invalid argument type %s." % str(type(form)))
+
+
 def sensitivity_rhs(a, u, L, v):
     """UFL form operator:
     Compute the right hand side for a sensitivity calculation system.
@@ -25,6 +25,7 @@ objects."""
 # Modified by Massimiliano Leoni, 2016.
 
 import operator
+from itertools import chain
 from six.moves import xrange as range
 
 from ufl.log import error, warning
@@ -44,6 +45,8 @@ from ufl.mathfunctions import Sqrt, Exp, Ln, Erf,\
 from ufl.restriction import CellAvg, FacetAvg
 from ufl.core.multiindex import indices
 from ufl.indexed import Indexed
+from ufl.algebra import Product
+from ufl.sorting import sorted_expr
 from ufl.geometry import SpatialCoordinate, FacetNormal
 from ufl.checks import is_cellwise_constant
 from ufl.domain import extract_domains
@@ -109,6 +112,90 @@ def elem_pow(A, B):
     return elem_op(operator.pow, A, B)
 
 
+# --- Sums and products of many operands ---
+
+def _balanced_tree(binop, operands):
+    "Combine *operands* pairwise with *binop* until one expression is left."
+    while len(operands) > 1:
+        combined = [binop(operands[i], operands[i + 1])
+                    for i in range(0, len(operands) - 1, 2)]
+        if len(operands) % 2:
+            combined.append(operands[-1])
+        operands = combined
+    return operands[0]
+
+
+def balanced_sum(operands):
+    """UFL operator: Take the sum of all expressions or forms in *operands*.
+
+    Unlike ``sum(operands)``, which builds a chain of binary ``Sum``
+    nodes as deep as the number of operands, the sum is represented
+    as a balanced tree of logarithmic depth. Zero operands are
+    dropped and scalar constants folded into a single constant. The
+    operands are sorted canonically once, such that the result does
+    not depend on their ordering.
+
+    The sum of forms is built in time linear in the total number of
+    integrals, instead of quadratic as for ``sum(operands)``."""
+    operands = list(operands)
+    if operands and all(isinstance(o, Form) for o in operands):
+        return Form(list(chain.from_iterable(o.integrals() for o in operands)))
+    operands = [as_ufl(o) for o in operands]
+    if not operands:
+        return Zero()
+    sh = operands[0].ufl_shape
+    fi = operands[0].ufl_free_indices
+    fid = operands[0].ufl_index_dimensions
+    for o in operands:
+        if o.ufl_shape != sh:
+            error("Can't add expressions with different shapes.")
+        if o.ufl_free_indices != fi:
+            error("Can't add expressions with different free indices.")
+        if o.ufl_index_dimensions != fid:
+            error("Can't add expressions with different index dimensions.")
+
+    terms = [o for o in operands if not isinstance(o, (Zero, ScalarValue))]
+    constants = [o._value for o in operands if isinstance(o, ScalarValue)]
+    if not terms:
+        return as_ufl(sum(constants)) if constants else operands[0]
+
+    s = _balanced_tree(operator.add, sorted_expr(terms))
+    if constants:
+        s = sum(constants) + s
+    return s
+
+
+def balanced_product(operands):
+    """UFL operator: Take the product of all scalar expressions in *operands*.
+
+    Unlike a chain of ``*``, the product is represented as a balanced
+    tree of binary ``Product`` nodes of logarithmic depth, with scalar
+    constants folded into a single constant and the operands sorted
+    canonically once. The operands must not share free indices."""
+    operands = [as_ufl(o) for o in operands]
+    if not operands:
+        return as_ufl(1)
+    for o in operands:
+        if o.ufl_shape:
+            error("Can only take the product of scalars.")
+    if any(isinstance(o, Zero) for o in operands):
+        # Let Product compute the free indices of the zero
+        return _balanced_tree(Product, operands)
+
+    factors = [o for o in operands if not isinstance(o, ScalarValue)]
+    constant = 1
+    for o in operands:
+        if isinstance(o, ScalarValue):
+            constant *= o._value
+    if not factors:
+        return as_ufl(constant)
+
+    p = _balanced_tree(Product, sorted_expr(factors))
+    if constant != 1:
+        p = Product(as_ufl(constant), p)
+    return p
+
+
 # --- Tensor operators ---
 
 def transpose(A):
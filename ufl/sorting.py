@@ -33,6 +33,92 @@ from ufl.core.multiindex import FixedIndex, MultiIndex
 from ufl.variable import Label
 
 
+# --- Canonical sort keys
+
+# The sort key of a terminal is (typecode, value), with a type
+# specific value that does not depend on the count of Index or Label
+# objects, as those are renumbered to get a canonical form.
+
+def _multi_index_key(a):
+    # Fixed indices sorted by value before free indices, which all
+    # compare equal. Careful not to depend on Index.count() here!
+    # Unlike the tree comparison before the sort keys, which did not
+    # decide on equal prefixes, a shorter multi-index with the same
+    # prefix sorts first, as required for a total order.
+    return tuple((0, i._value) if isinstance(i, FixedIndex) else (1,)
+                 for i in a._indices)
+
+
+def _coefficient_key(a):
+    # It's ok to use relative counts for Coefficients, since their
+    # ordering is a property of the form
+    return a._count
+
+
+def _argument_key(a):
+    # It's ok to use relative number and part for Arguments, since
+    # their ordering is a property of the form
+    return (a._number, -1 if a._part is None else a._part)
+
+
+def _label_key(a):
+    # Don't use counts! Causes circular problems when renumbering to
+    # get a canonical form.
+    return None
+
+
+def _terminal_key_by_repr(a):
+    # The cost of repr on a terminal is fairly small, and bounded
+    return repr(a)
+
+
+# Hack up a MultiFunction-like type dispatch for terminal keys
+_terminal_keys = [_terminal_key_by_repr]*Expr._ufl_num_typecodes_
+_terminal_keys[MultiIndex._ufl_typecode_] = _multi_index_key
+_terminal_keys[Argument._ufl_typecode_] = _argument_key
+_terminal_keys[Coefficient._ufl_typecode_] = _coefficient_key
+_terminal_keys[Label._ufl_typecode_] = _label_key
+
+
+def expr_sort_key(expr):
+    """Return the canonical sort key of *expr*.
+
+    The key of an operator is the tuple ``(typecode, num_operands,
+    key(op[-1]), ..., key(op[0]))``, giving the same ordering as a
+    lexicographic comparison of the expression trees. The keys are
+    computed once for each node, without using Python recursion, and
+    cached in the ``_sort_key`` slot. Comparing keys stops at the
+    first difference and skips shared subexpressions, as their keys
+    are identical objects.
+    """
+    key = expr._sort_key
+    if key is not None:
+        return key
+
+    stack = [expr]
+    while stack:
+        e = stack[-1]
+        if e._sort_key is not None:
+            stack.pop()
+        elif e._ufl_is_terminal_:
+            tc = e._ufl_typecode_
+            e._sort_key = (tc, _terminal_keys[tc](e))
+            stack.pop()
+        else:
+            ops = e.ufl_operands
+            missing = [o for o in ops if o._sort_key is None]
+            if missing:
+                stack.extend(missing)
+            else:
+                e._sort_key = (e._ufl_typecode_, len(ops)) + \
+                    tuple(o._sort_key for o in reversed(ops))
+                stack.pop()
+    return expr._sort_key
+
+
+# --- Comparison without sort keys, used when comparing keys would
+# --- exceed the recursion limit
+
 def _cmp_multi_index(a, b):
     # Careful not to depend on Index.count() here!
     # This is placed first because it is most frequent.
@@ -59,10 +145,11 @@ def _cmp_multi_index(a, b):
         else:
             # Both are Index, no decision, do not depend on count!
             pass
-    # Failed to make a decision, return 0 by default
+    # Sort shorter before longer with the same prefix, like the keys.
+    # Otherwise failed to make a decision, return 0 by default
     # (this does not mean equality, it could be e.g.
     # [i,0] vs [j,0] because the counts of i,j cannot be used)
-    return 0
+    return (len(a._indices) > len(b._indices)) - (len(a._indices) < len(b._indices))
 
 
 def _cmp_label(a, b):
@@ -112,8 +199,8 @@ _terminal_cmps[Coefficient._ufl_typecode_] = _cmp_coefficient
 _terminal_cmps[Label._ufl_typecode_] = _cmp_label
 
 
-def cmp_expr(a, b):
-    "Replacement for cmp(a, b), removed in Python 3, for Expr objects."
+def _cmp_expr_iterative(a, b):
+    "Compare *a* and *b* like their sort keys, without computing keys."
 
     # Modelled after pre_traversal to avoid recursion:
     left = [(a, b)]
@@ -167,13 +254,29 @@ def cmp_expr(a, b):
     return 0
 
 
+def cmp_expr(a, b):
+    "Replacement for cmp(a, b), removed in Python 3, for Expr objects."
+    try:
+        x = expr_sort_key(a)
+        y = expr_sort_key(b)
+        return -1 if x < y else (+1 if y < x else 0)
+    except RuntimeError:
+        # Comparing keys of long chains of structurally equal nodes
+        # recurses too deep (RecursionError is a RuntimeError)
+        return _cmp_expr_iterative(a, b)
+
+
 def sorted_expr(sequence):
     "Return a canonically sorted list of Expr objects in sequence."
-    return sorted(sequence, key=cmp_to_key(cmp_expr))
+    sequence = list(sequence)
+    try:
+        return sorted(sequence, key=expr_sort_key)
+    except RuntimeError:
+        return sorted(sequence, key=cmp_to_key(_cmp_expr_iterative))
 
 
 def sorted_expr_sum(seq):
-    seq2 = sorted(seq, key=cmp_to_key(cmp_expr))
+    seq2 = sorted_expr(seq)
     s = seq2[0]
     for e in seq2[1:]:
         s = s + e